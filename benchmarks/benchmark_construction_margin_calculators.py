@@ -0,0 +1,249 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+import numpy as np
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.construction_margin_calculator_mockable_abstraction import ConstructionMarginCalculatorMockableAbstraction
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator,
+    CashFlowStepCalculator)
+from cash_flow_calculator.inflation_index import DAILY_INFLATION, shared_inflation_index
+from cash_flow_calculator.kernel_compiler import compile_kernel
+
+# This script measures the throughput of each implementation of the construction
+# margin calculation, for synthetic timelines of daily steps, in selling and
+# owning mode, and with the financial close inside and outside the timeline.
+# The results can be saved as a baseline, and later runs compared against it to
+# find regressions, for example:
+#   python -m benchmarks.benchmark_construction_margin_calculators --save-baseline baseline.json
+#   python -m benchmarks.benchmark_construction_margin_calculators --compare baseline.json
+# By default the timelines have up to 1e5 steps. --large adds timelines of 1e6
+# and 1e7 steps, which take several minutes and need several GB of memory for
+# the variants that use CashFlowStep objects:
+#   python -m benchmarks.benchmark_construction_margin_calculators --large --variants construction_margin_calculator_table
+# The peak memory of each variant includes creating its steps (or table) as
+# well as calculating them, so it compares the step representations too.
+
+START_OF_TIMELINE = datetime(2020, 1, 1)
+STEP_LENGTH = timedelta(days=1)
+FRACTION_OF_SPEND = 0.3
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+LARGE_SIZES = (1_000_000, 10_000_000)
+DEFAULT_TOLERANCE = 0.1
+
+
+# A combination of inputs to benchmark each variant with
+class BenchmarkCase:
+    def __init__(self, number_of_steps: int, in_selling_mode: bool, financial_close_in_timeline: bool):
+        self.number_of_steps = number_of_steps
+        self.in_selling_mode = in_selling_mode
+        self.financial_close_in_timeline = financial_close_in_timeline
+
+    @property
+    def date_of_financial_close(self) -> datetime:
+        if self.financial_close_in_timeline:
+            return START_OF_TIMELINE + STEP_LENGTH * (self.number_of_steps // 2)
+        return START_OF_TIMELINE - STEP_LENGTH
+
+    def key(self) -> str:
+        mode = 'selling' if self.in_selling_mode else 'owning'
+        financial_close = 'inside' if self.financial_close_in_timeline else 'outside'
+        return f'{self.number_of_steps}-{mode}-financial-close-{financial_close}'
+
+
+def generate_steps(number_of_steps: int) -> List[CashFlowStep]:
+    return [
+        CashFlowStep(START_OF_TIMELINE + STEP_LENGTH * index, None, None, None, None, None, None, None)
+        for index in range(number_of_steps)
+    ]
+
+
+def generate_table(number_of_steps: int) -> CashFlowStepTable:
+    # builds the columns directly, so that very long timelines don't need to be
+    # created as CashFlowStep objects first
+    table = CashFlowStepTable.empty(number_of_steps)
+    table.start_of_step[:] = \
+        np.datetime64(START_OF_TIMELINE, 'us') + \
+        np.arange(number_of_steps) * np.timedelta64(STEP_LENGTH)
+    return table
+
+
+def calculator_arguments(case: BenchmarkCase) -> tuple:
+    return (10, 11, 12, 13, case.date_of_financial_close, case.in_selling_mode, 0.1, 0.05)
+
+
+def run_construction_margin_calculator(case: BenchmarkCase) -> Callable[[], None]:
+    steps = generate_steps(case.number_of_steps)
+    calculator = ConstructionMarginCalculator(*calculator_arguments(case), DAILY_INFLATION)
+    return lambda: calculator.calculate_steps(steps, FRACTION_OF_SPEND)
+
+
+def run_construction_margin_calculator_table(case: BenchmarkCase) -> Callable[[], None]:
+    table = generate_table(case.number_of_steps)
+    calculator = ConstructionMarginCalculator(*calculator_arguments(case), DAILY_INFLATION)
+    return lambda: calculator.calculate_table(table, FRACTION_OF_SPEND)
+
+
+def run_compiled_kernel(case: BenchmarkCase) -> Callable[[], None]:
+    steps = generate_steps(case.number_of_steps)
+    kernel = compile_kernel(ConstructionMarginCalculator(*calculator_arguments(case), DAILY_INFLATION))
+    return lambda: kernel(steps, FRACTION_OF_SPEND)
+
+
+def run_without_loop(case: BenchmarkCase) -> Callable[[], None]:
+    steps_calculator = CashFlowStepsCalculator(generate_steps(case.number_of_steps))
+    calculator = ConstructionMarginCalculatorWithoutLoop(*calculator_arguments(case), DAILY_INFLATION)
+    return lambda: steps_calculator.calculate_step(calculator, FRACTION_OF_SPEND)
+
+
+def run_mockable_abstraction(case: BenchmarkCase) -> Callable[[], None]:
+    steps_calculator = CashFlowStepsCalculator(generate_steps(case.number_of_steps))
+    inflation = shared_inflation_index(0.05, DAILY_INFLATION, case.date_of_financial_close)
+    calculator = ConstructionMarginCalculatorMockableAbstraction(*calculator_arguments(case)[:-1], inflation)
+    return lambda: steps_calculator.calculate_step(calculator, FRACTION_OF_SPEND)
+
+
+def run_blackboard(case: BenchmarkCase) -> Callable[[], None]:
+    steps = generate_steps(case.number_of_steps)
+    arguments = calculator_arguments(case)
+    step_calculator = CashFlowStepCalculator([
+        ConstructionMarginCalculatorBlackboardPattern(arguments[1], arguments[3], arguments[4], arguments[5], arguments[6]),
+        TurbineCostCalculator(),
+        BalanceOfPlantCalculator()])
+
+    def run():
+        for step in steps:
+            step_calculator.calculate_step(step, FRACTION_OF_SPEND)
+    return run
+
+
+# Each variant creates its inputs (which isn't timed) and returns a function
+# that does the calculation (which is timed)
+VARIANTS: Dict[str, Callable[[BenchmarkCase], Callable[[], None]]] = {
+    'construction_margin_calculator': run_construction_margin_calculator,
+    'construction_margin_calculator_table': run_construction_margin_calculator_table,
+    'compiled_kernel': run_compiled_kernel,
+    'without_loop': run_without_loop,
+    'mockable_abstraction': run_mockable_abstraction,
+    'blackboard': run_blackboard,
+}
+
+
+def benchmark(variant: str, case: BenchmarkCase, repeat: int = 3) -> dict:
+    run = VARIANTS[variant](case)
+    run()  # warm up, for example the inflation curves
+
+    seconds = min(_time(run) for _ in range(repeat))
+    del run
+
+    tracemalloc.start()
+    VARIANTS[variant](case)()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'variant': variant,
+        'case': case.key(),
+        'steps': case.number_of_steps,
+        'seconds': seconds,
+        'steps_per_second': case.number_of_steps / seconds,
+        'nanoseconds_per_step': seconds / case.number_of_steps * 1e9,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def run_benchmarks(variants: List[str], sizes: List[int], repeat: int = 3) -> List[dict]:
+    return [
+        benchmark(variant, BenchmarkCase(size, in_selling_mode, financial_close_in_timeline), repeat)
+        for variant in variants
+        for size in sizes
+        for in_selling_mode in (True, False)
+        for financial_close_in_timeline in (True, False)
+    ]
+
+
+# Returns a description of each result that is slower than its baseline by
+# more than the tolerance (as a fraction of the baseline steps per second)
+def find_regressions(results: List[dict], baseline: List[dict], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    baseline_results = {(result['variant'], result['case']): result for result in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline_results.get((result['variant'], result['case']))
+        if expected is None:
+            continue
+        change = result['steps_per_second'] / expected['steps_per_second'] - 1
+        if change < -tolerance:
+            regressions.append(
+                f'{result["variant"]} {result["case"]}: '
+                f'{result["steps_per_second"]:,.0f} steps/s, '
+                f'{-change:.0%} slower than {expected["steps_per_second"]:,.0f}')
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        'python': sys.version,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def _time(run: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the construction margin calculators')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument(
+        '--large',
+        action='store_true',
+        help=f'also benchmark timelines of {", ".join(f"{size:,}" for size in LARGE_SIZES)} steps')
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    options = parser.parse_args(arguments)
+
+    sizes = list(options.sizes) + (list(LARGE_SIZES) if options.large else [])
+    results = run_benchmarks(options.variants, sizes, options.repeat)
+
+    for result in results:
+        print(
+            f'{result["variant"]:40} {result["case"]:40} '
+            f'{result["steps_per_second"]:>15,.0f} steps/s '
+            f'{result["nanoseconds_per_step"]:>10,.0f} ns/step '
+            f'{result["peak_memory_bytes"] / 1e6:>10,.1f} MB peak')
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent=2)
+
+    if options.compare:
+        with open(options.compare) as file:
+            regressions = find_regressions(results, json.load(file)['results'], options.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import csv
+from datetime import datetime
+from typing import Iterable, Iterator, TextIO
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CASH_FLOW_STEP_FIELDS, DATE_FIELD, VALUE_FIELDS
+
+# These functions read and write CashFlowStep as CSV, with a header row of
+# CashFlowStep property names, dates in ISO format and empty cells for None.
+# Steps are read one row at a time, so that long timelines don't need to be
+# held in memory.
+def read_cash_flow_steps(file: TextIO) -> Iterator[CashFlowStep]:
+    for row in csv.DictReader(file):
+        yield CashFlowStep(
+            _parse_date(row[DATE_FIELD]),
+            *(_parse_value(row[name]) for name in VALUE_FIELDS))
+
+
+def write_cash_flow_steps(file: TextIO, steps: Iterable[CashFlowStep]):
+    writer = csv.writer(file)
+    writer.writerow(CASH_FLOW_STEP_FIELDS)
+    for step in steps:
+        writer.writerow(
+            [_format_date(step.start_of_step)] +
+            [_format_value(getattr(step, name)) for name in VALUE_FIELDS])
+
+
+def _parse_date(text: str) -> datetime:
+    return datetime.fromisoformat(text) if text else None
+
+
+def _parse_value(text: str) -> float:
+    return float(text) if text else None
+
+
+def _format_date(value: datetime) -> str:
+    return '' if value is None else value.isoformat()
+
+
+def _format_value(value: float) -> str:
+    return '' if value is None else repr(float(value))
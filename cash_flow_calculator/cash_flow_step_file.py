@@ -0,0 +1,61 @@
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, CASH_FLOW_STEP_FIELDS, DATE_FIELD
+
+# The file starts with a 64 byte header, followed by one column per CashFlowStep
+# property, in declaration order. start_of_step is stored as little endian
+# int64 microseconds since 1970 (NaT for None) and the other properties as
+# little endian float64 (NaN for None). Every column is step_count * 8 bytes,
+# so the position of any value can be calculated from the header alone.
+MAGIC = b'CASHFLOW'
+VERSION = 1
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('column_count', '<u4'),
+    ('step_count', '<u8'),
+    ('reserved', 'V40'),
+])
+COLUMN_DTYPES = {
+    name: np.dtype('<M8[us]') if name == DATE_FIELD else np.dtype('<f8')
+    for name in CASH_FLOW_STEP_FIELDS
+}
+
+
+def write_cash_flow_step_file(path: str, steps: CashFlowStepTable):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['column_count'] = len(CASH_FLOW_STEP_FIELDS)
+    header['step_count'] = len(steps)
+
+    with open(path, 'wb') as file:
+        header.tofile(file)
+        for name in CASH_FLOW_STEP_FIELDS:
+            np.asarray(getattr(steps, name), dtype=COLUMN_DTYPES[name]).tofile(file)
+
+
+# Returns a CashFlowStepTable whose columns are memory mapped from the file, so
+# nothing is read until it is used, and nothing is copied. The mode is as for
+# numpy.memmap: 'c' (the default) lets calculators write their results to the
+# columns without changing the file, 'r' is read only and 'r+' writes the
+# results back to the file.
+def read_cash_flow_step_file(path: str, mode: str = 'c') -> CashFlowStepTable:
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC:
+        raise ValueError(f'{path} is not a CashFlowStep file')
+    if header['version'][0] != VERSION:
+        raise ValueError(f'{path} has unsupported version {header["version"][0]}')
+    if header['column_count'][0] != len(CASH_FLOW_STEP_FIELDS):
+        raise ValueError(f'{path} has {header["column_count"][0]} columns, expected {len(CASH_FLOW_STEP_FIELDS)}')
+
+    step_count = int(header['step_count'][0])
+    columns = {}
+    offset = HEADER_DTYPE.itemsize
+    for name in CASH_FLOW_STEP_FIELDS:
+        dtype = COLUMN_DTYPES[name]
+        if step_count == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(step_count,))
+        offset += step_count * dtype.itemsize
+    return CashFlowStepTable(**columns)
@@ -0,0 +1,151 @@
+from datetime import datetime
+from dataclasses import fields
+from typing import List
+import numpy as np
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+
+# The names of the CashFlowStep properties, in declaration order. The first one
+# (start_of_step) is a date, and all the others are money values.
+CASH_FLOW_STEP_FIELDS = tuple(field.name for field in fields(CashFlowStep))
+DATE_FIELD = CASH_FLOW_STEP_FIELDS[0]
+VALUE_FIELDS = CASH_FLOW_STEP_FIELDS[1:]
+
+DATE_DTYPE = 'datetime64[us]'
+
+
+# This class stores a list of CashFlowStep as columns, with one NumPy array per
+# CashFlowStep property, so that calculations can be done on whole arrays at once
+# instead of one step at a time.
+# Dates are stored as datetime64 (None becomes NaT) and money values as float64
+# (None becomes NaN). The arrays passed in are used as is, not copied.
+class CashFlowStepTable:
+    def __init__(self, **columns: np.ndarray):
+        missing = set(CASH_FLOW_STEP_FIELDS) - set(columns)
+        if missing:
+            raise ValueError(f'Missing CashFlowStep columns: {sorted(missing)}')
+
+        for name in CASH_FLOW_STEP_FIELDS:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def from_steps(cls, steps: List[CashFlowStep], dtype=np.float64) -> 'CashFlowStepTable':
+        columns = {
+            DATE_FIELD: np.array(
+                [step.start_of_step for step in steps],
+                dtype=DATE_DTYPE)
+        }
+        for name in VALUE_FIELDS:
+            columns[name] = np.array(
+                [_none_to_nan(getattr(step, name)) for step in steps],
+                dtype=dtype)
+        return cls(**columns)
+
+    @classmethod
+    def empty(cls, length: int, dtype=np.float64) -> 'CashFlowStepTable':
+        columns = {DATE_FIELD: np.full(length, np.datetime64('NaT'), dtype=DATE_DTYPE)}
+        for name in VALUE_FIELDS:
+            columns[name] = np.full(length, np.nan, dtype=dtype)
+        return cls(**columns)
+
+    # A copy of the table, with the money values converted to the dtype
+    def astype(self, dtype) -> 'CashFlowStepTable':
+        columns = {DATE_FIELD: self.start_of_step.copy()}
+        for name in VALUE_FIELDS:
+            columns[name] = getattr(self, name).astype(dtype)
+        return CashFlowStepTable(**columns)
+
+    def __len__(self) -> int:
+        return len(self.start_of_step)
+
+    # The steps from start to stop, as a table whose columns are views of the
+    # columns of this table, so calculating it calculates these steps in place
+    def rows(self, start: int, stop: int) -> 'CashFlowStepTable':
+        return CashFlowStepTable(**{name: column[start:stop] for name, column in self.columns().items()})
+
+    def __getitem__(self, index: int) -> 'CashFlowStepView':
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('CashFlowStepTable index out of range')
+        return CashFlowStepView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CashFlowStepView(self, index)
+
+    def columns(self):
+        return {name: getattr(self, name) for name in CASH_FLOW_STEP_FIELDS}
+
+    def to_steps(self) -> List[CashFlowStep]:
+        dates = self.start_of_step.astype(object)
+        values = [
+            [_nan_to_none(value) for value in getattr(self, name).tolist()]
+            for name in VALUE_FIELDS
+        ]
+        return [
+            CashFlowStep(date, *step_values)
+            for date, *step_values in zip(dates, *values)
+        ]
+
+    def update_steps(self, steps: List[CashFlowStep]):
+        # copies the values in the table back on to the steps it was created from
+        for step, calculated_step in zip(steps, self.to_steps()):
+            for name in CASH_FLOW_STEP_FIELDS:
+                setattr(step, name, getattr(calculated_step, name))
+
+
+# This class looks like a CashFlowStep, but stores its values in a row of a
+# CashFlowStepTable instead of in its own __dict__, so that millions of steps can
+# be held in memory. Each view only holds a reference to the table and its
+# index, and views are created on demand when iterating the table, so the cost
+# per step is just the 8 bytes per property in the table columns.
+# The calculators only use attribute access on steps, so they work unchanged.
+class CashFlowStepView:
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: CashFlowStepTable, index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def start_of_step(self) -> datetime:
+        return self._table.start_of_step[self._index].item()
+
+    @start_of_step.setter
+    def start_of_step(self, value: datetime):
+        self._table.start_of_step[self._index] = as_datetime64(value)
+
+    def to_step(self) -> CashFlowStep:
+        return CashFlowStep(*(getattr(self, name) for name in CASH_FLOW_STEP_FIELDS))
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in CASH_FLOW_STEP_FIELDS)
+        return f'CashFlowStepView({values})'
+
+
+def _value_property(name: str) -> property:
+    def get(view: CashFlowStepView) -> float:
+        return _nan_to_none(getattr(view._table, name)[view._index].item())
+
+    def set(view: CashFlowStepView, value: float):
+        getattr(view._table, name)[view._index] = _none_to_nan(value)
+
+    return property(get, set)
+
+
+for _name in VALUE_FIELDS:
+    setattr(CashFlowStepView, _name, _value_property(_name))
+
+
+def as_datetime64(when: datetime) -> np.datetime64:
+    if when is None:
+        return np.datetime64('NaT')
+    return np.datetime64(when, 'us')
+
+
+def _none_to_nan(value):
+    return np.nan if value is None else value
+
+
+def _nan_to_none(value):
+    return None if value != value else value
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, TextIO
+import numpy as np
+from cash_flow_calculator.cash_flow_step_csv import read_cash_flow_steps
+from cash_flow_calculator.cash_flow_step_file import read_cash_flow_step_file, write_cash_flow_step_file
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_FIELD, VALUE_FIELDS
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.portfolio_runner import PortfolioRunner, Project
+
+# This script calculates the construction margin for a portfolio of projects,
+# and writes the calculated steps of each project to the output directory as a
+# cash_flow_step_file (<project name>.cfs), for example:
+#   python -m cash_flow_calculator.cli portfolio.json --output results --workers 8 --chunk-size 100000
+# The portfolio file is JSON, with the ConstructionMarginCalculator parameters,
+# the fraction of spend and the steps of each project. The steps are a CSV file
+# (ending in .csv, see cash_flow_step_csv), a NumPy .npz file with a column for
+# start_of_step and optionally any of the other CashFlowStep properties (such as
+# one written by numpy.savez), or otherwise a cash_flow_step_file, with paths
+# relative to the portfolio file:
+#   {
+#       "projects": [
+#           {
+#               "name": "north",
+#               "steps": "north.csv",
+#               "fraction_of_spend": 0.3,
+#               "calculator": {"balance_of_plant_costs_at_financial_close": 10, ...,
+#                              "date_of_financial_close": "2020-01-10T00:00:00", ...}
+#           },
+#           ...
+#       ]
+#   }
+# The projects are read, calculated and written a window at a time, with one
+# project for each worker, so that all the workers are busy but only that many
+# projects' steps are in memory at once. The throughput of each stage is printed
+# at the end.
+
+CSV_EXTENSION = '.csv'
+NUMPY_EXTENSION = '.npz'
+OUTPUT_EXTENSION = '.cfs'
+
+
+def read_portfolio(path: str) -> List[dict]:
+    with open(path) as file:
+        projects = json.load(file)['projects']
+
+    names = [project['name'] for project in projects]
+    if len(set(names)) != len(names):
+        raise ValueError('Every project in the portfolio must have a different name')
+    for name in names:
+        # the name is used as the name of the output file, which must be in the
+        # output directory
+        if not name or name in ('.', '..') or '/' in name or '\\' in name:
+            raise ValueError(f'Project names cannot be paths: {name!r}')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    for project in projects:
+        project['steps'] = os.path.join(directory, project['steps'])
+    return projects
+
+
+def read_steps(path: str) -> CashFlowStepTable:
+    if path.lower().endswith(CSV_EXTENSION):
+        with open(path, newline='') as file:
+            return CashFlowStepTable.from_steps(list(read_cash_flow_steps(file)))
+    if path.lower().endswith(NUMPY_EXTENSION):
+        return read_numpy_steps(path)
+    return read_cash_flow_step_file(path)
+
+
+def read_numpy_steps(path: str) -> CashFlowStepTable:
+    with np.load(path) as file:
+        table = CashFlowStepTable.empty(len(file[DATE_FIELD]))
+        table.start_of_step[:] = file[DATE_FIELD]
+        for name in VALUE_FIELDS:
+            if name in file.files:
+                getattr(table, name)[:] = file[name]
+    return table
+
+
+def create_calculator(parameters: dict) -> ConstructionMarginCalculator:
+    parameters = dict(parameters)
+    if parameters.get('date_of_financial_close') is not None:
+        parameters['date_of_financial_close'] = datetime.fromisoformat(parameters['date_of_financial_close'])
+    return ConstructionMarginCalculator(**parameters)
+
+
+def run(
+        portfolio_path: str,
+        output_directory: str,
+        max_workers: int = None,
+        chunk_size: int = None,
+        out: TextIO = sys.stdout
+        ) -> dict:
+    definitions = read_portfolio(portfolio_path)
+    os.makedirs(output_directory, exist_ok=True)
+    runner = PortfolioRunner(max_workers, chunk_size)
+
+    seconds = {'read': 0.0, 'calculate': 0.0, 'write': 0.0}
+    steps = 0
+    window_size = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for first in range(0, len(definitions), window_size):
+            window = definitions[first:first + window_size]
+            start = time.perf_counter()
+            projects = [
+                Project(
+                    create_calculator(definition['calculator']),
+                    read_steps(definition['steps']),
+                    definition['fraction_of_spend'])
+                for definition in window
+            ]
+            read = time.perf_counter()
+
+            runner.run(projects, executor)
+            calculated = time.perf_counter()
+
+            for definition, project in zip(window, projects):
+                write_cash_flow_step_file(
+                    os.path.join(output_directory, definition['name'] + OUTPUT_EXTENSION),
+                    project.steps)
+            written = time.perf_counter()
+
+            steps += sum(len(project.steps) for project in projects)
+            seconds['read'] += read - start
+            seconds['calculate'] += calculated - read
+            seconds['write'] += written - calculated
+
+    statistics = {
+        'projects': len(definitions),
+        'steps': steps,
+        'read_seconds': seconds['read'],
+        'calculate_seconds': seconds['calculate'],
+        'write_seconds': seconds['write'],
+        'total_seconds': sum(seconds.values()),
+    }
+    for stage in ('read', 'calculate', 'write', 'total'):
+        stage_seconds = statistics[f'{stage}_seconds']
+        statistics[f'{stage}_steps_per_second'] = steps / stage_seconds if stage_seconds > 0 else float('inf')
+
+    print(f'{len(definitions):,} projects, {steps:,} steps', file=out)
+    for stage in ('read', 'calculate', 'write', 'total'):
+        print(
+            f'{stage:10} {statistics[f"{stage}_seconds"]:>10.3f} s '
+            f'{statistics[f"{stage}_steps_per_second"]:>15,.0f} steps/s',
+            file=out)
+    return statistics
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Calculate the construction margin for a portfolio of projects')
+    parser.add_argument('portfolio', help='the portfolio JSON file')
+    parser.add_argument('--output', required=True, metavar='DIRECTORY', help='where to write the calculated steps')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='the most steps per task (default: whole projects)')
+    options = parser.parse_args(arguments)
+
+    run(options.portfolio, options.output, options.workers, options.chunk_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,18 @@
 from datetime import datetime
-from typing import List
+from itertools import repeat
+from typing import List, Union
 from dataclasses import dataclass
+import numpy as np
 from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.inflation_index import InflationIndex, shared_inflation_index
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, as_datetime64
+from cash_flow_calculator.sensitivities import (
+    Sensitivities,
+    spend_sensitivities,
+    milestone_sensitivities,
+    with_inflation_rate)
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex, milestone_position
 
 # This class calculates a subset of properties on a CashFlowStep. In reality
 # there would be multiple similar classes, all setting properties on CashFlowStep
@@ -28,27 +39,44 @@ class ConstructionMarginCalculator:
         self.inflation_rate = inflation_rate
         self.inflation_mode = inflation_mode
 
+    # If a TimelineIndex is passed, the financial close milestones are set
+    # on the step containing the date of financial close, which is looked up
+    # in the index, instead of on steps that start exactly on that date.
+    # fraction_of_spend can also be a SpendProfile, in which case only the
+    # steps with some spend are calculated, and the others are left as they
+    # are. The milestones are still set, on the step found with a binary
+    # search (or in the index), so the steps must be in date order.
     def calculate_steps(
             self,
             steps: List[CashFlowStep], 
-            fraction_of_spend: float
+            fraction_of_spend: Union[float, SpendProfile],
+            timeline_index: TimelineIndex = None
             ):
-        for step in steps:
-            inflation = self.calculate_inflation(step.start_of_step)
-    
-            if step.start_of_step == self.date_of_financial_close:
-                step.special_capital_costs = self.special_capital_costs
+        inflation_index = self.inflation_index()
+
+        if not isinstance(steps, CashFlowStepTable):
+            # the steps are read more than once, so generators are read in to a list
+            steps = list(steps)
 
-                if self.in_selling_mode == False:
-                    step.development_cost_if_owning = self.development_cost
+        if isinstance(fraction_of_spend, SpendProfile):
+            fraction_of_spend.check_steps(len(steps))
+            steps_with_spend = ((steps[position], fraction) for position, fraction in fraction_of_spend)
+            milestones_in_loop = False
+        else:
+            steps_with_spend = zip(steps, repeat(fraction_of_spend))
+            milestones_in_loop = timeline_index is None
 
-                step.development_cost = self.development_cost
+        for step, step_fraction_of_spend in steps_with_spend:
+            inflation = inflation_index.inflation_to(step.start_of_step)
+    
+            if milestones_in_loop and step.start_of_step == self.date_of_financial_close:
+                self.calculate_milestones(step)
 
             step.turbine_cost_including_margin = \
-                self.turbine_costs * inflation * fraction_of_spend
+                self.turbine_costs * inflation * step_fraction_of_spend
             
             step.balance_of_plant_cost_including_margin = \
-                self.balance_of_plant_costs_at_financial_close * inflation * fraction_of_spend
+                self.balance_of_plant_costs_at_financial_close * inflation * step_fraction_of_spend
 
             if self.in_selling_mode:
                 step.construction_profit = \
@@ -60,7 +88,141 @@ class ConstructionMarginCalculator:
                 
                 step.balance_of_plant_cost_including_margin *= (1 + self.epc_margin)
 
+        if not milestones_in_loop:
+            position = milestone_position(steps, self.date_of_financial_close, timeline_index)
+            if position is not None:
+                self.calculate_milestones(steps[position])
+
+    def calculate_milestones(self, step: CashFlowStep):
+        step.special_capital_costs = self.special_capital_costs
+
+        if self.in_selling_mode == False:
+            step.development_cost_if_owning = self.development_cost
+
+        step.development_cost = self.development_cost
+
+    # This does the same calculation as calculate_steps, but on whole columns
+    # at once, which is much faster for long timelines. The operations are done
+    # in the same order as calculate_steps, so the results are exactly the same.
+    # The calculation is done with the dtype of the table, so a float32 table is
+    # calculated in float32 (and a float64 table exactly as calculate_steps).
+    def calculate_table(
+            self,
+            table: CashFlowStepTable,
+            fraction_of_spend: Union[float, SpendProfile],
+            timeline_index: TimelineIndex = None
+            ):
+        with_spend, fraction_of_spend = _spend(table, fraction_of_spend)
+        inflation = self.calculate_inflations(table.start_of_step[with_spend])
+        self._calculate_table(table, with_spend, fraction_of_spend, inflation, timeline_index)
+
+    # This calculates the table as calculate_table does, and also returns the
+    # partial derivative of each property it sets with respect to each input,
+    # for every step, as sensitivities[output][input] columns. The inputs are
+    # turbine_costs, balance_of_plant_costs_at_financial_close, epc_margin,
+    # fraction_of_spend, inflation (the inflation index of the step) and
+    # inflation_rate for the spend, and the inputs they are set to for the
+    # milestones. The inflation is looked up once, for both the values and the
+    # derivatives. Steps that a SpendProfile leaves as they are don't depend on
+    # any of the inputs, so their spend derivatives are 0.
+    def calculate_table_with_sensitivities(
+            self,
+            table: CashFlowStepTable,
+            fraction_of_spend: Union[float, SpendProfile],
+            timeline_index: TimelineIndex = None
+            ) -> Sensitivities:
+        with_spend, fraction_of_spend = _spend(table, fraction_of_spend)
+        start_of_steps = table.start_of_step[with_spend]
+        inflation = self.calculate_inflations(start_of_steps)
+        at_financial_close = self._calculate_table(table, with_spend, fraction_of_spend, inflation, timeline_index)
+
+        sensitivities = with_inflation_rate(
+            spend_sensitivities(
+                self.turbine_costs,
+                self.balance_of_plant_costs_at_financial_close,
+                self.epc_margin,
+                self.in_selling_mode,
+                inflation,
+                fraction_of_spend),
+            self.inflation_index().rate_derivatives(start_of_steps))
+        if not isinstance(with_spend, slice):
+            for derivatives in sensitivities.values():
+                for input, derivative in derivatives.items():
+                    derivatives[input] = np.zeros(len(table))
+                    derivatives[input][with_spend] = derivative
+        sensitivities.update(milestone_sensitivities(at_financial_close, self.in_selling_mode))
+        return sensitivities
+
+    # Calculates the steps of the table with spend, given their inflation, and
+    # returns which steps the milestones were set on
+    def _calculate_table(
+            self,
+            table: CashFlowStepTable,
+            with_spend,
+            fraction_of_spend,
+            inflation: np.ndarray,
+            timeline_index: TimelineIndex
+            ) -> np.ndarray:
+        dtype = table.turbine_cost_including_margin.dtype.type
+        fraction_of_spend = np.asarray(fraction_of_spend, dtype=dtype) \
+            if isinstance(fraction_of_spend, np.ndarray) else dtype(fraction_of_spend)
+        inflation = inflation.astype(dtype, copy=False)
+
+        if timeline_index is None:
+            at_financial_close = \
+                table.start_of_step == as_datetime64(self.date_of_financial_close)
+        else:
+            at_financial_close = np.zeros(len(table), dtype=bool)
+            position = timeline_index.position_of(self.date_of_financial_close)
+            if position is not None:
+                at_financial_close[position] = True
+
+        table.special_capital_costs[at_financial_close] = self.special_capital_costs
+
+        if self.in_selling_mode == False:
+            table.development_cost_if_owning[at_financial_close] = self.development_cost
+
+        table.development_cost[at_financial_close] = self.development_cost
+
+        table.turbine_cost_including_margin[with_spend] = \
+            dtype(self.turbine_costs) * inflation * fraction_of_spend
+
+        table.balance_of_plant_cost_including_margin[with_spend] = \
+            dtype(self.balance_of_plant_costs_at_financial_close) * inflation * fraction_of_spend
+
+        if self.in_selling_mode:
+            epc_margin = dtype(self.epc_margin)
+
+            table.construction_profit[with_spend] = \
+                -1 * \
+                (table.turbine_cost_including_margin[with_spend] + table.balance_of_plant_cost_including_margin[with_spend]) * \
+                epc_margin
+
+            table.turbine_cost_including_margin[with_spend] *= (1 + epc_margin)
+
+            table.balance_of_plant_cost_including_margin[with_spend] *= (1 + epc_margin)
+
+        return at_financial_close
+
     def calculate_inflation(self, start_of_step: datetime) -> float:
-        # return 1 for the sake of the example, but in reality the calculation would need
-        # self.date_of_financial_close, self.inflation_rate and self.inflation_mode
-        return 1
+        return self.inflation_index().inflation_to(start_of_step)
+
+    def inflation_index(self) -> InflationIndex:
+        # shared with any other calculators that have the same inflation parameters
+        return shared_inflation_index(
+            self.inflation_rate,
+            self.inflation_mode,
+            self.date_of_financial_close)
+
+    def calculate_inflations(self, start_of_steps: np.ndarray) -> np.ndarray:
+        # the whole column equivalent of calculate_inflation
+        return self.inflation_index().inflation_to_many(start_of_steps)
+
+
+# The steps of the table with spend (all of them, unless fraction_of_spend is a
+# SpendProfile), and their fractions of spend
+def _spend(table: CashFlowStepTable, fraction_of_spend: Union[float, SpendProfile]):
+    if isinstance(fraction_of_spend, SpendProfile):
+        fraction_of_spend.check_steps(len(table))
+        return fraction_of_spend.positions, fraction_of_spend.fractions
+    return slice(None), fraction_of_spend
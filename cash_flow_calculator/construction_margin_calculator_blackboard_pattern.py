@@ -2,6 +2,8 @@ from datetime import datetime
 from typing import List
 from dataclasses import dataclass
 from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.execution_plan import build_execution_plan
+from cash_flow_calculator.instrumentation import CalculatorInstrumentation
 
 # This class calculates a subset of properties on CashFlowSteps. In reality
 # there would be multiple similar classes, all setting properties on CashFlowStep
@@ -13,6 +15,16 @@ from cash_flow_calculator.cash_flow_step import CashFlowStep
 # when the values are available. This requires another class to calculate
 # these properties, and a class to orchestrate the blackboard / calculators
 class ConstructionMarginCalculatorBlackboardPattern:
+    inputs = (
+        'start_of_step',
+        'turbine_cost_including_margin',
+        'balance_of_plant_cost_including_margin')
+    outputs = (
+        'special_capital_costs',
+        'development_cost_if_owning',
+        'development_cost',
+        'construction_profit')
+
     def __init__(
             self, 
             development_cost: float, 
@@ -52,30 +64,53 @@ class ConstructionMarginCalculatorBlackboardPattern:
 
 # Example calculators to add the required properties to the blackbloard / CashFlowStep
 class TurbineCostCalculator:
+    inputs = ()
+    outputs = ('turbine_cost_including_margin',)
+
     def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
         step.turbine_cost_including_margin = 1 
 
 
 class BalanceOfPlantCalculator:
+    inputs = ()
+    outputs = ('balance_of_plant_cost_including_margin',)
+
     def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
         step.balance_of_plant_cost_including_margin = 1 
 
 
-# Example class to orchestrate the blackboard and calculators
+# Example class to orchestrate the blackboard and calculators. The order that
+# the calculators need to run in is worked out once, from the inputs and outputs
+# that they declare, so calculating a step is a single pass through the
+# calculators. Passing a CalculatorInstrumentation records the time, calls and
+# retries of each calculator.
 class CashFlowStepCalculator:
-    def __init__(self, calculators: List[object]):
+    def __init__(self, calculators: List[object], instrumentation: CalculatorInstrumentation = None):
+        if instrumentation is not None:
+            calculators = [instrumentation.instrument(calculator) for calculator in calculators]
+
         self.calculators = calculators
+        self.execution_plan = build_execution_plan(calculators)
 
     def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
-        temporary_calculators = self.calculators.copy()
-
-        # Loop through calculators until they all indicate that they have 
-        # calculated. This code is quite naive and doesn't check for 
-        # cyclic dependencies.
-        while len(temporary_calculators > 0):
-            calculator = temporary_calculators.pop(0)
-
-            if calculator.calculate_step(step, fraction_of_spend) == False:
-                temporary_calculators.append(calculator)
-        
-        
+        waiting_calculators = [
+            calculator
+            for calculator in self.execution_plan
+            if calculator.calculate_step(step, fraction_of_spend) == False
+        ]
+
+        # Calculators only return False here if they have not declared all
+        # their inputs, so retry them until they stop making progress, which
+        # means that the missing values are never going to arrive.
+        while waiting_calculators:
+            still_waiting = [
+                calculator
+                for calculator in waiting_calculators
+                if calculator.calculate_step(step, fraction_of_spend) == False
+            ]
+
+            if len(still_waiting) == len(waiting_calculators):
+                names = [type(calculator).__name__ for calculator in still_waiting]
+                raise ValueError(f'Calculators could not calculate the step: {names}')
+
+            waiting_calculators = still_waiting
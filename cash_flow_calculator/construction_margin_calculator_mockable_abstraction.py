@@ -1,9 +1,21 @@
 from datetime import datetime
-from typing import List
+from itertools import repeat
+from typing import List, Union
+import numpy as np
 from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_DTYPE
+from cash_flow_calculator.sensitivities import Sensitivities, spend_sensitivities, milestone_sensitivities
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex, milestone_position
 
 # This class calculates a subset of properties on CashFlowSteps. In reality
 # there would be multiple similar classes, all setting properties on CashFlowStep
+# The inflation calculator is anything with an inflation_to(date) function that
+# returns the inflation for the date. It can also have an
+# inflation_to_many(dates) function, which returns an array of the inflation for
+# many dates at once (such as InflationIndex), and calculate_steps uses it if it
+# is there, instead of calling inflation_to for every step. The dates are always
+# a datetime64[us] array, with NaT for steps without a start.
 class ConstructionMarginCalculatorMockableAbstraction:
     def __init__(
             self, 
@@ -26,16 +38,18 @@ class ConstructionMarginCalculatorMockableAbstraction:
         self.inflation_calculator = inflation_calculator
 
     def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
-        inflation = self.inflation_calculator.inflation_to(step.start_of_step)
+        self.calculate_step_with_inflation(
+            step,
+            self.inflation_calculator.inflation_to(step.start_of_step),
+            fraction_of_spend)
 
+    def calculate_step_with_inflation(self, step: CashFlowStep, inflation: float, fraction_of_spend: float):
         if step.start_of_step == self.date_of_financial_close:
-            step.special_capital_costs = self.special_capital_costs
-
-            if self.in_selling_mode == False:
-                step.development_cost_if_owning = self.development_cost
+            self.calculate_milestones(step)
 
-            step.development_cost = self.development_cost
+        self.calculate_spend(step, inflation, fraction_of_spend)
 
+    def calculate_spend(self, step: CashFlowStep, inflation: float, fraction_of_spend: float):
         step.turbine_cost_including_margin = \
             self.turbine_costs * inflation * fraction_of_spend
         
@@ -50,4 +64,92 @@ class ConstructionMarginCalculatorMockableAbstraction:
             
             step.turbine_cost_including_margin *= (1 + self.epc_margin)
             
-            step.balance_of_plant_cost_including_margin *= (1 + self.epc_margin)
\ No newline at end of file
+            step.balance_of_plant_cost_including_margin *= (1 + self.epc_margin)
+
+    # This calculates the step as calculate_step does, and also returns the
+    # partial derivative of each property it sets with respect to each input,
+    # as sensitivities[output][input]. The inflation comes from the inflation
+    # calculator, so the derivatives are with respect to the inflation of the
+    # step, rather than an inflation rate. The inflation is only asked for once.
+    def calculate_step_with_sensitivities(self, step: CashFlowStep, fraction_of_spend: float) -> Sensitivities:
+        inflation = self.inflation_calculator.inflation_to(step.start_of_step)
+        self.calculate_step_with_inflation(step, inflation, fraction_of_spend)
+
+        sensitivities = spend_sensitivities(
+            self.turbine_costs,
+            self.balance_of_plant_costs_at_financial_close,
+            self.epc_margin,
+            self.in_selling_mode,
+            inflation,
+            fraction_of_spend)
+        sensitivities.update(milestone_sensitivities(
+            step.start_of_step == self.date_of_financial_close,
+            self.in_selling_mode))
+        return sensitivities
+
+    # fraction_of_spend can be a single fraction for every step, or a
+    # SpendProfile, in which case only the steps with some spend are
+    # calculated, and the others are left as they are. The milestones are still
+    # set, on the step found with a binary search, so the steps must be in date
+    # order.
+    # If a TimelineIndex is passed, the milestones are set on the step
+    # containing the date of financial close, as ConstructionMarginCalculator
+    # does.
+    def calculate_steps(
+            self,
+            steps: List[CashFlowStep],
+            fraction_of_spend: Union[float, SpendProfile],
+            timeline_index: TimelineIndex = None
+            ):
+        if not isinstance(steps, CashFlowStepTable):
+            # the steps are read more than once, so generators are read in to a list
+            steps = list(steps)
+
+        if isinstance(fraction_of_spend, SpendProfile):
+            fraction_of_spend.check_steps(len(steps))
+            positions = fraction_of_spend.positions
+            steps_with_spend = [steps[position] for position in positions.tolist()]
+            fractions = fraction_of_spend.fractions.tolist()
+        else:
+            positions = slice(None)
+            steps_with_spend = steps
+            fractions = repeat(fraction_of_spend)
+
+        if isinstance(steps, CashFlowStepTable):
+            start_of_steps = steps.start_of_step[positions]
+        else:
+            start_of_steps = [step.start_of_step for step in steps_with_spend]
+        inflations = inflation_to_many(self.inflation_calculator, start_of_steps)
+
+        milestones_in_loop = timeline_index is None and not isinstance(fraction_of_spend, SpendProfile)
+        calculate = self.calculate_step_with_inflation if milestones_in_loop else self.calculate_spend
+
+        for step, inflation, fraction in zip(steps_with_spend, inflations.tolist(), fractions):
+            calculate(step, inflation, fraction)
+
+        if not milestones_in_loop:
+            position = milestone_position(steps, self.date_of_financial_close, timeline_index)
+            if position is not None:
+                self.calculate_milestones(steps[position])
+
+    def calculate_milestones(self, step: CashFlowStep):
+        step.special_capital_costs = self.special_capital_costs
+
+        if self.in_selling_mode == False:
+            step.development_cost_if_owning = self.development_cost
+
+        step.development_cost = self.development_cost
+
+
+# Returns the inflation for each date from an inflation calculator, all at once
+# if it has inflation_to_many (passing it the dates as a datetime64[us] array,
+# whether they come from a list of steps or a table), and otherwise one date at
+# a time
+def inflation_to_many(inflation_calculator, dates) -> np.ndarray:
+    if hasattr(inflation_calculator, 'inflation_to_many'):
+        dates = np.asarray(dates, dtype=DATE_DTYPE)
+        return np.asarray(inflation_calculator.inflation_to_many(dates), dtype=np.float64)
+
+    if isinstance(dates, np.ndarray):
+        dates = dates.astype(object)
+    return np.array([inflation_calculator.inflation_to(when) for when in dates], dtype=np.float64)
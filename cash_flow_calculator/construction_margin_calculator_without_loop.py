@@ -1,7 +1,14 @@
 from datetime import datetime
-from typing import List
+from itertools import repeat
+from typing import List, Union
 from dataclasses import dataclass
 from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.instrumentation import CalculatorInstrumentation
+from cash_flow_calculator.memory_estimate import chunk_size_for_budget
+from cash_flow_calculator.inflation_index import InflationIndex, shared_inflation_index
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex, milestone_position
 
 # This class calculates a subset of properties on CashFlowSteps. In reality
 # there would be multiple similar classes, all setting properties on CashFlowStep
@@ -32,12 +39,7 @@ class ConstructionMarginCalculatorWithoutLoop:
         inflation = self.calculate_inflation(step.start_of_step)
 
         if step.start_of_step == self.date_of_financial_close:
-            step.special_capital_costs = self.special_capital_costs
-
-            if self.in_selling_mode == False:
-                step.development_cost_if_owning = self.development_cost
-
-            step.development_cost = self.development_cost
+            self.calculate_milestones(step)
 
         step.turbine_cost_including_margin = \
             self.turbine_costs * inflation * fraction_of_spend
@@ -55,21 +57,122 @@ class ConstructionMarginCalculatorWithoutLoop:
             
             step.balance_of_plant_cost_including_margin *= (1 + self.epc_margin)
 
+    def calculate_milestones(self, step: CashFlowStep):
+        step.special_capital_costs = self.special_capital_costs
+
+        if self.in_selling_mode == False:
+            step.development_cost_if_owning = self.development_cost
+
+        step.development_cost = self.development_cost
+
     def calculate_inflation(self, start_of_step: datetime) -> float:
-        # return 1 for the sake of the example, but in reality the calculation would need
-        # self.date_of_financial_close, self.inflation_rate and self.inflation_mode
-        return 1
+        return self.inflation_index().inflation_to(start_of_step)
+
+    def inflation_index(self) -> InflationIndex:
+        # shared with any other calculators that have the same inflation parameters
+        return shared_inflation_index(
+            self.inflation_rate,
+            self.inflation_mode,
+            self.date_of_financial_close)
 
 
 # This class is responsible for calculating a list of CashFlowStep, now that this 
 # responsibilty has been extracted from ConstructionMarginCashFlowCostCalculator
+# The steps can also be a CashFlowStepTable, in which case calculators that can
+# calculate a whole table at once (with calculate_table) do so.
+# Passing a CalculatorInstrumentation records the time and calls of each
+# calculator.
+# Calculators that can calculate many steps at once (with calculate_steps) are
+# given all the steps together, so that they can fetch things like inflation
+# for every step in one go.
+# fraction_of_spend can also be a SpendProfile, in which case the steps without
+# spend are skipped, and left as they are. Calculators that can calculate many
+# steps at once (with calculate_table or calculate_steps) do this themselves,
+# and other calculators are only given the steps with spend. The milestones
+# are still set on a step without spend if the calculator has
+# calculate_milestones (and a date_of_financial_close), so every calculator
+# gives the same results as calculate_steps.
+# A TimelineIndex for the steps can be passed, and is shared by all the
+# calculators that can use one (with calculate_table or calculate_steps), so
+# that the milestones are looked up in it instead of compared to every step.
+# Other calculators with calculate_milestones have their milestones set on the
+# step found in it, so that whichever way a calculator is called, it writes the
+# same values.
+# If a memory budget (in bytes) is passed, the steps are calculated in chunks,
+# sized from an estimate of the memory that calculating each step uses (see
+# chunk_size_for_budget), so that the intermediate results of a calculator,
+# such as the temporary columns of calculate_table, fit in the budget. The
+# results are the same as calculating all the steps at once.
 class CashFlowStepsCalculator:
-    def __init__(self, steps: List[CashFlowStep]):
+    def __init__(
+            self,
+            steps: List[CashFlowStep],
+            instrumentation: CalculatorInstrumentation = None,
+            timeline_index: TimelineIndex = None,
+            memory_budget: int = None
+            ):
         self.steps = steps
+        self.instrumentation = instrumentation
+        self.timeline_index = timeline_index
+        self.memory_budget = memory_budget
 
     # calculator is something that has a calculate_step function here, we could add a 
     # base class and type it if we wished to.
-    def calculate_step(self, calculator, fraction_of_spend: float):
-        for step in self.steps:
-            calculator.calculate_step(step, fraction_of_spend)
+    def calculate_step(self, calculator, fraction_of_spend: Union[float, SpendProfile]):
+        if self.instrumentation is not None:
+            calculator = self.instrumentation.instrument(calculator)
+
+        if self.memory_budget is None:
+            _calculate(calculator, self.steps, fraction_of_spend, self.timeline_index)
+            return
+
+        if isinstance(fraction_of_spend, SpendProfile):
+            fraction_of_spend.check_steps(len(self.steps))
+
+        chunk_size = chunk_size_for_budget(calculator, self.memory_budget, steps_in_memory=True)
+        for start in range(0, len(self.steps), chunk_size):
+            stop = min(start + chunk_size, len(self.steps))
+            _calculate(
+                calculator,
+                self.steps.rows(start, stop) if isinstance(self.steps, CashFlowStepTable) else self.steps[start:stop],
+                fraction_of_spend.window(start, stop) if isinstance(fraction_of_spend, SpendProfile) \
+                    else fraction_of_spend,
+                None if self.timeline_index is None else self.timeline_index.window(start, stop))
+
+
+def _calculate(
+        calculator,
+        steps: List[CashFlowStep],
+        fraction_of_spend: Union[float, SpendProfile],
+        timeline_index: TimelineIndex):
+    # the timeline index is only passed when there is one, so calculators
+    # that don't take one still work
+    arguments = (steps, fraction_of_spend) if timeline_index is None \
+        else (steps, fraction_of_spend, timeline_index)
+
+    if isinstance(steps, CashFlowStepTable) and hasattr(calculator, 'calculate_table'):
+        calculator.calculate_table(*arguments)
+        return
+
+    if hasattr(calculator, 'calculate_steps'):
+        calculator.calculate_steps(*arguments)
+        return
+
+    if isinstance(fraction_of_spend, SpendProfile):
+        fraction_of_spend.check_steps(len(steps))
+        steps_with_spend = ((steps[position], fraction) for position, fraction in fraction_of_spend)
+    else:
+        steps_with_spend = zip(steps, repeat(fraction_of_spend))
+
+    for step, step_fraction_of_spend in steps_with_spend:
+        calculator.calculate_step(step, step_fraction_of_spend)
+
+    # calculate_step only sets the milestones on a step with spend that
+    # starts on the date of financial close, so they are set here if that
+    # step was skipped, or are looked up in the timeline index instead
+    milestones_in_loop = timeline_index is None and not isinstance(fraction_of_spend, SpendProfile)
+    if not milestones_in_loop and hasattr(calculator, 'calculate_milestones'):
+        position = milestone_position(steps, calculator.date_of_financial_close, timeline_index)
+        if position is not None:
+            calculator.calculate_milestones(steps[position])
 
@@ -0,0 +1,294 @@
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Dict, List, Tuple
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+from cash_flow_calculator.portfolio_runner import Project
+
+DEFAULT_MAX_ATTEMPTS = 3
+AUTHKEY_ENVIRONMENT_VARIABLE = 'CASH_FLOW_CALCULATOR_AUTHKEY'
+
+logger = logging.getLogger(__name__)
+
+
+# A chunk of the steps of a project, which is the unit of work sent to workers
+@dataclass
+class Partition:
+    project: int
+    start: int
+    stop: int
+
+
+@dataclass
+class DistributedRunStatistics:
+    partitions: int = 0
+    # partitions that failed on a worker (or whose worker disconnected) and
+    # were sent to another worker
+    retries: int = 0
+    # partitions sent to a second worker while the first was still calculating
+    # them, because there was nothing else left to do
+    stolen: int = 0
+    partitions_by_worker: Dict[int, int] = field(default_factory=dict)
+
+
+# This class shares the projects of a portfolio (or chunks of their steps)
+# between worker processes, which can be on any machine that can connect to the
+# coordinator over TCP. Workers connect with run_worker, using the same authkey
+# as the coordinator, and then ask for work, so faster workers get through more
+# partitions. Each partition is calculated with CashFlowStepsCalculator by the
+# worker, and the results are sent back and copied in to the project's steps, so
+# the results are the same as calculating the projects in one process.
+# When there are no partitions left to hand out, idle workers steal a partition
+# that another worker is still calculating, and whichever finishes first is
+# used, so one slow worker doesn't hold up the whole run. Partitions that fail,
+# or whose worker disconnects, are given to another worker, up to max_attempts
+# times before the run fails. Every failure is retried, even while another
+# worker is still calculating the partition, but not on a worker it has failed
+# on, unless it has failed on every connected worker.
+class Coordinator:
+    def __init__(
+            self,
+            projects: List[Project],
+            authkey: bytes,
+            address: Tuple[str, int] = ('127.0.0.1', 0),
+            chunk_size: int = None,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS
+        ):
+        self.projects = projects
+        self.authkey = authkey
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.statistics = DistributedRunStatistics()
+        self._requested_address = address
+        self._listener = None
+        self._partitions = [
+            Partition(index, start, stop)
+            for index, project in enumerate(projects)
+            for start, stop in self._chunks(len(project.steps))
+        ]
+        self._pending = deque(range(len(self._partitions)))
+        self._running = {}
+        self._failures = {}
+        self._failed_workers = {}
+        self._connected_workers = set()
+        self._done = set()
+        self._error = None
+        self._finished = False
+        self._condition = threading.Condition()
+        self._workers = 0
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    # Starts listening for workers, returning the address they should connect to
+    def start(self) -> Tuple[str, int]:
+        self.statistics.partitions = len(self._partitions)
+        self._listener = Listener(self._requested_address, authkey=self.authkey)
+        threading.Thread(target=self._accept_workers, daemon=True).start()
+        return self.address
+
+    # Waits for every partition to be calculated, and stops the workers
+    def wait(self) -> DistributedRunStatistics:
+        with self._condition:
+            while self._error is None and len(self._done) < len(self._partitions):
+                self._condition.wait()
+            self._finished = True
+            self._condition.notify_all()
+
+        # wake up the thread waiting for workers to connect, so it can stop
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+
+        if self._error is not None:
+            raise self._error
+        return self.statistics
+
+    def run(self) -> DistributedRunStatistics:
+        self.start()
+        return self.wait()
+
+    def _chunks(self, length: int):
+        chunk_size = self.chunk_size or max(length, 1)
+        for start in range(0, length, chunk_size):
+            yield start, min(start + chunk_size, length)
+
+    def _accept_workers(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError as error:
+                logger.warning('A worker failed to authenticate: %s', error)
+                continue
+            except (EOFError, OSError) as error:
+                with self._condition:
+                    if self._finished:
+                        # the listener has been closed
+                        return
+                logger.warning('A worker failed to connect: %s', error)
+                continue
+
+            with self._condition:
+                if self._finished:
+                    connection.close()
+                    return
+                worker = self._workers
+                self._workers += 1
+                self._connected_workers.add(worker)
+            threading.Thread(target=self._serve_worker, args=(connection, worker), daemon=True).start()
+
+    def _serve_worker(self, connection: Connection, worker: int):
+        current = None
+        try:
+            with connection:
+                while True:
+                    message = connection.recv()
+                    if message[0] == 'result':
+                        self._complete(message[1], message[2], worker)
+                        current = None
+                    elif message[0] == 'failed':
+                        self._fail(message[1], worker)
+                        current = None
+
+                    current = self._next_partition(worker)
+                    if current is None:
+                        connection.send(None)
+                        return
+                    connection.send(self._task(current))
+        except (EOFError, OSError):
+            if current is not None:
+                self._fail(current, worker)
+        finally:
+            with self._condition:
+                self._connected_workers.discard(worker)
+                # partitions that were kept from this worker can go to the others
+                self._condition.notify_all()
+
+    def _next_partition(self, worker: int):
+        with self._condition:
+            while True:
+                if self._finished or self._error is not None:
+                    return None
+
+                # partitions that have failed on this worker are left for the
+                # others, unless every connected worker has failed on them
+                partition = next(
+                    (partition for partition in self._pending if self._can_retry(partition, worker)),
+                    None)
+                if partition is not None:
+                    self._pending.remove(partition)
+                    self._running[partition] = self._running.get(partition, 0) + 1
+                    return partition
+
+                stealable = [
+                    partition for partition, running in self._running.items()
+                    if running == 1 and partition not in self._done
+                    and worker not in self._failed_workers.get(partition, ())
+                ]
+                if stealable:
+                    partition = stealable[0]
+                    self._running[partition] += 1
+                    self.statistics.stolen += 1
+                    return partition
+
+                self._condition.wait()
+
+    def _can_retry(self, partition: int, worker: int) -> bool:
+        failed_workers = self._failed_workers.get(partition, set())
+        return worker not in failed_workers or self._connected_workers <= failed_workers
+
+    def _task(self, index: int):
+        partition = self._partitions[index]
+        project = self.projects[partition.project]
+        columns = {
+            name: column[partition.start:partition.stop]
+            for name, column in project.steps.columns().items()
+        }
+        return index, project.calculator, columns, project.fraction_of_spend
+
+    def _complete(self, index: int, values: Dict[str, object], worker: int):
+        with self._condition:
+            self._running[index] -= 1
+            if index not in self._done:
+                partition = self._partitions[index]
+                steps = self.projects[partition.project].steps
+                for name in VALUE_FIELDS:
+                    getattr(steps, name)[partition.start:partition.stop] = values[name]
+                self._done.add(index)
+                if index in self._pending:
+                    # it was waiting to be retried after failing on another worker
+                    self._pending.remove(index)
+                self.statistics.partitions_by_worker[worker] = \
+                    self.statistics.partitions_by_worker.get(worker, 0) + 1
+            self._condition.notify_all()
+
+    def _fail(self, index: int, worker: int):
+        with self._condition:
+            self._running[index] -= 1
+            if index in self._done:
+                return
+
+            self._failures[index] = self._failures.get(index, 0) + 1
+            self._failed_workers.setdefault(index, set()).add(worker)
+            if self._failures[index] >= self.max_attempts:
+                partition = self._partitions[index]
+                self._error = RuntimeError(
+                    f'Steps {partition.start} to {partition.stop} of project {partition.project} '
+                    f'failed {self._failures[index]} times')
+            elif index not in self._pending:
+                # even if another worker is still calculating it, as that
+                # worker might be slow, or fail too
+                self._pending.append(index)
+                self.statistics.retries += 1
+            self._condition.notify_all()
+
+
+# Connects to a coordinator and calculates partitions until there are none
+# left, returning how many it calculated. Partitions that raise an exception
+# are reported back to the coordinator, which gives them to another worker.
+def run_worker(address: Tuple[str, int], authkey: bytes) -> int:
+    calculated = 0
+    with Client(address, authkey=authkey) as connection:
+        connection.send(('ready',))
+        while True:
+            task = connection.recv()
+            if task is None:
+                return calculated
+
+            index, calculator, columns, fraction_of_spend = task
+            try:
+                steps = CashFlowStepTable(**columns)
+                CashFlowStepsCalculator(steps).calculate_step(calculator, fraction_of_spend)
+            except Exception as error:
+                connection.send(('failed', index, f'{type(error).__name__}: {error}'))
+                continue
+
+            connection.send(('result', index, {name: getattr(steps, name) for name in VALUE_FIELDS}))
+            calculated += 1
+
+
+# Runs a worker, for example on another machine:
+#   CASH_FLOW_CALCULATOR_AUTHKEY=secret python -m cash_flow_calculator.distributed_runner coordinator-host:6000
+def main(arguments: List[str] = None) -> int:
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if len(arguments) != 1 or AUTHKEY_ENVIRONMENT_VARIABLE not in os.environ:
+        print(f'usage: {AUTHKEY_ENVIRONMENT_VARIABLE}=<authkey> python -m cash_flow_calculator.distributed_runner HOST:PORT')
+        return 2
+
+    host, _, port = arguments[0].rpartition(':')
+    calculated = run_worker((host, int(port)), os.environ[AUTHKEY_ENVIRONMENT_VARIABLE].encode())
+    print(f'Calculated {calculated} partitions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
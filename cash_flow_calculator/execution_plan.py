@@ -0,0 +1,56 @@
+from typing import List
+
+# This function orders blackboard calculators so that each one runs after all
+# the calculators that produce the CashFlowStep properties that it needs.
+# Calculators declare these with "inputs" and "outputs" class attributes, which
+# are tuples of CashFlowStep property names. Properties that no calculator
+# outputs (such as start_of_step) are expected to already be on the step, and
+# calculators that don't declare anything can run at any time.
+# Calculators that don't depend on each other keep their original order, so the
+# plan is deterministic. Cyclic dependencies raise a ValueError, instead of
+# looping forever when calculating the steps.
+def build_execution_plan(calculators: List[object]) -> List[object]:
+    producers = {}
+    for index, calculator in enumerate(calculators):
+        for output in outputs_of(calculator):
+            producers.setdefault(output, []).append(index)
+
+    dependencies = []
+    for index, calculator in enumerate(calculators):
+        dependencies.append(set(
+            producer
+            for input in inputs_of(calculator)
+            for producer in producers.get(input, [])
+            if producer != index
+        ))
+
+    plan = []
+    planned = set()
+    while len(plan) < len(calculators):
+        ready = [
+            index
+            for index in range(len(calculators))
+            if index not in planned and dependencies[index] <= planned
+        ]
+
+        if not ready:
+            cyclic = [
+                type(calculators[index]).__name__
+                for index in range(len(calculators))
+                if index not in planned
+            ]
+            raise ValueError(f'Calculators have cyclic dependencies: {cyclic}')
+
+        for index in ready:
+            plan.append(calculators[index])
+            planned.add(index)
+
+    return plan
+
+
+def inputs_of(calculator) -> tuple:
+    return getattr(calculator, 'inputs', ())
+
+
+def outputs_of(calculator) -> tuple:
+    return getattr(calculator, 'outputs', ())
@@ -0,0 +1,151 @@
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, as_datetime64
+from cash_flow_calculator.construction_margin_calculator_mockable_abstraction import (
+    ConstructionMarginCalculatorMockableAbstraction,
+    inflation_to_many)
+
+# The values that are recalculated when an input changes, in the order that
+# they need recalculating. turbine_cost and balance_of_plant_cost are the costs
+# before the epc margin is added, and milestones are the properties set at the
+# date of financial close.
+CALCULATION_ORDER = (
+    'inflation',
+    'turbine_cost',
+    'balance_of_plant_cost',
+    'turbine_cost_including_margin',
+    'balance_of_plant_cost_including_margin',
+    'construction_profit',
+    'milestones')
+
+# The values that each value is used to calculate
+DEPENDENT_VALUES = {
+    'inflation': ('turbine_cost', 'balance_of_plant_cost'),
+    'turbine_cost': ('turbine_cost_including_margin', 'construction_profit'),
+    'balance_of_plant_cost': ('balance_of_plant_cost_including_margin', 'construction_profit'),
+    'turbine_cost_including_margin': (),
+    'balance_of_plant_cost_including_margin': (),
+    'construction_profit': (),
+    'milestones': (),
+}
+
+# The values that each input is used directly to calculate
+INPUT_DEPENDENT_VALUES = {
+    'inflation_calculator': ('inflation',),
+    'fraction_of_spend': ('turbine_cost', 'balance_of_plant_cost'),
+    'turbine_costs': ('turbine_cost',),
+    'balance_of_plant_costs_at_financial_close': ('balance_of_plant_cost',),
+    'epc_margin': (
+        'turbine_cost_including_margin',
+        'balance_of_plant_cost_including_margin',
+        'construction_profit'),
+    'in_selling_mode': (
+        'turbine_cost_including_margin',
+        'balance_of_plant_cost_including_margin',
+        'construction_profit',
+        'milestones'),
+    'date_of_financial_close': ('milestones',),
+    'special_capital_costs': ('milestones',),
+    'development_cost': ('milestones',),
+}
+
+MILESTONE_FIELDS = ('special_capital_costs', 'development_cost_if_owning', 'development_cost')
+
+
+# This class keeps the results of a ConstructionMarginCalculatorMockableAbstraction
+# up to date as its inputs change, recalculating only the values that depend on
+# the changed inputs. For example changing the epc_margin only recalculates the
+# values including margin and the construction profit, from the costs before
+# margin that were kept from the last calculation, and changing the date of
+# financial close only updates the steps at the old and new dates.
+# The results are the same as calculating the steps from scratch with the
+# changed calculator.
+class IncrementalConstructionMarginCalculator:
+    def __init__(
+            self,
+            calculator: ConstructionMarginCalculatorMockableAbstraction,
+            steps: CashFlowStepTable,
+            fraction_of_spend: float
+        ):
+        self.calculator = calculator
+        self.steps = steps
+        self.fraction_of_spend = fraction_of_spend
+        # the values before calculation, for steps that the calculation doesn't set
+        self._original_values = {
+            name: getattr(steps, name).copy()
+            for name in MILESTONE_FIELDS + ('construction_profit',)
+        }
+        self._financial_close = np.zeros(len(steps), dtype=bool)
+        self._recalculate(set(CALCULATION_ORDER))
+
+    # Changes the calculator inputs (or fraction_of_spend) and recalculates the
+    # values that depend on them. Returns the names of the recalculated values.
+    def update(self, **inputs) -> set:
+        unknown = set(inputs) - set(INPUT_DEPENDENT_VALUES)
+        if unknown:
+            raise ValueError(f'Unknown inputs: {sorted(unknown)}')
+
+        dirty = set()
+        for name, value in inputs.items():
+            if name == 'fraction_of_spend':
+                self.fraction_of_spend = value
+            else:
+                setattr(self.calculator, name, value)
+            dirty.update(INPUT_DEPENDENT_VALUES[name])
+
+        return self._recalculate(dirty)
+
+    def _recalculate(self, dirty: set) -> set:
+        recalculated = set()
+        for value in CALCULATION_ORDER:
+            if value in dirty:
+                getattr(self, f'_calculate_{value}')()
+                dirty.update(DEPENDENT_VALUES[value])
+                recalculated.add(value)
+        return recalculated
+
+    def _calculate_inflation(self):
+        self._inflation = inflation_to_many(self.calculator.inflation_calculator, self.steps.start_of_step)
+
+    def _calculate_turbine_cost(self):
+        self._turbine_cost = \
+            self.calculator.turbine_costs * self._inflation * self.fraction_of_spend
+
+    def _calculate_balance_of_plant_cost(self):
+        self._balance_of_plant_cost = \
+            self.calculator.balance_of_plant_costs_at_financial_close * self._inflation * self.fraction_of_spend
+
+    def _calculate_turbine_cost_including_margin(self):
+        self.steps.turbine_cost_including_margin[:] = self._including_margin(self._turbine_cost)
+
+    def _calculate_balance_of_plant_cost_including_margin(self):
+        self.steps.balance_of_plant_cost_including_margin[:] = \
+            self._including_margin(self._balance_of_plant_cost)
+
+    def _calculate_construction_profit(self):
+        if self.calculator.in_selling_mode:
+            self.steps.construction_profit[:] = \
+                -1 * \
+                (self._turbine_cost + self._balance_of_plant_cost) * \
+                self.calculator.epc_margin
+        else:
+            self.steps.construction_profit[:] = self._original_values['construction_profit']
+
+    def _calculate_milestones(self):
+        for name in MILESTONE_FIELDS:
+            getattr(self.steps, name)[self._financial_close] = \
+                self._original_values[name][self._financial_close]
+
+        self._financial_close = \
+            self.steps.start_of_step == as_datetime64(self.calculator.date_of_financial_close)
+
+        self.steps.special_capital_costs[self._financial_close] = self.calculator.special_capital_costs
+
+        if self.calculator.in_selling_mode == False:
+            self.steps.development_cost_if_owning[self._financial_close] = self.calculator.development_cost
+
+        self.steps.development_cost[self._financial_close] = self.calculator.development_cost
+
+    def _including_margin(self, cost: np.ndarray) -> np.ndarray:
+        if self.calculator.in_selling_mode:
+            return cost * (1 + self.calculator.epc_margin)
+        return cost
@@ -0,0 +1,175 @@
+import threading
+from datetime import datetime, date
+from functools import lru_cache
+import numpy as np
+
+# The inflation modes, which control how often inflation is compounded from
+# the date of financial close
+NO_INFLATION = 0
+ANNUAL_INFLATION = 1
+DAILY_INFLATION = 2
+MONTHLY_INFLATION = 3
+
+INFLATION_MODES = (NO_INFLATION, ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION)
+
+DAYS_PER_YEAR = 365.25
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# the most days the curve of an InflationIndex covers, which is 100 years
+CURVE_DAYS = 36_525
+
+
+# This class calculates the inflation index (1 at the date of financial close)
+# for any date, for a given inflation rate and mode. Inflation is calculated
+# on whole days, so the index is precomputed as a curve with one value per day,
+# covering all the dates that have been asked for so far. Looking up a date is
+# then just indexing in to the curve, and pow() is only called once per day
+# instead of once per step per calculator.
+# The curve only covers the CURVE_DAYS around the date of financial close (or
+# the first date asked for, if there isn't one), so that looking up a far off
+# date, such as datetime(9999, 12, 31), doesn't allocate a curve reaching it.
+# The inflation for dates outside this is calculated directly, with the same
+# calculation, so gives the same values.
+# Calculators with the same inflation parameters should share an index, using
+# shared_inflation_index, so that the curve is only calculated once. As the
+# index is shared it can be used from several threads at once, so the curve is
+# kept as one (first ordinal, curve) tuple, which is replaced as a whole when
+# the curve is extended, and readers only read it once.
+class InflationIndex:
+    def __init__(self, inflation_rate: float, inflation_mode: int, date_of_financial_close: datetime):
+        if inflation_mode not in INFLATION_MODES:
+            raise ValueError(f'Unknown inflation mode: {inflation_mode}')
+
+        self.inflation_rate = inflation_rate
+        self.inflation_mode = inflation_mode
+        self.date_of_financial_close = date_of_financial_close
+        self._curve = (0, np.empty(0))
+        self._first_coverable_ordinal = None
+        self._lock = threading.Lock()
+
+    def inflation_to(self, when: datetime) -> float:
+        if when is None:
+            return np.nan
+
+        ordinal = when.toordinal()
+        first_ordinal, curve = self._curve
+        offset = ordinal - first_ordinal
+        if not 0 <= offset < len(curve):
+            first_ordinal, curve = self._cover(ordinal, ordinal)
+            offset = ordinal - first_ordinal
+            if not 0 <= offset < len(curve):
+                return self._calculate(np.array([ordinal]))[0]
+
+        return curve[offset]
+
+    def inflation_to_many(self, dates: np.ndarray) -> np.ndarray:
+        known, ordinals = _ordinals(dates)
+
+        inflation = np.full(len(known), np.nan)
+        if len(ordinals) > 0:
+            first_ordinal, curve = self._cover(int(ordinals.min()), int(ordinals.max()))
+            offsets = ordinals - first_ordinal
+            on_curve = (offsets >= 0) & (offsets < len(curve))
+            values = np.empty(len(ordinals))
+            values[on_curve] = curve[offsets[on_curve]]
+            values[~on_curve] = self._calculate(ordinals[~on_curve])
+            inflation[known] = values
+        return inflation
+
+    def exponents(self, dates: np.ndarray) -> np.ndarray:
+        # the power that (1 + inflation_rate) is raised to for each date
+        days = np.asarray(dates, dtype='datetime64[D]')
+
+        if self.inflation_mode == NO_INFLATION or self.date_of_financial_close is None:
+            return np.where(np.isnat(days), np.nan, 0.0)
+
+        financial_close = np.datetime64(self.date_of_financial_close, 'D')
+
+        if self.inflation_mode == DAILY_INFLATION:
+            return (days - financial_close).astype(np.float64) / DAYS_PER_YEAR
+
+        months = _complete_months_between(financial_close, days)
+
+        if self.inflation_mode == MONTHLY_INFLATION:
+            return months / 12
+
+        return np.floor_divide(months, 12)
+
+    def rate_derivatives(self, dates: np.ndarray) -> np.ndarray:
+        # the derivative of the inflation index with respect to the inflation
+        # rate for each date, which is exponent * (1 + rate) ^ (exponent - 1)
+        exponents = self.exponents(dates)
+        return exponents * np.power(1 + self.inflation_rate, exponents - 1)
+
+    def _calculate(self, ordinals: np.ndarray) -> np.ndarray:
+        days = (ordinals - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+        return np.power(1 + self.inflation_rate, self.exponents(days))
+
+    def _cover(self, first_ordinal: int, last_ordinal: int) -> tuple:
+        # Extend the curve to include the dates that it can cover, at least
+        # doubling its length so that looking up dates one at a time doesn't
+        # recalculate it often, and return the curve
+        with self._lock:
+            if self._first_coverable_ordinal is None:
+                centre = first_ordinal if self.date_of_financial_close is None \
+                    else self.date_of_financial_close.toordinal()
+                self._first_coverable_ordinal = centre - CURVE_DAYS // 2
+            first_coverable = self._first_coverable_ordinal
+            last_coverable = first_coverable + CURVE_DAYS - 1
+
+            first_ordinal = max(first_ordinal, first_coverable)
+            last_ordinal = min(last_ordinal, last_coverable)
+            covered_first_ordinal, covered = self._curve
+            if first_ordinal > last_ordinal:
+                return self._curve
+
+            if len(covered) > 0:
+                last_covered = covered_first_ordinal + len(covered) - 1
+                if first_ordinal >= covered_first_ordinal and last_ordinal <= last_covered:
+                    return self._curve
+                if first_ordinal < covered_first_ordinal:
+                    first_ordinal = max(
+                        min(first_ordinal, covered_first_ordinal - len(covered)), first_coverable)
+                else:
+                    first_ordinal = covered_first_ordinal
+                if last_ordinal > last_covered:
+                    last_ordinal = min(max(last_ordinal, last_covered + len(covered)), last_coverable)
+                else:
+                    last_ordinal = last_covered
+
+            self._curve = (first_ordinal, self._calculate(np.arange(first_ordinal, last_ordinal + 1)))
+            return self._curve
+
+
+# Returns the InflationIndex for the parameters, creating it if there isn't one
+# already, so that calculators with the same parameters share the same curve
+@lru_cache(maxsize=128)
+def shared_inflation_index(
+        inflation_rate: float,
+        inflation_mode: int,
+        date_of_financial_close: datetime
+        ) -> InflationIndex:
+    return InflationIndex(inflation_rate, inflation_mode, date_of_financial_close)
+
+
+def _complete_months_between(start: np.datetime64, ends: np.ndarray) -> np.ndarray:
+    months = (ends.astype('datetime64[M]') - start.astype('datetime64[M]')).astype(np.float64)
+    start_day_of_month = start - start.astype('datetime64[M]')
+    end_day_of_month = ends - ends.astype('datetime64[M]')
+    months[end_day_of_month < start_day_of_month] -= 1
+    months[np.isnat(ends)] = np.nan
+    return months
+
+
+# Returns which dates are known (not None or NaT), and the ordinals of the known
+# dates. Lists of datetimes are converted with toordinal, which is much quicker
+# than converting them to a datetime64 array first.
+def _ordinals(dates) -> tuple:
+    if isinstance(dates, np.ndarray):
+        days = np.asarray(dates, dtype='datetime64[D]')
+        known = ~np.isnat(days)
+        return known, days[known].astype(np.int64) + UNIX_EPOCH_ORDINAL
+
+    dates = list(dates)
+    known = np.array([when is not None for when in dates], dtype=bool)
+    ordinals = np.array([when.toordinal() for when in dates if when is not None], dtype=np.int64)
+    return known, ordinals
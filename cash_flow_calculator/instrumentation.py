@@ -0,0 +1,116 @@
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Callable, List
+
+# One call to a calculator, which is passed to the hooks
+@dataclass
+class CalculatorCall:
+    calculator: str
+    seconds: float
+    steps: int
+    retry: bool
+    result: object
+
+
+# The totals for one calculator, over all its calls
+@dataclass
+class CalculatorStatistics:
+    calculator: str
+    calls: int = 0
+    retries: int = 0
+    steps: int = 0
+    seconds: float = 0
+
+
+# This class records how long each calculator takes, how many times it is
+# called, how many steps it calculates, and how many times it is called again
+# because it returned False (for the blackboard calculators).
+# The orchestrators (CashFlowStepCalculator and CashFlowStepsCalculator) take an
+# optional instrumentation, and wrap their calculators with it when one is
+# given, so there is no extra work at all when there isn't.
+# Each call is also passed to the hooks, so that it can be sent on to other
+# profiling tools.
+# The statistics are found from the calculator with weak references, so that
+# instrumenting a calculator doesn't keep it alive. Calculators that can't be
+# weakly referenced get new statistics each time they are instrumented.
+class CalculatorInstrumentation:
+    def __init__(self, hooks: List[Callable[[CalculatorCall], None]] = None):
+        self.hooks = hooks or []
+        self._statistics = []
+        self._statistics_by_calculator = weakref.WeakKeyDictionary()
+
+    def instrument(self, calculator) -> 'InstrumentedCalculator':
+        if isinstance(calculator, InstrumentedCalculator):
+            return calculator
+        return InstrumentedCalculator(calculator, self, self._statistics_for(calculator))
+
+    def _statistics_for(self, calculator) -> CalculatorStatistics:
+        try:
+            return self._statistics_by_calculator[calculator]
+        except KeyError:
+            pass
+        except TypeError:
+            return self._new_statistics(calculator)
+
+        statistics = self._new_statistics(calculator)
+        self._statistics_by_calculator[calculator] = statistics
+        return statistics
+
+    def _new_statistics(self, calculator) -> CalculatorStatistics:
+        statistics = CalculatorStatistics(type(calculator).__name__)
+        self._statistics.append(statistics)
+        return statistics
+
+    def record(self, statistics: CalculatorStatistics, seconds: float, steps: int, retry: bool, result):
+        statistics.calls += 1
+        statistics.retries += retry
+        statistics.steps += steps
+        statistics.seconds += seconds
+
+        if self.hooks:
+            call = CalculatorCall(statistics.calculator, seconds, steps, retry, result)
+            for hook in self.hooks:
+                hook(call)
+
+    # The statistics for each calculator, slowest first
+    def report(self) -> List[CalculatorStatistics]:
+        return sorted(self._statistics, key=lambda statistics: -statistics.seconds)
+
+
+# This class wraps a calculator, and records its calls with the
+# instrumentation. Everything else is passed through to the calculator, so the
+# orchestrators can use it in the same way (for example the inputs and outputs
+# of blackboard calculators). A call is a retry if the previous call to the
+# calculator returned False.
+class InstrumentedCalculator:
+    def __init__(self, calculator, instrumentation: CalculatorInstrumentation, statistics: CalculatorStatistics):
+        self.calculator = calculator
+        self.instrumentation = instrumentation
+        self.statistics = statistics
+        self._waiting = False
+
+    def calculate_step(self, step, fraction_of_spend: float):
+        return self._call(self.calculator.calculate_step, 1, step, fraction_of_spend)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.calculator, name)
+        if name in ('calculate_table', 'calculate_steps'):
+            return lambda steps, *arguments: self._call_with_steps(attribute, steps, *arguments)
+        return attribute
+
+    def _call_with_steps(self, function, steps, *arguments):
+        # steps can be a generator, which is read in to a list to count them
+        if not hasattr(steps, '__len__'):
+            steps = list(steps)
+        return self._call(function, len(steps), steps, *arguments)
+
+    def _call(self, function, steps: int, *arguments):
+        start = time.perf_counter()
+        result = function(*arguments)
+        seconds = time.perf_counter() - start
+
+        retry = self._waiting
+        self._waiting = result is False
+        self.instrumentation.record(self.statistics, seconds, steps, retry, result)
+        return result
@@ -0,0 +1,205 @@
+import math
+from functools import lru_cache
+from typing import Callable, List
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator)
+from cash_flow_calculator.execution_plan import build_execution_plan
+from cash_flow_calculator.inflation_index import NO_INFLATION
+
+# A kernel calculates a list of steps, like ConstructionMarginCalculator.calculate_steps
+Kernel = Callable[[list, float], None]
+
+# The number of kernels to keep, as each configuration of parameter values
+# generates a new function
+MAX_CACHED_KERNELS = 256
+
+
+# These functions generate a Python function that does the same calculation as
+# a calculator (or a chain of blackboard calculators) for a list of steps, but
+# specialised for the calculator's configuration. The parameters are written in
+# to the code as constants, the branches on in_selling_mode are decided when
+# the code is generated, inflation is left out when there isn't any, and the
+# properties calculated by one calculator in a chain are passed to the next in
+# local variables. The calculations are written exactly as in the calculators,
+# so the results are exactly the same.
+# Kernels are cached by the configuration of the calculators, so compiling the
+# same configuration again returns the same function. The least recently used
+# kernels are removed once there are MAX_CACHED_KERNELS of them.
+def compile_kernel(calculator) -> Kernel:
+    return compile_chain([calculator])
+
+
+def compile_chain(calculators: List[object]) -> Kernel:
+    return _compile_configuration(_Configuration(calculators))
+
+
+def kernel_source(calculators: List[object]) -> str:
+    return _KernelSource(build_execution_plan(calculators)).source()
+
+
+def _generate_kernel(calculators: List[object]) -> Kernel:
+    kernel = _KernelSource(calculators)
+    namespace = dict(kernel.namespace)
+    exec(compile(kernel.source(), '<construction margin kernel>', 'exec'), namespace)
+    return namespace['kernel']
+
+
+@lru_cache(maxsize=MAX_CACHED_KERNELS)
+def _compile_configuration(configuration: '_Configuration') -> Kernel:
+    return _generate_kernel(build_execution_plan(configuration.calculators))
+
+
+# The calculators of a kernel, which are equal to (and hash the same as) other
+# calculators with the same types and parameters, so they can be the key of
+# the cache of kernels
+class _Configuration:
+    def __init__(self, calculators: List[object]):
+        self.calculators = calculators
+        self._key = tuple(
+            (type(calculator),) + tuple(sorted(vars(calculator).items()))
+            for calculator in calculators)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _Configuration) and self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+
+# Builds the source code of a kernel, one calculator at a time
+class _KernelSource:
+    def __init__(self, calculators: List[object]):
+        self.namespace = {}
+        self._before_loop = []
+        self._loop = ['start_of_step = step.start_of_step']
+        self._locals = {}
+
+        for index, calculator in enumerate(calculators):
+            generate = _GENERATORS.get(type(calculator))
+            if generate is None:
+                raise ValueError(f'Cannot compile {type(calculator).__name__}')
+            generate(self, calculator, index)
+
+    def source(self) -> str:
+        lines = ['def kernel(steps, fraction_of_spend):']
+        lines += [f'    {line}' for line in self._before_loop]
+        lines += ['    for step in steps:']
+        lines += [f'        {line}' for line in self._loop]
+        return '\n'.join(lines) + '\n'
+
+    def global_value(self, name: str, value) -> str:
+        self.namespace[name] = value
+        return name
+
+    def before_loop(self, line: str):
+        self._before_loop.append(line)
+
+    def add(self, line: str):
+        self._loop.append(line)
+
+    def assign(self, field: str, expression: str):
+        self.add(f'{field} = {expression}')
+        self.add(f'step.{field} = {field}')
+        self._locals[field] = field
+
+    def read(self, field: str) -> str:
+        return self._locals.get(field, f'step.{field}')
+
+    def is_calculated(self, field: str) -> bool:
+        return field in self._locals
+
+
+def _constant(value) -> str:
+    if isinstance(value, bool) or value is None:
+        return repr(value)
+    if not math.isfinite(float(value)):
+        # repr gives nan or inf, which aren't Python expressions
+        return f"float('{float(value)!r}')"
+    if float(value).is_integer() and not isinstance(value, float):
+        return repr(int(value))
+    return repr(float(value))
+
+
+def _add_milestones(kernel: _KernelSource, calculator, index: int):
+    if calculator.date_of_financial_close is None:
+        return
+
+    date_of_financial_close = kernel.global_value(
+        f'date_of_financial_close_{index}',
+        calculator.date_of_financial_close)
+    kernel.add(f'if start_of_step == {date_of_financial_close}:')
+    kernel.add(f'    step.special_capital_costs = {_constant(calculator.special_capital_costs)}')
+    if calculator.in_selling_mode == False:
+        kernel.add(f'    step.development_cost_if_owning = {_constant(calculator.development_cost)}')
+    kernel.add(f'    step.development_cost = {_constant(calculator.development_cost)}')
+
+
+def _generate_construction_margin_calculator(kernel: _KernelSource, calculator: ConstructionMarginCalculator, index: int):
+    if calculator.inflation_mode == NO_INFLATION or calculator.date_of_financial_close is None:
+        # inflation is always 1, and multiplying by 1 doesn't change anything,
+        # so the costs are the same for every step, except for steps without a
+        # start, where the inflation (and so the costs) is NaN
+        turbine_cost = f'turbine_cost_{index}'
+        balance_of_plant_cost = f'balance_of_plant_cost_{index}'
+        for cost, value in (
+                (turbine_cost, _constant(calculator.turbine_costs)),
+                (balance_of_plant_cost, _constant(calculator.balance_of_plant_costs_at_financial_close))):
+            kernel.before_loop(f'{cost}_with_start = {value} * fraction_of_spend')
+            kernel.before_loop(f"{cost}_without_start = {value} * float('nan') * fraction_of_spend")
+            kernel.add(
+                f'{cost} = {cost}_with_start if start_of_step is not None else {cost}_without_start')
+    else:
+        inflation_to = kernel.global_value(f'inflation_to_{index}', calculator.inflation_index().inflation_to)
+        kernel.add(f'inflation = {inflation_to}(start_of_step)')
+        turbine_cost = f'{_constant(calculator.turbine_costs)} * inflation * fraction_of_spend'
+        balance_of_plant_cost = \
+            f'{_constant(calculator.balance_of_plant_costs_at_financial_close)} * inflation * fraction_of_spend'
+
+    _add_milestones(kernel, calculator, index)
+
+    if calculator.in_selling_mode:
+        kernel.add(f'turbine_cost = {turbine_cost}')
+        kernel.add(f'balance_of_plant_cost = {balance_of_plant_cost}')
+        kernel.assign(
+            'construction_profit',
+            f'-1 * (turbine_cost + balance_of_plant_cost) * {_constant(calculator.epc_margin)}')
+        margin = _constant(1 + calculator.epc_margin)
+        kernel.assign('turbine_cost_including_margin', f'turbine_cost * {margin}')
+        kernel.assign('balance_of_plant_cost_including_margin', f'balance_of_plant_cost * {margin}')
+    else:
+        kernel.assign('turbine_cost_including_margin', turbine_cost)
+        kernel.assign('balance_of_plant_cost_including_margin', balance_of_plant_cost)
+
+
+def _generate_blackboard_pattern(kernel: _KernelSource, calculator: ConstructionMarginCalculatorBlackboardPattern, index: int):
+    for field in ('turbine_cost_including_margin', 'balance_of_plant_cost_including_margin'):
+        if not kernel.is_calculated(field):
+            raise ValueError(f'No calculator in the chain calculates {field}')
+
+    _add_milestones(kernel, calculator, index)
+
+    if calculator.in_selling_mode:
+        kernel.assign(
+            'construction_profit',
+            f'-1 * '
+            f'({kernel.read("turbine_cost_including_margin")} + {kernel.read("balance_of_plant_cost_including_margin")}) * '
+            f'{_constant(calculator.epc_margin)}')
+
+
+def _generate_turbine_cost_calculator(kernel: _KernelSource, calculator: TurbineCostCalculator, index: int):
+    kernel.assign('turbine_cost_including_margin', '1')
+
+
+def _generate_balance_of_plant_calculator(kernel: _KernelSource, calculator: BalanceOfPlantCalculator, index: int):
+    kernel.assign('balance_of_plant_cost_including_margin', '1')
+
+
+_GENERATORS = {
+    ConstructionMarginCalculator: _generate_construction_margin_calculator,
+    ConstructionMarginCalculatorBlackboardPattern: _generate_blackboard_pattern,
+    TurbineCostCalculator: _generate_turbine_cost_calculator,
+    BalanceOfPlantCalculator: _generate_balance_of_plant_calculator,
+}
@@ -0,0 +1,63 @@
+from typing import List
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.execution_plan import outputs_of
+
+# This class is an alternative orchestrator for the blackboard calculators,
+# which pulls values on to the blackboard when they are needed, instead of
+# running every calculator in order.
+# The producers are calculators that calculate properties for other calculators
+# (such as TurbineCostCalculator), and the consumers are the calculators whose
+# results are wanted (such as ConstructionMarginCalculatorBlackboardPattern).
+# Only the consumers are run directly. When a calculator reads a property that
+# is None, the producer that outputs it is run there and then, so consumers
+# never have to return False and wait, and producers whose properties nobody
+# reads are never run. Each producer runs at most once per step.
+class LazyCashFlowStepCalculator:
+    def __init__(self, producers: List[object], consumers: List[object]):
+        self.producers = producers
+        self.consumers = consumers
+        self._producer_of = {}
+        for producer in producers:
+            for output in outputs_of(producer):
+                if output in self._producer_of:
+                    raise ValueError(f'{output} is produced by more than one calculator')
+                self._producer_of[output] = producer
+
+    def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
+        lazy_step = LazyCashFlowStep(step, fraction_of_spend, self._producer_of)
+
+        for consumer in self.consumers:
+            if consumer.calculate_step(lazy_step, fraction_of_spend) == False:
+                raise ValueError(f'{type(consumer).__name__} could not calculate the step')
+
+
+# This class wraps a CashFlowStep, and runs the producer of any property that is
+# read while it is None. Everything that is written goes straight to the step.
+class LazyCashFlowStep:
+    __slots__ = ('_step', '_fraction_of_spend', '_producer_of', '_produced', '_producing')
+
+    def __init__(self, step: CashFlowStep, fraction_of_spend: float, producer_of: dict):
+        object.__setattr__(self, '_step', step)
+        object.__setattr__(self, '_fraction_of_spend', fraction_of_spend)
+        object.__setattr__(self, '_producer_of', producer_of)
+        object.__setattr__(self, '_produced', set())
+        object.__setattr__(self, '_producing', set())
+
+    def __getattr__(self, name: str):
+        value = getattr(self._step, name)
+        producer = self._producer_of.get(name)
+
+        if value is None and producer is not None and id(producer) not in self._produced:
+            if id(producer) in self._producing:
+                raise ValueError(f'{type(producer).__name__} depends on its own output {name}')
+
+            self._producing.add(id(producer))
+            producer.calculate_step(self, self._fraction_of_spend)
+            self._producing.discard(id(producer))
+            self._produced.add(id(producer))
+            value = getattr(self._step, name)
+
+        return value
+
+    def __setattr__(self, name: str, value):
+        setattr(self._step, name, value)
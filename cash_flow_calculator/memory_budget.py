@@ -0,0 +1,146 @@
+import tracemalloc
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.memory_estimate import DEFAULT_HEADROOM, estimate_bytes_per_step
+from cash_flow_calculator.streaming_cash_flow_steps_calculator import calculate_chunk, calculate_chunk_table
+
+DEFAULT_INITIAL_CHUNK_SIZE = 1_000
+
+# Every this many chunks is measured with tracemalloc (starting with the first)
+DEFAULT_SAMPLE_INTERVAL = 8
+
+
+# The memory used by a MemoryBudgetedCashFlowStepsCalculator, as measured with
+# tracemalloc while the sampled chunks were read and calculated.
+# chunk_peak_bytes has the peak of each chunk, which is None for the chunks that
+# weren't measured.
+@dataclass
+class MemoryReport:
+    memory_budget: int
+    bytes_per_step: float = 0.0
+    peak_bytes: int = 0
+    chunk_sizes: List[int] = field(default_factory=list)
+    chunk_peak_bytes: List[Optional[int]] = field(default_factory=list)
+
+    @property
+    def measured_chunks(self) -> int:
+        return sum(peak is not None for peak in self.chunk_peak_bytes)
+
+    @property
+    def chunks_over_budget(self) -> int:
+        return sum(peak is not None and peak > self.memory_budget for peak in self.chunk_peak_bytes)
+
+
+# This class does the same as StreamingCashFlowStepsCalculator, but instead of
+# a fixed chunk size it is given a memory budget (in bytes), and sizes each chunk
+# so that reading and calculating it fits in the budget.
+# The first chunk is sized from an estimate of the memory used per step (by the
+# CashFlowStep objects, the columns of a CashFlowStepTable and the intermediate
+# columns of the calculator, see estimate_bytes_per_step), and is no bigger than
+# initial_chunk_size. Tracing allocations slows the calculation down a lot, so
+# only a sample of the chunks (the first, and then every sample_interval'th) is
+# measured with tracemalloc. The next chunk is sized from the memory per step of
+# the last measured chunk, growing by at most double each time, so a chunk that
+# uses more memory than expected (for example when a cache like the inflation
+# curve grows) makes the next one smaller, and the chunks grow back again
+# afterwards. Only headroom (a fraction) of the budget is planned for, to allow
+# for the memory per step varying between chunks.
+# If tracemalloc is already tracing (for example in the benchmarks), it is left
+# as it is, and a chunk is only measured if it raises the peak of that session.
+# The budget is for the steps of one chunk, so any steps kept by the caller are
+# on top of it.
+class MemoryBudgetedCashFlowStepsCalculator:
+    def __init__(
+            self,
+            steps: Iterable[CashFlowStep],
+            memory_budget: int,
+            initial_chunk_size: int = DEFAULT_INITIAL_CHUNK_SIZE,
+            headroom: float = DEFAULT_HEADROOM,
+            sample_interval: int = DEFAULT_SAMPLE_INTERVAL
+        ):
+        if memory_budget < 1:
+            raise ValueError('memory_budget must be at least 1 byte')
+        if not 0 < headroom <= 1:
+            raise ValueError('headroom must be more than 0 and at most 1')
+        if sample_interval < 1:
+            raise ValueError('sample_interval must be at least 1')
+
+        self.steps = steps
+        self.memory_budget = memory_budget
+        self.initial_chunk_size = initial_chunk_size
+        self.headroom = headroom
+        self.sample_interval = sample_interval
+        self.report = MemoryReport(memory_budget)
+
+    # Yields the steps once they have been calculated
+    def calculate_step(self, calculator, fraction_of_spend: float) -> Iterator[CashFlowStep]:
+        for chunk in self._chunks(calculator, lambda chunk: calculate_chunk(chunk, calculator, fraction_of_spend)):
+            yield from chunk
+
+    # Yields each chunk of steps as a calculated CashFlowStepTable
+    def calculate_chunks(self, calculator, fraction_of_spend: float) -> Iterator[CashFlowStepTable]:
+        yield from self._chunks(calculator, lambda chunk: calculate_chunk_table(chunk, calculator, fraction_of_spend))
+
+    def _chunks(self, calculator, calculate: Callable[[List[CashFlowStep]], object]):
+        self.report = MemoryReport(self.memory_budget, bytes_per_step=estimate_bytes_per_step(calculator))
+        steps = iter(self.steps)
+
+        while True:
+            chunk_size = self._next_chunk_size()
+
+            def read_and_calculate():
+                chunk = list(islice(steps, chunk_size))
+                return chunk, calculate(chunk) if chunk else None
+
+            if len(self.report.chunk_sizes) % self.sample_interval == 0:
+                (chunk, result), peak = _measure(read_and_calculate)
+            else:
+                (chunk, result), peak = read_and_calculate(), None
+            if not chunk:
+                return
+
+            self._record(len(chunk), peak)
+            yield chunk if result is None else result
+
+    def _next_chunk_size(self) -> int:
+        planned = int(self.memory_budget * self.headroom / self.report.bytes_per_step)
+        if self.report.chunk_sizes:
+            planned = min(planned, 2 * self.report.chunk_sizes[-1])
+        else:
+            planned = min(planned, self.initial_chunk_size)
+        return max(planned, 1)
+
+    def _record(self, chunk_size: int, peak: Optional[int]):
+        self.report.chunk_sizes.append(chunk_size)
+        self.report.chunk_peak_bytes.append(peak)
+        if peak is None:
+            return
+
+        self.report.peak_bytes = max(self.report.peak_bytes, peak)
+        self.report.bytes_per_step = max(peak / chunk_size, 1)
+
+
+# Calls the function, and returns its result and the most memory allocated
+# while it ran. tracemalloc is started and stopped again, unless it is already
+# tracing, in which case its peak is someone else's, and isn't reset. Then the
+# peak of the function is only known if it raised the peak of the session, and
+# otherwise it is None.
+def _measure(function: Callable[[], object]):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    before, peak_before = tracemalloc.get_traced_memory()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    if not started and peak == peak_before:
+        return result, None
+    return result, peak - before
@@ -0,0 +1,42 @@
+import sys
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS
+
+DEFAULT_HEADROOM = 0.8
+
+# The number of temporary float64 columns that calculate_table creates, such as
+# the inflation of each step and the intermediate results of the arithmetic
+TABLE_INTERMEDIATE_COLUMNS = 4
+
+
+# An estimate of the memory used to calculate one step: a CashFlowStep with all
+# its values set, plus its row of a CashFlowStepTable and the calculator's
+# intermediate columns, if the calculator calculates tables. If the steps are
+# already in memory, the CashFlowStep itself isn't counted, but its values and
+# the table row still are, so the estimate is on the high side.
+def estimate_bytes_per_step(calculator, steps_in_memory: bool = False) -> float:
+    step = CashFlowStep(datetime(2020, 1, 1), *(1.0 for _ in VALUE_FIELDS))
+    estimate = sum(sys.getsizeof(value) for value in vars(step).values())
+    if not steps_in_memory:
+        # the step, and the pointer to it in the chunk list
+        estimate += sys.getsizeof(step) + sys.getsizeof(vars(step)) + 8
+
+    if hasattr(calculator, 'calculate_table'):
+        row = CashFlowStepTable.empty(1)
+        estimate += sum(column.itemsize for column in row.columns().values())
+        estimate += TABLE_INTERMEDIATE_COLUMNS * 8
+    return estimate
+
+
+# The most steps that fit in headroom (a fraction) of the memory budget, from
+# the estimate of the memory used per step
+def chunk_size_for_budget(
+        calculator,
+        memory_budget: int,
+        steps_in_memory: bool = False,
+        headroom: float = DEFAULT_HEADROOM
+        ) -> int:
+    if memory_budget < 1:
+        raise ValueError('memory_budget must be at least 1 byte')
+    return max(int(memory_budget * headroom / estimate_bytes_per_step(calculator, steps_in_memory)), 1)
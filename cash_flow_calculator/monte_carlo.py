@@ -0,0 +1,238 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Sequence, Union
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.scenario_grid import ScenarioGrid, SCENARIO_PARAMETERS
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_RESERVOIR_SIZE = 10_000
+DEFAULT_FIELDS = ('construction_profit',)
+
+
+# The distributions that the uncertain parameters can be sampled from
+@dataclass(frozen=True)
+class Normal:
+    mean: float
+    standard_deviation: float
+
+    def sample(self, random: np.random.Generator, size: int) -> np.ndarray:
+        return random.normal(self.mean, self.standard_deviation, size)
+
+
+@dataclass(frozen=True)
+class Uniform:
+    low: float
+    high: float
+
+    def sample(self, random: np.random.Generator, size: int) -> np.ndarray:
+        return random.uniform(self.low, self.high, size)
+
+
+@dataclass(frozen=True)
+class Triangular:
+    low: float
+    mode: float
+    high: float
+
+    def sample(self, random: np.random.Generator, size: int) -> np.ndarray:
+        return random.triangular(self.low, self.mode, self.high, size)
+
+
+Distribution = Union[Normal, Uniform, Triangular]
+
+
+# This class keeps the count, mean and variance of a stream of values (which
+# can be arrays, such as one value per step), and a random sample of them
+# for estimating quantiles, without keeping the values themselves.
+# The mean and variance are combined batch by batch (Chan et al.'s parallel
+# version of Welford's algorithm), so they are as accurate as calculating them
+# from all the values at once. The sample is a reservoir of at most
+# reservoir_size values: each value is given a random key, and the values with
+# the smallest keys are kept, which is a uniform random sample of all of them.
+# The quantiles are exact while there are no more values than the reservoir.
+# With a reservoir_size of 0 no sample is kept, and there are no quantiles.
+class StreamingStatistics:
+    def __init__(self, random: np.random.Generator, reservoir_size: int = DEFAULT_RESERVOIR_SIZE):
+        self.count = 0
+        self.mean = None
+        self._sum_of_squares = None
+        self._random = random
+        self._reservoir_size = reservoir_size
+        self._keys = np.empty(0)
+        self._sample = None
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+
+        mean = values.mean(axis=0)
+        sum_of_squares = ((values - mean) ** 2).sum(axis=0)
+
+        if self.count == 0:
+            self.mean, self._sum_of_squares = mean, sum_of_squares
+        else:
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean = self.mean + delta * (count / total)
+            self._sum_of_squares = \
+                self._sum_of_squares + sum_of_squares + delta * delta * (self.count * count / total)
+        self.count += count
+
+        self._add_to_sample(values)
+
+    @property
+    def variance(self) -> np.ndarray:
+        # the sample variance, which is unbiased
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self._sum_of_squares / (self.count - 1)
+
+    @property
+    def standard_deviation(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def quantile(self, q):
+        if self._sample is None:
+            raise ValueError('There is no sample to estimate quantiles from')
+        return np.quantile(self._sample, q, axis=0)
+
+    def _add_to_sample(self, values: np.ndarray):
+        if self._reservoir_size == 0:
+            return
+
+        keys = self._random.random(len(values))
+
+        if len(self._keys) < self._reservoir_size:
+            keys = np.concatenate([self._keys, keys])
+            sample = values.copy() if self._sample is None else np.concatenate([self._sample, values])
+            if len(keys) > self._reservoir_size:
+                kept = np.argpartition(keys, self._reservoir_size - 1)[:self._reservoir_size]
+                keys, sample = keys[kept], sample[kept]
+            self._keys, self._sample = keys, sample
+            return
+
+        # only values with a smaller key than one already kept can get in, and
+        # they replace the kept values with the largest keys, in place
+        candidates = np.flatnonzero(keys < self._keys.max())
+        if len(candidates) == 0:
+            return
+        all_keys = np.concatenate([self._keys, keys[candidates]])
+        kept = np.argpartition(all_keys, self._reservoir_size - 1)[:self._reservoir_size]
+        replaced = np.setdiff1d(np.arange(self._reservoir_size), kept[kept < self._reservoir_size])
+        added = candidates[kept[kept >= self._reservoir_size] - self._reservoir_size]
+        self._keys[replaced] = keys[added]
+        self._sample[replaced] = values[added]
+
+
+# The results of a MonteCarloSimulation. steps has the statistics of each field
+# for every step (so its mean is one value per step), and totals has the
+# statistics of the total of each field over all the steps of a path.
+class MonteCarloResult:
+    def __init__(
+            self,
+            number_of_paths: int,
+            steps: Dict[str, StreamingStatistics],
+            totals: Dict[str, StreamingStatistics]
+        ):
+        self.number_of_paths = number_of_paths
+        self.steps = steps
+        self.totals = totals
+
+    # The P10, P50 and P90 (by default) of the total of a field
+    def percentiles(self, name: str, percentiles: Sequence[float] = (10, 50, 90)) -> Dict[float, float]:
+        values = self.totals[name].quantile(np.asarray(percentiles) / 100)
+        return dict(zip(percentiles, values.tolist()))
+
+
+# This class calculates the construction margin for many random paths, where
+# each of the ScenarioGrid parameters that can vary between scenarios (apart
+# from in_selling_mode) can be a Distribution instead of a value.
+# The paths are calculated batch_size at a time, as the scenarios of a
+# ScenarioGrid, and each batch is added to streaming statistics and then
+# discarded, so memory use depends on the batch size and the number of steps,
+# but not on the number of paths. Only the totals keep a sample for their
+# quantiles by default, as a sample of the steps has a value for every step of
+# each path. Passing a step_reservoir_size keeps a sample of that many paths for
+# the quantiles of each step as well.
+# Each distribution is sampled from its own random number generator, created
+# from the seed, so the same seed always gives the same paths.
+class MonteCarloSimulation:
+    def __init__(
+            self,
+            balance_of_plant_costs_at_financial_close: Union[float, Distribution],
+            development_cost: float,
+            turbine_costs: Union[float, Distribution],
+            special_capital_costs: float,
+            date_of_financial_close: datetime,
+            in_selling_mode: bool,
+            epc_margin: Union[float, Distribution],
+            inflation_rate: Union[float, Distribution],
+            inflation_mode: int,
+            seed: int = None,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            reservoir_size: int = DEFAULT_RESERVOIR_SIZE,
+            step_reservoir_size: int = 0,
+            fields: Sequence[str] = DEFAULT_FIELDS
+        ):
+        self.parameters = {
+            'balance_of_plant_costs_at_financial_close': balance_of_plant_costs_at_financial_close,
+            'development_cost': development_cost,
+            'turbine_costs': turbine_costs,
+            'special_capital_costs': special_capital_costs,
+            'date_of_financial_close': date_of_financial_close,
+            'in_selling_mode': in_selling_mode,
+            'epc_margin': epc_margin,
+            'inflation_rate': inflation_rate,
+            'inflation_mode': inflation_mode,
+        }
+        for name, value in self.parameters.items():
+            if hasattr(value, 'sample') and (name not in SCENARIO_PARAMETERS or name == 'in_selling_mode'):
+                raise ValueError(f'{name} cannot be a distribution')
+
+        self.seed = seed
+        self.batch_size = batch_size
+        self.reservoir_size = reservoir_size
+        self.step_reservoir_size = step_reservoir_size
+        self.fields = tuple(fields)
+
+    def run(self, table: CashFlowStepTable, fraction_of_spend: float, number_of_paths: int) -> MonteCarloResult:
+        generators = [
+            np.random.default_rng(seed)
+            for seed in np.random.SeedSequence(self.seed).spawn(len(self.parameters) + 2 * len(self.fields))
+        ]
+        samplers = {
+            name: generator
+            for (name, value), generator in zip(self.parameters.items(), generators)
+            if hasattr(value, 'sample')
+        }
+        generators = generators[len(self.parameters):]
+        steps = {
+            name: StreamingStatistics(generator, self.step_reservoir_size)
+            for name, generator in zip(self.fields, generators[:len(self.fields)])
+        }
+        totals = {
+            name: StreamingStatistics(generator, self.reservoir_size)
+            for name, generator in zip(self.fields, generators[len(self.fields):])
+        }
+
+        remaining = number_of_paths
+        while remaining > 0:
+            size = min(self.batch_size, remaining)
+            remaining -= size
+
+            result = ScenarioGrid(**{
+                name: value.sample(samplers[name], size) if name in samplers else value
+                for name, value in self.parameters.items()
+            }).calculate_table(table, fraction_of_spend)
+
+            for name in self.fields:
+                # if none of the parameters are distributions, there is one
+                # scenario, which is the same for every path
+                values = np.broadcast_to(getattr(result, name), (size, len(table)))
+                steps[name].add(values)
+                totals[name].add(np.nansum(values, axis=1))
+
+        return MonteCarloResult(number_of_paths, steps, totals)
@@ -0,0 +1,143 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, CASH_FLOW_STEP_FIELDS
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+from cash_flow_calculator.memory_estimate import chunk_size_for_budget
+
+# Where each column of a CashFlowStepTable is in a block of shared memory, as
+# (offset, dtype, length) for each CashFlowStep property
+ColumnLayout = Dict[str, Tuple[int, str, int]]
+
+
+# A project in a portfolio, which is a calculator (anything that
+# CashFlowStepsCalculator can use) and the steps to calculate with it
+@dataclass
+class Project:
+    calculator: object
+    steps: CashFlowStepTable
+    fraction_of_spend: float
+
+
+# This class calculates a portfolio of projects in parallel, using a pool of
+# processes. The steps of all the projects are copied in to one block of shared
+# memory, which the worker processes calculate in place, so only the calculators
+# and the positions of the steps are sent to the workers, not the steps
+# themselves. Large projects can be split in to chunks of steps, so that they
+# are spread across the workers too.
+# Each step is calculated by exactly one worker, with the same
+# CashFlowStepsCalculator that would be used in a single process, so the results
+# are the same as calculating the projects one after the other.
+# A pool of processes is started for each run, unless an executor is passed, so
+# that one pool can be used for many runs.
+# If a memory budget (in bytes) is passed, it is the most memory that each
+# worker should use to calculate a chunk, and the projects are split in to
+# chunks that fit in it (see chunk_size_for_budget), or chunk_size, if that is
+# smaller. The steps themselves are in shared memory, so aren't included.
+class PortfolioRunner:
+    def __init__(self, max_workers: int = None, chunk_size: int = None, memory_budget: int = None):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.memory_budget = memory_budget
+
+    def run(self, projects: List[Project], executor: Executor = None):
+        layouts, size = _layout_columns([project.steps for project in projects])
+        shared_memory = SharedMemory(create=True, size=max(size, 1))
+
+        try:
+            for project, layout in zip(projects, layouts):
+                _copy_columns(project.steps, _attach_columns(shared_memory, layout))
+
+            if executor is None:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    self._calculate(projects, layouts, shared_memory, executor)
+            else:
+                self._calculate(projects, layouts, shared_memory, executor)
+
+            for project, layout in zip(projects, layouts):
+                _copy_columns(_attach_columns(shared_memory, layout), project.steps)
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    def _calculate(
+            self,
+            projects: List[Project],
+            layouts: List[ColumnLayout],
+            shared_memory: SharedMemory,
+            executor: Executor):
+        futures = [
+            executor.submit(
+                _calculate_chunk,
+                shared_memory.name,
+                layout,
+                start,
+                stop,
+                project.calculator,
+                project.fraction_of_spend)
+            for project, layout in zip(projects, layouts)
+            for start, stop in self._chunks(len(project.steps), project.calculator)
+        ]
+        for future in futures:
+            future.result()
+
+    def _chunks(self, length: int, calculator):
+        chunk_size = self.chunk_size or max(length, 1)
+        if self.memory_budget is not None:
+            chunk_size = min(chunk_size, chunk_size_for_budget(calculator, self.memory_budget, steps_in_memory=True))
+        for start in range(0, length, chunk_size):
+            yield start, min(start + chunk_size, length)
+
+
+def _calculate_chunk(
+        shared_memory_name: str,
+        layout: ColumnLayout,
+        start: int,
+        stop: int,
+        calculator,
+        fraction_of_spend: float):
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        _calculate_steps(
+            _attach_columns(shared_memory, layout),
+            start,
+            stop,
+            calculator,
+            fraction_of_spend)
+    finally:
+        shared_memory.close()
+
+
+def _calculate_steps(
+        columns: CashFlowStepTable,
+        start: int,
+        stop: int,
+        calculator,
+        fraction_of_spend: float):
+    CashFlowStepsCalculator(columns.rows(start, stop)).calculate_step(calculator, fraction_of_spend)
+
+
+def _layout_columns(tables: List[CashFlowStepTable]) -> Tuple[List[ColumnLayout], int]:
+    layouts = []
+    offset = 0
+    for table in tables:
+        layout = {}
+        for name, column in table.columns().items():
+            layout[name] = (offset, column.dtype.str, len(column))
+            offset += column.nbytes
+        layouts.append(layout)
+    return layouts, offset
+
+
+def _attach_columns(shared_memory: SharedMemory, layout: ColumnLayout) -> CashFlowStepTable:
+    return CashFlowStepTable(**{
+        name: np.ndarray((length,), dtype=dtype, buffer=shared_memory.buf, offset=offset)
+        for name, (offset, dtype, length) in layout.items()
+    })
+
+
+def _copy_columns(source: CashFlowStepTable, destination: CashFlowStepTable):
+    for name in CASH_FLOW_STEP_FIELDS:
+        getattr(destination, name)[:] = getattr(source, name)
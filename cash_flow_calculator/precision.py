@@ -0,0 +1,202 @@
+from typing import Dict, Sequence
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_FIELD, VALUE_FIELDS, as_datetime64
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+
+# The precisions that money values can be calculated and stored with
+FLOAT64 = 'float64'
+FLOAT32 = 'float32'
+FIXED_POINT = 'fixed_point'
+
+PRECISIONS = (FLOAT64, FLOAT32, FIXED_POINT)
+
+# The number of minor units (such as cents) in each unit of money
+DEFAULT_MINOR_UNITS = 100
+
+# Fixed point values can't be NaN, so None is stored as the smallest int64
+MISSING = np.iinfo(np.int64).min
+
+# The properties set by the construction margin calculators
+CONSTRUCTION_MARGIN_FIELDS = (
+    'special_capital_costs',
+    'development_cost_if_owning',
+    'development_cost',
+    'turbine_cost_including_margin',
+    'construction_profit',
+    'balance_of_plant_cost_including_margin')
+
+
+# This class stores the money values of a CashFlowStepTable as whole numbers of
+# minor units (such as cents) in int64 columns, so that adding them up is exact,
+# for audited outputs, without the cost of Decimal.
+# Values are converted to minor units by rounding to the nearest whole number,
+# with halves rounded to the nearest even number (banker's rounding), which
+# doesn't bias totals up or down, so every converted value is within half a
+# minor unit of the float64 value.
+class FixedPointTable:
+    def __init__(self, minor_units: int = DEFAULT_MINOR_UNITS, **columns: np.ndarray):
+        self.minor_units = minor_units
+        for name in (DATE_FIELD,) + VALUE_FIELDS:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def from_table(cls, table: CashFlowStepTable, minor_units: int = DEFAULT_MINOR_UNITS) -> 'FixedPointTable':
+        columns = {DATE_FIELD: table.start_of_step.copy()}
+        for name in VALUE_FIELDS:
+            columns[name] = to_minor_units(getattr(table, name), minor_units)
+        return cls(minor_units, **columns)
+
+    def __len__(self) -> int:
+        return len(self.start_of_step)
+
+    def to_table(self) -> CashFlowStepTable:
+        columns = {DATE_FIELD: self.start_of_step.copy()}
+        for name in VALUE_FIELDS:
+            columns[name] = from_minor_units(getattr(self, name), self.minor_units)
+        return CashFlowStepTable(**columns)
+
+    # The exact total of a property in minor units, ignoring values that are None
+    def total(self, name: str) -> int:
+        column = getattr(self, name)
+        return int(column[column != MISSING].sum())
+
+
+def to_minor_units(values: np.ndarray, minor_units: int = DEFAULT_MINOR_UNITS) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    return np.where(missing, MISSING, np.rint(np.where(missing, 0, values) * minor_units).astype(np.int64))
+
+
+def from_minor_units(values: np.ndarray, minor_units: int = DEFAULT_MINOR_UNITS) -> np.ndarray:
+    return np.where(values == MISSING, np.nan, values / minor_units)
+
+
+# Calculates a copy of the table with the calculator, with the precision.
+# float32 halves the memory of the table (and the time to move it around), and
+# calculators that calculate whole tables (such as ConstructionMarginCalculator)
+# calculate it in float32. Fixed point tables are calculated in whole minor
+# units, with calculate_fixed_point.
+def calculate_with_precision(
+        calculator,
+        table: CashFlowStepTable,
+        fraction_of_spend: float,
+        precision: str,
+        minor_units: int = DEFAULT_MINOR_UNITS
+        ):
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision: {precision}')
+
+    if precision == FIXED_POINT:
+        return calculate_fixed_point(calculator, table, fraction_of_spend, minor_units)
+
+    calculated = table.astype(np.float32 if precision == FLOAT32 else np.float64)
+    CashFlowStepsCalculator(calculated).calculate_step(calculator, fraction_of_spend)
+    return calculated
+
+
+# Calculates a ConstructionMarginCalculator in whole minor units. The costs are
+# converted to minor units, and each product is rounded to minor units (half to
+# even) as it is calculated, so every value, including the construction profit,
+# is calculated from values that are already whole minor units, as they would be
+# in an audited calculation. The products are calculated in float64, which is
+# exact for up to 2**53 minor units.
+def calculate_fixed_point(
+        calculator,
+        table: CashFlowStepTable,
+        fraction_of_spend: float,
+        minor_units: int = DEFAULT_MINOR_UNITS
+        ) -> FixedPointTable:
+    if not hasattr(calculator, 'calculate_inflations'):
+        raise ValueError(f'{type(calculator).__name__} cannot be calculated in fixed point')
+
+    result = FixedPointTable.from_table(table, minor_units)
+    inflation = calculator.calculate_inflations(table.start_of_step)
+
+    at_financial_close = table.start_of_step == as_datetime64(calculator.date_of_financial_close)
+
+    result.special_capital_costs[at_financial_close] = \
+        to_minor_units(calculator.special_capital_costs, minor_units)
+
+    if calculator.in_selling_mode == False:
+        result.development_cost_if_owning[at_financial_close] = \
+            to_minor_units(calculator.development_cost, minor_units)
+
+    result.development_cost[at_financial_close] = to_minor_units(calculator.development_cost, minor_units)
+
+    turbine_cost = _multiply(
+        to_minor_units(calculator.turbine_costs, minor_units), inflation, fraction_of_spend)
+
+    balance_of_plant_cost = _multiply(
+        to_minor_units(calculator.balance_of_plant_costs_at_financial_close, minor_units), inflation, fraction_of_spend)
+
+    if calculator.in_selling_mode:
+        missing = (turbine_cost == MISSING) | (balance_of_plant_cost == MISSING)
+        result.construction_profit[:] = _multiply(
+            np.where(missing, MISSING, -1 * (turbine_cost + balance_of_plant_cost)),
+            calculator.epc_margin)
+
+        turbine_cost = _multiply(turbine_cost, 1 + calculator.epc_margin)
+
+        balance_of_plant_cost = _multiply(balance_of_plant_cost, 1 + calculator.epc_margin)
+
+    result.turbine_cost_including_margin[:] = turbine_cost
+    result.balance_of_plant_cost_including_margin[:] = balance_of_plant_cost
+    return result
+
+
+# Multiplies whole minor units by the factors, and rounds the product to whole
+# minor units. Products of missing values, or with NaN factors, are missing.
+def _multiply(values: np.ndarray, *factors) -> np.ndarray:
+    product = values.astype(np.float64)
+    for factor in factors:
+        product = product * factor
+    missing = (values == MISSING) | np.isnan(product)
+    return np.where(missing, MISSING, np.rint(np.where(missing, 0, product)).astype(np.int64))
+
+
+# Calculates the table with each precision, and compares the construction
+# margin properties to the float64 results. For each precision and property,
+# the report has the largest absolute and relative difference of any step,
+# the difference in the total over all the steps, and the bytes used for each
+# value (so a step of the table uses bytes_per_value for each of VALUE_FIELDS).
+def accuracy_report(
+        calculator,
+        table: CashFlowStepTable,
+        fraction_of_spend: float,
+        precisions: Sequence[str] = PRECISIONS,
+        minor_units: int = DEFAULT_MINOR_UNITS
+        ) -> Dict[str, Dict[str, Dict[str, float]]]:
+    reference = calculate_with_precision(calculator, table, fraction_of_spend, FLOAT64)
+
+    report = {}
+    for precision in precisions:
+        result = calculate_with_precision(calculator, table, fraction_of_spend, precision, minor_units)
+        report[precision] = {
+            name: _compare(getattr(reference, name), result, name)
+            for name in CONSTRUCTION_MARGIN_FIELDS
+        }
+    return report
+
+
+def _compare(expected: np.ndarray, result, name: str) -> Dict[str, float]:
+    if isinstance(result, FixedPointTable):
+        actual = from_minor_units(getattr(result, name), result.minor_units)
+        total = result.total(name) / result.minor_units
+    else:
+        actual = getattr(result, name).astype(np.float64)
+        total = float(np.nansum(getattr(result, name), dtype=np.float64))
+
+    known = ~np.isnan(expected)
+    if (np.isnan(actual) != ~known).any():
+        raise ValueError(f'{name} has different missing values to the float64 results')
+
+    difference = np.abs(actual[known] - expected[known])
+    magnitude = np.abs(expected[known])
+    relative = np.divide(difference, magnitude, out=np.zeros_like(difference), where=magnitude > 0)
+
+    return {
+        'max_absolute_error': float(difference.max()) if len(difference) else 0.0,
+        'max_relative_error': float(relative.max()) if len(relative) else 0.0,
+        'total_error': abs(total - float(np.nansum(expected))),
+        'bytes_per_value': getattr(result, name).itemsize,
+    }
@@ -0,0 +1,184 @@
+from datetime import datetime
+from typing import Dict, Tuple
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS, as_datetime64
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+
+# The frequencies that a timeline can be resampled to
+MONTHLY = 'monthly'
+QUARTERLY = 'quarterly'
+ANNUAL = 'annual'
+
+FREQUENCIES = (MONTHLY, QUARTERLY, ANNUAL)
+
+# The properties that are spent in every step, in proportion to the number of
+# steps, as opposed to the milestones that are only set once
+SPEND_FIELDS = (
+    'turbine_cost_including_margin',
+    'balance_of_plant_cost_including_margin',
+    'construction_profit')
+
+
+# This class groups the steps of a timeline (which must be in date order) in to
+# calendar months, quarters or years, which are called buckets. The step that
+# starts on the date of financial close is always a bucket on its own, so that
+# the milestones, and the inflation at financial close, are exactly the same in
+# a coarse timeline as in the full timeline.
+class ResampledTimeline:
+    def __init__(self, start_of_steps: np.ndarray, frequency: str, date_of_financial_close: datetime = None):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f'Unknown frequency: {frequency}')
+
+        start_of_steps = np.asarray(start_of_steps, dtype='datetime64[us]')
+        if np.isnat(start_of_steps).any():
+            raise ValueError('Every step must have a start_of_step to be resampled')
+        if (start_of_steps[1:] < start_of_steps[:-1]).any():
+            raise ValueError('The steps must be in date order to be resampled')
+
+        self.frequency = frequency
+        self.start_of_steps = start_of_steps
+
+        periods = _periods(start_of_steps, frequency)
+        starts_bucket = np.ones(len(start_of_steps), dtype=bool)
+        starts_bucket[1:] = periods[1:] != periods[:-1]
+
+        if date_of_financial_close is not None:
+            at_financial_close = np.flatnonzero(start_of_steps == as_datetime64(date_of_financial_close))
+            starts_bucket[at_financial_close] = True
+            after_financial_close = at_financial_close + 1
+            starts_bucket[after_financial_close[after_financial_close < len(start_of_steps)]] = True
+
+        # the positions of the first and last step of each bucket in the full timeline
+        self.first = np.flatnonzero(starts_bucket)
+        self.last = np.append(self.first[1:], len(start_of_steps)) - 1
+        self.counts = self.last - self.first + 1
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+    # A table with one step for each bucket, starting at the start of the
+    # first step (or the last step) in the bucket. If the full table is
+    # passed, the values already in it are copied from the same steps.
+    def coarse_table(
+            self,
+            at_last_step: bool = False,
+            dtype=np.float64,
+            table: CashFlowStepTable = None
+            ) -> CashFlowStepTable:
+        positions = self.last if at_last_step else self.first
+        coarse = CashFlowStepTable.empty(len(self), dtype)
+        coarse.start_of_step[:] = self.start_of_steps[positions]
+        if table is not None:
+            for name in VALUE_FIELDS:
+                getattr(coarse, name)[:] = getattr(table, name)[positions]
+        return coarse
+
+    # Adds up the values of the steps in each bucket of a full timeline. Values
+    # that are None (NaN) are ignored, and buckets where they are all None
+    # are None.
+    def aggregate(self, table: CashFlowStepTable) -> CashFlowStepTable:
+        if len(table) != len(self.start_of_steps):
+            raise ValueError(f'Expected {len(self.start_of_steps)} steps, got {len(table)}')
+
+        aggregated = self.coarse_table()
+        if len(self) == 0:
+            return aggregated
+
+        for name in VALUE_FIELDS:
+            column = getattr(table, name)
+            known = ~np.isnan(column)
+            totals = np.add.reduceat(np.where(known, column, 0), self.first)
+            getattr(aggregated, name)[:] = np.where(
+                np.add.reduceat(known, self.first) > 0, totals, np.nan)
+        return aggregated
+
+
+# The results of calculating a coarse timeline. table has one step per bucket,
+# with the spend of each bucket calculated at the start of its first step, and
+# multiplied by the number of steps in the bucket.
+# The inflation index never decreases (or never increases, if the inflation
+# rate is negative) between two dates, so the spend of each step in a bucket
+# is between the spend at its first step and the spend at its last step. The
+# total spend of the full timeline in each bucket is therefore between lower and
+# upper, which are calculated from the first and last steps of each bucket. The
+# bounds are widened by the rounding error of adding up that many steps.
+class ScreeningResult:
+    def __init__(
+            self,
+            timeline: ResampledTimeline,
+            table: CashFlowStepTable,
+            lower: Dict[str, np.ndarray],
+            upper: Dict[str, np.ndarray]
+        ):
+        self.timeline = timeline
+        self.table = table
+        self.lower = lower
+        self.upper = upper
+
+    # The most that each bucket can differ from the full timeline, for each
+    # of SPEND_FIELDS
+    def error_bounds(self) -> Dict[str, np.ndarray]:
+        return {
+            name: np.maximum(self.upper[name] - getattr(self.table, name), getattr(self.table, name) - self.lower[name])
+            for name in SPEND_FIELDS
+        }
+
+    # The total of each of SPEND_FIELDS over the timeline, as
+    # (estimate, lower bound, upper bound)
+    def totals(self) -> Dict[str, Tuple[float, float, float]]:
+        return {
+            name: (
+                float(np.nansum(getattr(self.table, name))),
+                float(np.nansum(self.lower[name])),
+                float(np.nansum(self.upper[name])))
+            for name in SPEND_FIELDS
+        }
+
+    # The actual difference of each bucket from a calculated full timeline, for
+    # each of SPEND_FIELDS, to check the screening against
+    def errors_against(self, full_table: CashFlowStepTable) -> Dict[str, np.ndarray]:
+        aggregated = self.timeline.aggregate(full_table)
+        return {
+            name: np.abs(getattr(self.table, name) - getattr(aggregated, name))
+            for name in SPEND_FIELDS
+        }
+
+
+# Calculates the steps on a monthly, quarterly or annual timeline instead of the
+# full timeline, which is cheaper by about the number of steps per bucket, for
+# screening projects before calculating them in full. The calculator can be any
+# calculator that CashFlowStepsCalculator can use. Values that are already in
+# the steps are copied to the coarse timeline from the step it is sampled at.
+def screen(calculator, table: CashFlowStepTable, fraction_of_spend: float, frequency: str) -> ScreeningResult:
+    timeline = ResampledTimeline(
+        table.start_of_step,
+        frequency,
+        getattr(calculator, 'date_of_financial_close', None))
+
+    dtype = getattr(table, SPEND_FIELDS[0]).dtype
+    at_first_step = timeline.coarse_table(dtype=dtype, table=table)
+    at_last_step = timeline.coarse_table(at_last_step=True, dtype=dtype, table=table)
+    CashFlowStepsCalculator(at_first_step).calculate_step(calculator, fraction_of_spend)
+    CashFlowStepsCalculator(at_last_step).calculate_step(calculator, fraction_of_spend)
+
+    lower = {}
+    upper = {}
+    rounding = timeline.counts * np.finfo(dtype).eps
+    for name in SPEND_FIELDS:
+        getattr(at_first_step, name)[:] *= timeline.counts
+        getattr(at_last_step, name)[:] *= timeline.counts
+        first, last = getattr(at_first_step, name), getattr(at_last_step, name)
+        allowance = np.maximum(np.abs(first), np.abs(last)) * rounding
+        lower[name] = np.minimum(first, last) - allowance
+        upper[name] = np.maximum(first, last) + allowance
+
+    return ScreeningResult(timeline, at_first_step, lower, upper)
+
+
+def _periods(start_of_steps: np.ndarray, frequency: str) -> np.ndarray:
+    months = start_of_steps.astype('datetime64[M]').astype(np.int64)
+    if frequency == MONTHLY:
+        return months
+    if frequency == QUARTERLY:
+        return months // 3
+    return months // 12
@@ -0,0 +1,203 @@
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime
+from typing import Dict
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, CASH_FLOW_STEP_FIELDS, VALUE_FIELDS
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+# Part of every key, so that results calculated by older versions of the code
+# are not reused. The key also has a hash of the source of the calculator
+# classes, which changes whenever they do, but this should be increased when
+# the code they use (such as the inflation index) changes what they calculate.
+CALCULATION_VERSION = 1
+
+
+# This class caches the results of calculating a CashFlowStepTable, so that
+# calculating the same steps with the same calculator parameters again just
+# copies the results in to the table, without using the calculator at all.
+# The key is a hash of the calculator class (its name and source code) and its
+# constructor arguments (which the calculators in this repository store as
+# attributes with the same names), the fraction of spend, and all the values in
+# the table before calculation.
+# Results are kept in memory, removing the least recently used ones when they
+# take up more than max_bytes, and also saved in the directory if there is one,
+# so that they can be reused by other processes, or after a restart. The files
+# in the directory are limited to max_disk_bytes in the same way, using their
+# modification times (which are updated when a file is used).
+class ConstructionMarginResultCache:
+    def __init__(
+            self,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+            directory: str = None,
+            max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES
+        ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._bytes = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def calculate_table(self, calculator, table: CashFlowStepTable, fraction_of_spend: float):
+        key = result_key(calculator, table, fraction_of_spend)
+
+        result = self._load(key)
+        if result is None:
+            self.misses += 1
+            CashFlowStepsCalculator(table).calculate_step(calculator, fraction_of_spend)
+            self._save(key, {name: getattr(table, name).copy() for name in VALUE_FIELDS})
+            return
+
+        for name, column in result.items():
+            getattr(table, name)[:] = column
+
+    @property
+    def size_in_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def _load(self, key: str) -> Dict[str, np.ndarray]:
+        if key in self._results:
+            self._results.move_to_end(key)
+            self.hits += 1
+            return self._results[key]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            # another process can remove the file when trimming the directory
+            try:
+                with np.load(self._path(key)) as file:
+                    result = {name: file[name] for name in file.files}
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                return None
+            self._remember(key, result)
+            self.disk_hits += 1
+            return result
+
+        return None
+
+    def _save(self, key: str, result: Dict[str, np.ndarray]):
+        self._remember(key, result)
+        if self.directory is not None:
+            # written to a temporary file with a unique name first, so that
+            # other processes saving the same result at the same time don't
+            # write to the same file, and only ever see complete files
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp.npz', delete=False) as file:
+                temporary_path = file.name
+                try:
+                    np.savez(file, **result)
+                except BaseException:
+                    file.close()
+                    os.remove(temporary_path)
+                    raise
+            os.replace(temporary_path, self._path(key))
+            self._trim_directory()
+
+    def _remember(self, key: str, result: Dict[str, np.ndarray]):
+        size = sum(column.nbytes for column in result.values())
+        if size > self.max_bytes:
+            return
+
+        self._results[key] = result
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, removed = self._results.popitem(last=False)
+            self._bytes -= sum(column.nbytes for column in removed.values())
+
+    # Removes the least recently used results until the files fit in
+    # max_disk_bytes. Files being written (and files that other processes have
+    # already removed) are skipped.
+    def _trim_directory(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz') and not entry.name.endswith('.tmp.npz'):
+                try:
+                    status = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((status.st_mtime_ns, status.st_size, entry.path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+
+
+def result_key(calculator, table: CashFlowStepTable, fraction_of_spend: float) -> str:
+    key = hashlib.sha256()
+    key.update(json.dumps(
+        [
+            CALCULATION_VERSION,
+            type(calculator).__qualname__,
+            source_fingerprint(type(calculator)),
+            constructor_arguments(calculator),
+            fraction_of_spend
+        ],
+        default=_to_json).encode())
+    key.update(timeline_fingerprint(table).encode())
+    return key.hexdigest()
+
+
+def constructor_arguments(calculator) -> dict:
+    parameters = inspect.signature(type(calculator).__init__).parameters
+    return {
+        name: getattr(calculator, name)
+        for name in parameters
+        if name != 'self'
+    }
+
+
+# A hash of the source code of the class and the classes it inherits from, so
+# that changing a calculator changes the keys of its results. Classes without
+# source (such as ones defined in an interactive session) only use their names.
+@lru_cache(maxsize=None)
+def source_fingerprint(calculator_class: type) -> str:
+    fingerprint = hashlib.sha256()
+    for cls in calculator_class.__mro__[:-1]:
+        try:
+            source = inspect.getsource(cls)
+        except (OSError, TypeError):
+            source = f'{cls.__module__}.{cls.__qualname__}'
+        fingerprint.update(source.encode())
+    return fingerprint.hexdigest()
+
+
+def timeline_fingerprint(table: CashFlowStepTable) -> str:
+    fingerprint = hashlib.sha256()
+    for name in CASH_FLOW_STEP_FIELDS:
+        column = np.ascontiguousarray(getattr(table, name))
+        fingerprint.update(f'{name}:{column.dtype.str}:{len(column)}'.encode())
+        fingerprint.update(column.tobytes())
+    return fingerprint.hexdigest()
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Cannot include {type(value).__name__} in a cache key')
@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Dict
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS, as_datetime64
+from cash_flow_calculator.inflation_index import InflationIndex
+
+# The ConstructionMarginCalculator parameters that can vary between scenarios
+SCENARIO_PARAMETERS = (
+    'epc_margin',
+    'in_selling_mode',
+    'inflation_rate',
+    'turbine_costs',
+    'balance_of_plant_costs_at_financial_close')
+
+
+# This class does the same calculation as ConstructionMarginCalculator, but for
+# many scenarios at once. The SCENARIO_PARAMETERS can be single values or 1-d
+# arrays (which are broadcast against each other), with one value per scenario.
+# All the scenarios are calculated against the same steps in one set of array
+# operations, with the scenarios as rows and the steps as columns, and the
+# results are exactly the same as calculating each scenario separately.
+class ScenarioGrid:
+    def __init__(
+            self,
+            balance_of_plant_costs_at_financial_close,
+            development_cost: float,
+            turbine_costs,
+            special_capital_costs: float,
+            date_of_financial_close: datetime,
+            in_selling_mode,
+            epc_margin,
+            inflation_rate,
+            inflation_mode: int
+        ):
+        (
+            self.epc_margin,
+            self.in_selling_mode,
+            self.inflation_rate,
+            self.turbine_costs,
+            self.balance_of_plant_costs_at_financial_close
+        ) = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(epc_margin, dtype=np.float64)),
+            np.atleast_1d(np.asarray(in_selling_mode, dtype=bool)),
+            np.atleast_1d(np.asarray(inflation_rate, dtype=np.float64)),
+            np.atleast_1d(np.asarray(turbine_costs, dtype=np.float64)),
+            np.atleast_1d(np.asarray(balance_of_plant_costs_at_financial_close, dtype=np.float64)))
+        self.development_cost = development_cost
+        self.special_capital_costs = special_capital_costs
+        self.date_of_financial_close = date_of_financial_close
+        self.inflation_mode = inflation_mode
+
+    def __len__(self) -> int:
+        return len(self.epc_margin)
+
+    def calculate_table(
+            self,
+            table: CashFlowStepTable,
+            fraction_of_spend: float
+            ) -> 'ScenarioGridResult':
+        shape = (len(self), len(table))
+
+        exponents = InflationIndex(0, self.inflation_mode, self.date_of_financial_close) \
+            .exponents(table.start_of_step)
+        inflation = np.power(1 + self.inflation_rate[:, None], exponents[None, :])
+
+        at_financial_close = \
+            table.start_of_step == as_datetime64(self.date_of_financial_close)
+        owning_at_financial_close = \
+            (self.in_selling_mode == False)[:, None] & at_financial_close[None, :]
+        selling = self.in_selling_mode[:, None]
+
+        turbine_cost_including_margin = \
+            self.turbine_costs[:, None] * inflation * fraction_of_spend
+
+        balance_of_plant_cost_including_margin = \
+            self.balance_of_plant_costs_at_financial_close[:, None] * inflation * fraction_of_spend
+
+        construction_profit = np.where(
+            selling,
+            -1 * \
+            (turbine_cost_including_margin + balance_of_plant_cost_including_margin) * \
+            self.epc_margin[:, None],
+            table.construction_profit)
+
+        margin = np.where(self.in_selling_mode, 1 + self.epc_margin, 1)[:, None]
+
+        return ScenarioGridResult(
+            start_of_step=table.start_of_step,
+            special_capital_costs=np.broadcast_to(
+                np.where(at_financial_close, self.special_capital_costs, table.special_capital_costs),
+                shape),
+            development_cost_if_owning=np.where(
+                owning_at_financial_close,
+                self.development_cost,
+                table.development_cost_if_owning),
+            development_cost=np.broadcast_to(
+                np.where(at_financial_close, self.development_cost, table.development_cost),
+                shape),
+            turbine_cost_including_margin=np.where(
+                selling,
+                turbine_cost_including_margin * margin,
+                turbine_cost_including_margin),
+            balance_of_plant_costs_at_financial_close=np.broadcast_to(
+                table.balance_of_plant_costs_at_financial_close,
+                shape),
+            construction_profit=construction_profit,
+            balance_of_plant_cost_including_margin=np.where(
+                selling,
+                balance_of_plant_cost_including_margin * margin,
+                balance_of_plant_cost_including_margin))
+
+
+# The results of a ScenarioGrid calculation. start_of_step has one value per
+# step, and the other CashFlowStep properties are (scenarios x steps) arrays.
+# Properties that are the same for every scenario are broadcast views, so they
+# don't use any extra memory.
+class ScenarioGridResult:
+    def __init__(self, start_of_step: np.ndarray, **values: np.ndarray):
+        self.start_of_step = start_of_step
+        for name in VALUE_FIELDS:
+            setattr(self, name, values[name])
+
+    def __len__(self) -> int:
+        return len(self.construction_profit)
+
+    def scenario(self, index: int) -> CashFlowStepTable:
+        columns = {name: np.array(getattr(self, name)[index]) for name in VALUE_FIELDS}
+        return CashFlowStepTable(start_of_step=self.start_of_step.copy(), **columns)
+
+
+# Returns every combination of the parameter values, as a dictionary of equal
+# length arrays that can be passed to ScenarioGrid
+def scenario_product(**parameter_values) -> Dict[str, np.ndarray]:
+    grids = np.meshgrid(
+        *(np.atleast_1d(values) for values in parameter_values.values()),
+        indexing='ij')
+    return {
+        name: grid.ravel()
+        for name, grid in zip(parameter_values, grids)
+    }
@@ -0,0 +1,95 @@
+from typing import Dict
+
+# These functions give the partial derivatives of the properties set by the
+# construction margin calculators, with respect to their inputs, as
+# sensitivities[output][input]. The inputs are only multiplied together (with
+# epc_margin as 1 + epc_margin, or on its own in construction_profit), so the
+# calculation is linear in each input, apart from the inflation rate (which it
+# depends on through the inflation index). The derivatives are simple products of the same values
+# that the calculation uses, and can be calculated alongside it instead of
+# bumping each input and calculating again.
+# The inputs can be single values (for one step) or arrays (for a column of
+# steps), and inflation is the inflation index of each step. The derivatives with
+# respect to the inflation rate can be found from the derivatives with respect
+# to inflation, using the chain rule (see with_inflation_rate).
+Sensitivities = Dict[str, Dict[str, object]]
+
+
+def spend_sensitivities(
+        turbine_costs: float,
+        balance_of_plant_costs_at_financial_close: float,
+        epc_margin: float,
+        in_selling_mode: bool,
+        inflation,
+        fraction_of_spend: float
+        ) -> Sensitivities:
+    turbine_cost = turbine_costs * inflation * fraction_of_spend
+    balance_of_plant_cost = balance_of_plant_costs_at_financial_close * inflation * fraction_of_spend
+    zero = 0 * inflation
+
+    if not in_selling_mode:
+        return {
+            'turbine_cost_including_margin': {
+                'turbine_costs': inflation * fraction_of_spend,
+                'balance_of_plant_costs_at_financial_close': zero,
+                'epc_margin': zero,
+                'inflation': turbine_costs * fraction_of_spend,
+                'fraction_of_spend': turbine_costs * inflation,
+            },
+            'balance_of_plant_cost_including_margin': {
+                'turbine_costs': zero,
+                'balance_of_plant_costs_at_financial_close': inflation * fraction_of_spend,
+                'epc_margin': zero,
+                'inflation': balance_of_plant_costs_at_financial_close * fraction_of_spend,
+                'fraction_of_spend': balance_of_plant_costs_at_financial_close * inflation,
+            },
+        }
+
+    margin = 1 + epc_margin
+    return {
+        'turbine_cost_including_margin': {
+            'turbine_costs': inflation * fraction_of_spend * margin,
+            'balance_of_plant_costs_at_financial_close': zero,
+            'epc_margin': turbine_cost,
+            'inflation': turbine_costs * fraction_of_spend * margin,
+            'fraction_of_spend': turbine_costs * inflation * margin,
+        },
+        'balance_of_plant_cost_including_margin': {
+            'turbine_costs': zero,
+            'balance_of_plant_costs_at_financial_close': inflation * fraction_of_spend * margin,
+            'epc_margin': balance_of_plant_cost,
+            'inflation': balance_of_plant_costs_at_financial_close * fraction_of_spend * margin,
+            'fraction_of_spend': balance_of_plant_costs_at_financial_close * inflation * margin,
+        },
+        'construction_profit': {
+            'turbine_costs': -1 * inflation * fraction_of_spend * epc_margin,
+            'balance_of_plant_costs_at_financial_close': -1 * inflation * fraction_of_spend * epc_margin,
+            'epc_margin': -1 * (turbine_cost + balance_of_plant_cost),
+            'inflation':
+                -1 * (turbine_costs + balance_of_plant_costs_at_financial_close) * fraction_of_spend * epc_margin,
+            'fraction_of_spend':
+                -1 * (turbine_costs + balance_of_plant_costs_at_financial_close) * inflation * epc_margin,
+        },
+    }
+
+
+# The milestones are only set on the step at financial close, where they are
+# equal to the input, so their derivative is 1 there and 0 everywhere else
+def milestone_sensitivities(at_financial_close, in_selling_mode: bool) -> Sensitivities:
+    at_financial_close = 1.0 * at_financial_close
+    sensitivities = {
+        'special_capital_costs': {'special_capital_costs': at_financial_close},
+        'development_cost': {'development_cost': at_financial_close},
+    }
+    if in_selling_mode == False:
+        sensitivities['development_cost_if_owning'] = {'development_cost': at_financial_close}
+    return sensitivities
+
+
+# Adds the derivatives with respect to the inflation rate, given the derivative
+# of the inflation index with respect to the rate
+def with_inflation_rate(sensitivities: Sensitivities, inflation_rate_derivative) -> Sensitivities:
+    for derivatives in sensitivities.values():
+        if 'inflation' in derivatives:
+            derivatives['inflation_rate'] = derivatives['inflation'] * inflation_rate_derivative
+    return sensitivities
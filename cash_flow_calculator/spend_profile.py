@@ -0,0 +1,71 @@
+from typing import Iterator, Tuple
+import numpy as np
+
+# This class is the fraction of spend in each step of a timeline, for when the
+# spend isn't the same in every step (usually it follows an S-curve over
+# construction). It is sparse: only the positions of the steps with some spend
+# are stored, with their fractions, and the calculators skip the other steps
+# entirely, leaving their spend properties as they are (None, or NaN in a
+# CashFlowStepTable). Milestones are still set on them.
+# It can be passed to the calculators anywhere that a single fraction_of_spend
+# can.
+class SpendProfile:
+    def __init__(self, positions: np.ndarray, fractions: np.ndarray, number_of_steps: int):
+        positions = np.asarray(positions, dtype=np.int64)
+        fractions = np.asarray(fractions, dtype=np.float64)
+
+        if positions.shape != fractions.shape or positions.ndim != 1:
+            raise ValueError('There must be one fraction for each position')
+        if (positions[1:] <= positions[:-1]).any():
+            raise ValueError('The positions must be in order, without repeats')
+        if len(positions) > 0 and (positions[0] < 0 or positions[-1] >= number_of_steps):
+            raise ValueError(f'The positions must be between 0 and {number_of_steps - 1}')
+
+        self.positions = positions
+        self.fractions = fractions
+        self.number_of_steps = number_of_steps
+
+    # Creates a profile from the fraction of spend for every step, leaving out
+    # the steps where it is zero
+    @classmethod
+    def from_fractions(cls, fractions: np.ndarray) -> 'SpendProfile':
+        fractions = np.asarray(fractions, dtype=np.float64)
+        positions = np.flatnonzero(fractions)
+        return cls(positions, fractions[positions], len(fractions))
+
+    # Spends a total of total_fraction between the first and last positions
+    # (inclusive), following a smoothstep S-curve, which spends slowly at the
+    # start and end of construction and quickly in the middle
+    @classmethod
+    def s_curve(cls, number_of_steps: int, first: int, last: int, total_fraction: float = 1.0) -> 'SpendProfile':
+        if not 0 <= first <= last < number_of_steps:
+            raise ValueError(f'The spend must be between steps 0 and {number_of_steps - 1}')
+
+        progress = np.linspace(0, 1, last - first + 2)
+        spent = progress * progress * (3 - 2 * progress) * total_fraction
+        return cls.from_fractions(np.concatenate([
+            np.zeros(first),
+            np.diff(spent),
+            np.zeros(number_of_steps - last - 1)]))
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    # The position and fraction of spend of each step with some spend
+    def __iter__(self) -> Iterator[Tuple[int, float]]:
+        return zip(self.positions.tolist(), self.fractions.tolist())
+
+    # The fraction of spend for every step, including the ones without any
+    def dense(self) -> np.ndarray:
+        fractions = np.zeros(self.number_of_steps)
+        fractions[self.positions] = self.fractions
+        return fractions
+
+    # The profile of the steps from start to stop, such as a chunk of a timeline
+    def window(self, start: int, stop: int) -> 'SpendProfile':
+        first, last = np.searchsorted(self.positions, [start, stop])
+        return SpendProfile(self.positions[first:last] - start, self.fractions[first:last], stop - start)
+
+    def check_steps(self, number_of_steps: int):
+        if number_of_steps != self.number_of_steps:
+            raise ValueError(f'The spend profile has {self.number_of_steps} steps, but there are {number_of_steps}')
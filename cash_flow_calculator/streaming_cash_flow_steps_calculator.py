@@ -0,0 +1,58 @@
+from itertools import islice
+from typing import Iterable, Iterator, List
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+# This class does the same as CashFlowStepsCalculator, but for any iterable of
+# steps (such as a generator reading them from a file), rather than a list.
+# The steps are calculated a chunk at a time, and the calculated steps are
+# yielded as soon as their chunk is done, so only one chunk of steps is held in
+# memory at once, however long the timeline is.
+class StreamingCashFlowStepsCalculator:
+    def __init__(self, steps: Iterable[CashFlowStep], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+
+        self.steps = steps
+        self.chunk_size = chunk_size
+
+    # Yields the steps once they have been calculated
+    def calculate_step(self, calculator, fraction_of_spend: float) -> Iterator[CashFlowStep]:
+        for chunk in self._chunks():
+            calculate_chunk(chunk, calculator, fraction_of_spend)
+            yield from chunk
+
+    # Yields each chunk of steps as a calculated CashFlowStepTable, which is
+    # faster than calculate_step when the results are going to be written out
+    # as columns anyway
+    def calculate_chunks(self, calculator, fraction_of_spend: float) -> Iterator[CashFlowStepTable]:
+        for chunk in self._chunks():
+            yield calculate_chunk_table(chunk, calculator, fraction_of_spend)
+
+    def _chunks(self):
+        steps = iter(self.steps)
+        while True:
+            chunk = list(islice(steps, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+# Calculates a list of steps, as columns if the calculator can
+def calculate_chunk(chunk: List[CashFlowStep], calculator, fraction_of_spend: float):
+    if hasattr(calculator, 'calculate_table'):
+        table = CashFlowStepTable.from_steps(chunk)
+        calculator.calculate_table(table, fraction_of_spend)
+        table.update_steps(chunk)
+    else:
+        CashFlowStepsCalculator(chunk).calculate_step(calculator, fraction_of_spend)
+
+
+def calculate_chunk_table(chunk: List[CashFlowStep], calculator, fraction_of_spend: float) -> CashFlowStepTable:
+    table = CashFlowStepTable.from_steps(chunk)
+    CashFlowStepsCalculator(table).calculate_step(calculator, fraction_of_spend)
+    return table
@@ -0,0 +1,120 @@
+import copy
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_DTYPE, as_datetime64
+
+
+# This class finds the step that contains a date, such as the date of financial
+# close, commercial operation or decommissioning. It is built once for a
+# timeline (sorting the start dates of the steps), and can then be shared by all
+# the calculators, which can look up each milestone with a binary search instead
+# of comparing it to the start of every step.
+# A date is in a step if it is on or after the start of the step, and before
+# the start of the next step, so dates that don't line up exactly with the
+# start of a step are not missed. The last step is assumed to be as long as the
+# one before it. Dates outside the timeline, and steps without a start, have no
+# position.
+class TimelineIndex:
+    def __init__(self, start_of_steps: np.ndarray):
+        start_of_steps = np.asarray(start_of_steps, dtype=DATE_DTYPE)
+        # steps without a start (NaT) would sort last and become the end of
+        # the timeline, so they are left out: no date is in them
+        dated = np.flatnonzero(~np.isnat(start_of_steps))
+        self._order = dated[np.argsort(start_of_steps[dated], kind='stable')]
+        self._sorted_start_of_steps = start_of_steps[self._order]
+
+        if len(self._order) > 1:
+            last_step_length = self._sorted_start_of_steps[-1] - self._sorted_start_of_steps[-2]
+        else:
+            last_step_length = np.timedelta64(1, 'us')
+        self._end_of_timeline = self._sorted_start_of_steps[-1] + last_step_length \
+            if len(self._order) > 0 else None
+        self._window = None
+
+    @classmethod
+    def from_steps(cls, steps: List[CashFlowStep]) -> 'TimelineIndex':
+        if isinstance(steps, CashFlowStepTable):
+            return cls(steps.start_of_step)
+        return cls([step.start_of_step for step in steps])
+
+    # The position (in the original steps) of the step containing the date
+    def position_of(self, when: datetime) -> Optional[int]:
+        if when is None or self._end_of_timeline is None:
+            return None
+
+        when = as_datetime64(when)
+        if when >= self._end_of_timeline:
+            return None
+
+        sorted_position = np.searchsorted(self._sorted_start_of_steps, when, side='right') - 1
+        if sorted_position < 0:
+            return None
+
+        position = int(self._order[sorted_position])
+        if self._window is not None:
+            start, stop = self._window
+            return position - start if start <= position < stop else None
+        return position
+
+    # The index of the steps from start to stop (such as a chunk of the
+    # timeline), which gives their positions in the chunk. Dates in steps
+    # outside the chunk have no position.
+    def window(self, start: int, stop: int) -> 'TimelineIndex':
+        window = copy.copy(self)
+        window._window = (start, stop)
+        return window
+
+    def positions_of(self, milestones: Dict[str, datetime]) -> Dict[str, Optional[int]]:
+        return {name: self.position_of(when) for name, when in milestones.items()}
+
+
+# The position of the step that starts exactly on the date, or None if there
+# isn't one. Timelines are normally in date order, so the step is looked for
+# with a binary search instead of comparing the date to every step. If that
+# doesn't find it, the steps may not be in order, so every step is checked
+# (which is no slower than comparing the date to every step in the first place).
+def position_starting_on(steps: List[CashFlowStep], when: datetime) -> Optional[int]:
+    if when is None:
+        return None
+
+    if isinstance(steps, CashFlowStepTable):
+        when = as_datetime64(when)
+        position = int(np.searchsorted(steps.start_of_step, when))
+        if position < len(steps) and steps.start_of_step[position] == when:
+            return position
+        matches = np.flatnonzero(steps.start_of_step == when)
+        return int(matches[0]) if len(matches) else None
+
+    position = _bisect_start_of_step(steps, when)
+    if position < len(steps) and steps[position].start_of_step == when:
+        return position
+    return next((position for position, step in enumerate(steps) if step.start_of_step == when), None)
+
+
+# The first position where a step could start on the date, if the steps are in
+# date order. Steps without a start are never compared with each other, only
+# with the date, so they are treated as before every date.
+def _bisect_start_of_step(steps: List[CashFlowStep], when: datetime) -> int:
+    low, high = 0, len(steps)
+    while low < high:
+        middle = (low + high) // 2
+        start_of_step = steps[middle].start_of_step
+        if start_of_step is None or start_of_step < when:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+# The position of the step that a milestone is set on: the step containing the
+# date if there is a timeline index, and otherwise the step starting on it
+def milestone_position(
+        steps: List[CashFlowStep],
+        when: datetime,
+        timeline_index: TimelineIndex = None
+        ) -> Optional[int]:
+    if timeline_index is not None:
+        return timeline_index.position_of(when)
+    return position_starting_on(steps, when)
@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import math
+import time
+from collections import deque
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_FIELD, VALUE_FIELDS
+from cash_flow_calculator.inflation_index import ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION, NO_INFLATION
+from cash_flow_calculator.scenario_grid import ScenarioGrid, SCENARIO_PARAMETERS
+
+# The ConstructionMarginCalculator parameters that must be the same for requests
+# to be calculated together (the others are SCENARIO_PARAMETERS, which can be
+# different for each request in a batch)
+SHARED_PARAMETERS = (
+    'development_cost',
+    'special_capital_costs',
+    'date_of_financial_close',
+    'inflation_mode')
+
+# The parameters that must be finite numbers (booleans are rejected, even
+# though JSON true and false are ints in Python)
+NUMERIC_PARAMETERS = (
+    'balance_of_plant_costs_at_financial_close',
+    'development_cost',
+    'turbine_costs',
+    'special_capital_costs',
+    'epc_margin',
+    'inflation_rate')
+INFLATION_MODES = (NO_INFLATION, ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION)
+
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_MAX_BATCH_SIZE = 1024
+LATENCY_SAMPLES = 1000
+
+
+# This class serves construction margin calculations over HTTP, with JSON
+# requests like this (the steps can also have any of the other CashFlowStep
+# properties, which are None if they are missing):
+#   POST /valuations
+#   {
+#       "calculator": {"balance_of_plant_costs_at_financial_close": 10, ... },
+#       "fraction_of_spend": 0.3,
+#       "steps": [{"start_of_step": "2020-01-01T00:00:00"}, ... ]
+#   }
+# The response has the calculated steps, in the same format. GET /metrics
+# returns the request latencies and the number of requests waiting.
+# Requests that arrive within the batch window of each other, and that have the
+# same steps and shared parameters, are calculated together in one
+# ScenarioGrid. The calculations are run in the executor, so the event loop
+# carries on accepting requests while they run.
+# Stopping the service waits for the calculations that have started, and
+# rejects the requests that are still waiting to be calculated.
+class ValuationService:
+    def __init__(
+            self,
+            batch_window: float = DEFAULT_BATCH_WINDOW,
+            max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+            executor: Executor = None
+        ):
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self._queue = None
+        self._batcher = None
+        self._server = None
+        self._calculations = set()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._requests = 0
+        self._batches = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+        if self._calculations:
+            await asyncio.gather(*self._calculations, return_exceptions=True)
+
+        while not self._queue.empty():
+            _, result = self._queue.get_nowait()
+            _reject(result)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def value(self, request: dict) -> dict:
+        _validate(request)
+        start = time.perf_counter()
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, result))
+        response = await result
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    def metrics(self) -> dict:
+        latencies = np.array(self._latencies)
+        return {
+            'requests': self._requests,
+            'batches': self._batches,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'latency_seconds': {
+                'mean': float(latencies.mean()) if len(latencies) else None,
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p95': float(np.percentile(latencies, 95)) if len(latencies) else None,
+                'max': float(latencies.max()) if len(latencies) else None,
+            },
+        }
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        waiting = []
+        try:
+            while True:
+                waiting = [await self._queue.get()]
+                await asyncio.sleep(self.batch_window)
+                while not self._queue.empty() and len(waiting) < self.max_batch_size:
+                    waiting.append(self._queue.get_nowait())
+
+                batches = {}
+                for request, result in waiting:
+                    batches.setdefault(_batch_key(request), []).append((request, result))
+                waiting = []
+
+                for batch in batches.values():
+                    self._requests += len(batch)
+                    self._batches += 1
+                    requests = [request for request, _ in batch]
+                    results = [result for _, result in batch]
+                    calculation = loop.run_in_executor(self.executor, calculate_batch, requests)
+                    self._calculations.add(calculation)
+                    calculation.add_done_callback(self._calculations.discard)
+                    calculation.add_done_callback(
+                        lambda calculation, results=results: _set_results(calculation, results))
+        except asyncio.CancelledError:
+            for _, result in waiting:
+                _reject(result)
+            raise
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, body = await _read_request(reader)
+            if method == 'POST' and path == '/valuations':
+                status, response = 200, await self.value(json.loads(body))
+            elif method == 'GET' and path == '/metrics':
+                status, response = 200, self.metrics()
+            else:
+                status, response = 404, {'error': f'{method} {path} not found'}
+        except (ValueError, KeyError, TypeError) as error:
+            status, response = 400, {'error': str(error)}
+        except Exception as error:
+            status, response = 500, {'error': str(error)}
+
+        body = json.dumps(response).encode()
+        writer.write(
+            f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+        writer.close()
+
+
+# Calculates requests that have the same batch key, in one ScenarioGrid. This is
+# a module level function with plain data in and out, so that it can be run in
+# a process pool as well as a thread pool.
+# If the batch can't be calculated, each request is calculated on its own, so
+# that a request that fails only fails itself (its response is an error).
+def calculate_batch(requests: List[dict]) -> List[dict]:
+    try:
+        return _calculate_scenarios(requests)
+    except (ValueError, KeyError, TypeError) as error:
+        if len(requests) == 1:
+            return [{'error': str(error)}]
+    return [calculate_batch([request])[0] for request in requests]
+
+
+def _calculate_scenarios(requests: List[dict]) -> List[dict]:
+    first = requests[0]
+    steps = CashFlowStepTable.from_steps([_step_from_json(step) for step in first['steps']])
+    parameters = {
+        name: _parse_parameter(name, first['calculator'][name])
+        for name in SHARED_PARAMETERS
+    }
+    for name in SCENARIO_PARAMETERS:
+        parameters[name] = [request['calculator'][name] for request in requests]
+
+    result = ScenarioGrid(**parameters).calculate_table(steps, first['fraction_of_spend'])
+
+    return [
+        {'steps': [_step_to_json(step) for step in result.scenario(index).to_steps()]}
+        for index in range(len(requests))
+    ]
+
+
+def _batch_key(request: dict) -> str:
+    shared = {name: request['calculator'][name] for name in SHARED_PARAMETERS}
+    return hashlib.sha256(json.dumps(
+        [shared, request['fraction_of_spend'], request['steps']],
+        sort_keys=True).encode()).hexdigest()
+
+
+def _validate(request: dict):
+    calculator = request['calculator']
+    missing = set(SHARED_PARAMETERS + SCENARIO_PARAMETERS) - set(calculator)
+    if missing:
+        raise ValueError(f'Missing calculator parameters: {sorted(missing)}')
+    for name in NUMERIC_PARAMETERS:
+        _validate_number(name, calculator[name])
+    if not isinstance(calculator['in_selling_mode'], bool):
+        raise ValueError('in_selling_mode must be true or false')
+    if calculator['inflation_mode'] not in INFLATION_MODES or isinstance(calculator['inflation_mode'], bool):
+        raise ValueError(f'inflation_mode must be one of {list(INFLATION_MODES)}')
+    if calculator['date_of_financial_close'] is not None:
+        if not isinstance(calculator['date_of_financial_close'], str):
+            raise ValueError('date_of_financial_close must be an ISO date or null')
+        datetime.fromisoformat(calculator['date_of_financial_close'])
+    _validate_number('fraction_of_spend', request['fraction_of_spend'])
+    if not isinstance(request['steps'], list):
+        raise ValueError('steps must be a list')
+    for step in request['steps']:
+        if not isinstance(step.get(DATE_FIELD), str):
+            raise ValueError(f'{DATE_FIELD} must be an ISO date')
+        for name in VALUE_FIELDS:
+            if step.get(name) is not None:
+                _validate_number(name, step[name])
+        _step_from_json(step)
+
+
+# bool is a subclass of int, but true and false are not amounts
+def _validate_number(name: str, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f'{name} must be a finite number')
+
+
+def _set_results(calculation: asyncio.Future, results: List[asyncio.Future]):
+    if calculation.exception() is not None:
+        for result in results:
+            if not result.done():
+                result.set_exception(calculation.exception())
+        return
+    for result, response in zip(results, calculation.result()):
+        if result.done():
+            continue
+        if 'error' in response:
+            result.set_exception(ValueError(response['error']))
+        else:
+            result.set_result(response)
+
+
+def _reject(result: asyncio.Future):
+    if not result.done():
+        result.set_exception(RuntimeError('The valuation service was stopped'))
+
+
+def _parse_parameter(name: str, value):
+    if name == 'date_of_financial_close' and value is not None:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _step_from_json(step: Dict[str, object]) -> CashFlowStep:
+    return CashFlowStep(
+        datetime.fromisoformat(step[DATE_FIELD]),
+        *(step.get(name) for name in VALUE_FIELDS))
+
+
+def _step_to_json(step: CashFlowStep) -> Dict[str, object]:
+    values = {name: getattr(step, name) for name in VALUE_FIELDS}
+    return {DATE_FIELD: step.start_of_step.isoformat(), **values}
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    request_line = (await reader.readline()).decode().split()
+    if len(request_line) < 2:
+        raise ValueError('Invalid HTTP request')
+    method, path = request_line[0], request_line[1]
+
+    content_length = 0
+    while True:
+        header = (await reader.readline()).decode().strip()
+        if not header:
+            break
+        name, _, value = header.partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+
+    body = await reader.readexactly(content_length) if content_length else b''
+    return method, path, body
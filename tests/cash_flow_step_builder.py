@@ -1,4 +1,6 @@
+from datetime import datetime, timedelta
 from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS
 
 any_double = 5.55555
 
@@ -23,5 +25,49 @@ class CashFlowStepBuilder:
         self._sut.balance_of_plant_cost_including_margin = balance_of_plant_cost_including_margin
         return self
 
+    def starting_on(self, start_of_step: datetime):
+        self._sut.start_of_step = start_of_step
+        return self
+
+    def without_values(self):
+        for name in VALUE_FIELDS:
+            setattr(self._sut, name, None)
+        return self
+
     def build(self):
-        return self._sut
\ No newline at end of file
+        return self._sut
+
+
+# Builds a timeline of steps without any values, a day apart unless another
+# step length is given
+class CashFlowStepsBuilder:
+
+    def __init__(self):
+        self._start_of_first_step = datetime(2020, 1, 1)
+        self._step_length = timedelta(days=1)
+        self._number_of_steps = 5
+
+    def with_number_of_steps(self, number_of_steps: int):
+        self._number_of_steps = number_of_steps
+        return self
+
+    def starting_on(self, start_of_first_step: datetime):
+        self._start_of_first_step = start_of_first_step
+        return self
+
+    def with_step_length(self, step_length: timedelta):
+        self._step_length = step_length
+        return self
+
+    def generate(self):
+        for step in range(self._number_of_steps):
+            yield CashFlowStepBuilder() \
+                .starting_on(self._start_of_first_step + step * self._step_length) \
+                .without_values() \
+                .build()
+
+    def build(self):
+        return list(self.generate())
+
+    def build_table(self):
+        return CashFlowStepTable.from_steps(self.build())
@@ -0,0 +1,59 @@
+from datetime import datetime
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.inflation_index import DAILY_INFLATION
+
+# Builds a ConstructionMarginCalculator, or any calculator with the same
+# parameters, such as ConstructionMarginCalculatorWithoutLoop
+class ConstructionMarginCalculatorBuilder:
+
+    def __init__(self, calculator_class=ConstructionMarginCalculator):
+        self._calculator_class = calculator_class
+        self._parameters = dict(
+            balance_of_plant_costs_at_financial_close=10,
+            development_cost=11,
+            turbine_costs=12,
+            special_capital_costs=13,
+            date_of_financial_close=datetime(2020, 1, 3),
+            in_selling_mode=True,
+            epc_margin=0.1,
+            inflation_rate=0.05,
+            inflation_mode=DAILY_INFLATION)
+
+    def with_balance_of_plant_costs_at_financial_close(self, balance_of_plant_costs_at_financial_close: float):
+        self._parameters['balance_of_plant_costs_at_financial_close'] = balance_of_plant_costs_at_financial_close
+        return self
+
+    def with_development_cost(self, development_cost: float):
+        self._parameters['development_cost'] = development_cost
+        return self
+
+    def with_turbine_costs(self, turbine_costs: float):
+        self._parameters['turbine_costs'] = turbine_costs
+        return self
+
+    def with_special_capital_costs(self, special_capital_costs: float):
+        self._parameters['special_capital_costs'] = special_capital_costs
+        return self
+
+    def with_date_of_financial_close(self, date_of_financial_close: datetime):
+        self._parameters['date_of_financial_close'] = date_of_financial_close
+        return self
+
+    def in_selling_mode(self, in_selling_mode: bool = True):
+        self._parameters['in_selling_mode'] = in_selling_mode
+        return self
+
+    def with_epc_margin(self, epc_margin: float):
+        self._parameters['epc_margin'] = epc_margin
+        return self
+
+    def with_inflation_rate(self, inflation_rate: float):
+        self._parameters['inflation_rate'] = inflation_rate
+        return self
+
+    def with_inflation_mode(self, inflation_mode: int):
+        self._parameters['inflation_mode'] = inflation_mode
+        return self
+
+    def build(self):
+        return self._calculator_class(**self._parameters)
@@ -1,3 +1,4 @@
+from datetime import datetime
 from cash_flow_calculator.construction_margin_calculator_mockable_abstraction import ConstructionMarginCalculatorMockableAbstraction
 from tests.mock_inflation import MockInflation
 
@@ -29,12 +30,41 @@ class ConstructionMarginCalculatorMockableAbstractionBuilder:
         self._sut.inflation_calculator = MockInflation(inflation)
         return self
 
+    def with_inflation_calculator(self, inflation_calculator):
+        self._sut.inflation_calculator = inflation_calculator
+        return self
+
+    def with_development_cost(self, development_cost: float):
+        self._sut.development_cost = development_cost
+        return self
+
+    def with_special_capital_costs(self, special_capital_costs: float):
+        self._sut.special_capital_costs = special_capital_costs
+        return self
+
+    def with_date_of_financial_close(self, date_of_financial_close: datetime):
+        self._sut.date_of_financial_close = date_of_financial_close
+        return self
+
+    # Uses the parameters of a ConstructionMarginCalculator, and its inflation
+    # index, so that the two calculate the same values
+    def matching(self, calculator):
+        self._sut.balance_of_plant_costs_at_financial_close = calculator.balance_of_plant_costs_at_financial_close
+        self._sut.development_cost = calculator.development_cost
+        self._sut.turbine_costs = calculator.turbine_costs
+        self._sut.special_capital_costs = calculator.special_capital_costs
+        self._sut.date_of_financial_close = calculator.date_of_financial_close
+        self._sut.in_selling_mode = calculator.in_selling_mode
+        self._sut.epc_margin = calculator.epc_margin
+        self._sut.inflation_calculator = calculator.inflation_index()
+        return self
+
     def with_epc_margin(self, epc_margin: float): 
         self._sut.epc_margin = epc_margin
         return self
 
-    def in_selling_mode(self): 
-        self._sut.in_selling_mode = True
+    def in_selling_mode(self, in_selling_mode: bool = True): 
+        self._sut.in_selling_mode = in_selling_mode
         return self
 
     def build(self):
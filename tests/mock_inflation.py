@@ -1,4 +1,5 @@
 from datetime import datetime
+import numpy as np
 
 class MockInflation:
     def __init__(self, constant_inflation):
@@ -6,3 +7,21 @@ class MockInflation:
 
     def inflation_to(self, when: datetime):
         return self._constant_inflation
+
+    def inflation_to_many(self, dates):
+        return np.full(len(dates), self._constant_inflation, dtype=np.float64)
+
+
+# Counts the inflation lookups of either kind
+class CountingMockInflation(MockInflation):
+    def __init__(self, constant_inflation):
+        super().__init__(constant_inflation)
+        self.calls = 0
+
+    def inflation_to(self, when: datetime):
+        self.calls += 1
+        return super().inflation_to(when)
+
+    def inflation_to_many(self, dates):
+        self.calls += 1
+        return super().inflation_to_many(dates)
@@ -0,0 +1,28 @@
+from benchmarks.benchmark_construction_margin_calculators import (
+    VARIANTS,
+    run_benchmarks,
+    find_regressions)
+
+# The benchmarks themselves are too slow to run as tests, so these tests just
+# check that every variant runs, and that regressions are found correctly.
+def test_every_variant_runs_for_every_case():
+    results = run_benchmarks(list(VARIANTS), sizes=[10], repeat=1)
+
+    assert len(results) == len(VARIANTS) * 4
+    assert all(result['steps_per_second'] > 0 for result in results)
+
+
+def test_results_slower_than_the_tolerance_are_regressions():
+    baseline = [
+        {'variant': 'fast', 'case': 'case', 'steps_per_second': 100},
+        {'variant': 'slow', 'case': 'case', 'steps_per_second': 100},
+    ]
+    results = [
+        {'variant': 'fast', 'case': 'case', 'steps_per_second': 95},
+        {'variant': 'slow', 'case': 'case', 'steps_per_second': 85},
+    ]
+
+    regressions = find_regressions(results, baseline, tolerance=0.1)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith('slow')
@@ -0,0 +1,153 @@
+from datetime import datetime
+import numpy as np
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, DATE_DTYPE
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.incremental_construction_margin_calculator import IncrementalConstructionMarginCalculator
+from cash_flow_calculator.inflation_index import DAILY_INFLATION, InflationIndex
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+
+date_of_financial_close = datetime(2020, 1, 3)
+
+
+# An inflation calculator that only has inflation_to, counting the calls
+class PerStepInflation:
+    def __init__(self):
+        self._index = InflationIndex(0.05, DAILY_INFLATION, date_of_financial_close)
+        self.calls = 0
+
+    def inflation_to(self, when: datetime) -> float:
+        self.calls += 1
+        return self._index.inflation_to(when)
+
+
+# An inflation calculator that also has inflation_to_many, counting the calls,
+# and checking that the dates are always the same type
+class BulkInflation(PerStepInflation):
+    def __init__(self):
+        super().__init__()
+        self.bulk_calls = 0
+
+    def inflation_to_many(self, dates) -> np.ndarray:
+        assert isinstance(dates, np.ndarray) and dates.dtype == DATE_DTYPE
+        self.bulk_calls += 1
+        return self._index.inflation_to_many(dates)
+
+
+def create_steps():
+    return CashFlowStepsBuilder().with_number_of_steps(10).build()
+
+
+def create_calculator(inflation_calculator):
+    return ConstructionMarginCalculatorMockableAbstractionBuilder() \
+        .matching(ConstructionMarginCalculatorBuilder().with_date_of_financial_close(date_of_financial_close).build()) \
+        .with_inflation_calculator(inflation_calculator) \
+        .build()
+
+
+def expected_steps():
+    steps = create_steps()
+    calculator = create_calculator(PerStepInflation())
+    for step in steps:
+        calculator.calculate_step(step, 0.3)
+    return steps
+
+
+def test_bulk_inflation_is_fetched_once_for_all_steps():
+    inflation = BulkInflation()
+    steps = create_steps()
+
+    CashFlowStepsCalculator(steps).calculate_step(create_calculator(inflation), 0.3)
+
+    assert inflation.bulk_calls == 1
+    assert inflation.calls == 0
+    assert steps == expected_steps()
+
+
+def test_bulk_inflation_is_fetched_from_table_columns():
+    inflation = BulkInflation()
+    table = CashFlowStepTable.from_steps(create_steps())
+
+    CashFlowStepsCalculator(table).calculate_step(create_calculator(inflation), 0.3)
+
+    assert inflation.bulk_calls == 1
+    assert table.to_steps() == expected_steps()
+
+
+def test_bulk_inflation_is_fetched_for_incremental_recalculation():
+    inflation = BulkInflation()
+
+    sut = IncrementalConstructionMarginCalculator(
+        create_calculator(inflation), CashFlowStepTable.from_steps(create_steps()), 0.3)
+
+    assert inflation.bulk_calls == 1
+    assert sut.steps.to_steps() == expected_steps()
+
+
+def test_inflation_calculators_without_bulk_inflation_are_called_per_step():
+    inflation = PerStepInflation()
+    steps = create_steps()
+
+    CashFlowStepsCalculator(steps).calculate_step(create_calculator(inflation), 0.3)
+
+    assert inflation.calls == 10
+    assert steps == expected_steps()
+
+
+def test_bulk_inflation_is_only_fetched_for_steps_with_spend():
+    inflation = BulkInflation()
+    fractions = [0.0, 0.3, 0.0, 0.0, 0.3, 0.3, 0.0, 0.0, 0.0, 0.3]
+    steps = create_steps()
+
+    create_calculator(inflation).calculate_steps(steps, SpendProfile.from_fractions(fractions))
+
+    expected = expected_steps()
+    for step, expected_step, fraction in zip(steps, expected, fractions):
+        if fraction != 0:
+            assert step == expected_step
+    assert steps[2].development_cost == 11
+
+
+def test_steps_can_be_a_generator():
+    inflation = BulkInflation()
+    steps = create_steps()
+
+    create_calculator(inflation).calculate_steps((step for step in steps), 0.3)
+
+    assert steps == expected_steps()
+
+
+def test_steps_can_be_a_generator_with_a_timeline_index():
+    steps = create_steps()
+
+    ConstructionMarginCalculatorBuilder().build() \
+        .calculate_steps((step for step in steps), 0.3, TimelineIndex.from_steps(steps))
+
+    assert steps == expected_steps()
+
+
+# CashFlowStepsCalculator calls calculate_steps on calculators that have it, and
+# calculate_step on those that don't, which must write the same values, with
+# or without a timeline index
+def test_calculators_with_and_without_calculate_steps_write_the_same_values():
+    # the date of financial close is in the middle of a step, so the milestones
+    # are only set on it with the timeline index
+    for timeline_index in (None, TimelineIndex.from_steps(create_steps())):
+        with_calculate_steps = create_steps()
+        without_calculate_steps = create_steps()
+
+        CashFlowStepsCalculator(with_calculate_steps, timeline_index=timeline_index) \
+            .calculate_step(
+                ConstructionMarginCalculatorBuilder().with_date_of_financial_close(datetime(2020, 1, 3, 12)).build(), 0.3)
+        CashFlowStepsCalculator(without_calculate_steps, timeline_index=timeline_index) \
+            .calculate_step(
+                ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop)
+                    .with_date_of_financial_close(datetime(2020, 1, 3, 12)).build(), 0.3)
+
+        assert without_calculate_steps == with_calculate_steps
+        assert (with_calculate_steps[2].development_cost == 11) == (timeline_index is not None)
@@ -0,0 +1,18 @@
+import io
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_csv import read_cash_flow_steps, write_cash_flow_steps
+
+# Writing steps and then reading them back should give the same steps, including
+# properties that are None.
+def test_steps_are_the_same_after_writing_and_reading():
+    steps = [
+        CashFlowStep(datetime(2020, 1, 1), 13, None, 11, 3.96, 10, -0.66, 3.3000000000000003),
+        CashFlowStep(datetime(2020, 1, 1, 12), None, None, None, None, None, None, None),
+    ]
+    file = io.StringIO()
+
+    write_cash_flow_steps(file, steps)
+    file.seek(0)
+
+    assert list(read_cash_flow_steps(file)) == steps
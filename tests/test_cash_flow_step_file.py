@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step_file import read_cash_flow_step_file, write_cash_flow_step_file
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# Steps read from a file should be the same as the steps written to it, and the
+# calculators should be able to use them directly, without changing the file
+# (unless asked to).
+def create_steps():
+    steps = CashFlowStepsBuilder().build()
+    for step in steps:
+        step.special_capital_costs = 13
+        step.development_cost = 11
+        step.balance_of_plant_costs_at_financial_close = 10
+    return steps
+
+
+def test_steps_are_the_same_after_writing_and_reading(tmp_path):
+    path = str(tmp_path / 'steps.cfs')
+
+    write_cash_flow_step_file(path, CashFlowStepTable.from_steps(create_steps()))
+
+    steps = read_cash_flow_step_file(path)
+    assert isinstance(steps.construction_profit, np.memmap)
+    assert steps.to_steps() == create_steps()
+
+
+def test_calculators_can_use_the_steps_without_changing_the_file(tmp_path):
+    path = str(tmp_path / 'steps.cfs')
+    write_cash_flow_step_file(path, CashFlowStepTable.from_steps(create_steps()))
+    expected_steps = create_steps()
+    ConstructionMarginCalculatorBuilder().build().calculate_steps(expected_steps, 0.3)
+
+    steps = read_cash_flow_step_file(path)
+    ConstructionMarginCalculatorBuilder().build().calculate_table(steps, 0.3)
+
+    assert steps.to_steps() == expected_steps
+    assert read_cash_flow_step_file(path).to_steps() == create_steps()
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'steps.cfs'
+    path.write_bytes(b'not a cash flow step file' * 10)
+
+    with pytest.raises(ValueError):
+        read_cash_flow_step_file(str(path))
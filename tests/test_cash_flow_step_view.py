@@ -0,0 +1,79 @@
+import sys
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, CASH_FLOW_STEP_FIELDS
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator)
+from tests.cash_flow_step_builder import CashFlowStepBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# CashFlowStepView is a compact replacement for CashFlowStep, so these tests
+# check that the calculators give the same results when working on views, and
+# that the views really are smaller.
+date_of_financial_close = datetime(2020, 1, 1)
+
+
+def create_step():
+    return CashFlowStepBuilder().starting_on(date_of_financial_close).without_values().build()
+
+
+def create_calculator(calculator_class):
+    return ConstructionMarginCalculatorBuilder(calculator_class) \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .with_inflation_rate(1.1) \
+        .build()
+
+
+def test_construction_margin_calculator_works_on_views():
+    expected_step = create_step()
+    table = CashFlowStepTable.from_steps([create_step()])
+
+    create_calculator(ConstructionMarginCalculator).calculate_steps([expected_step], 0.3)
+    create_calculator(ConstructionMarginCalculator).calculate_steps(table, 0.3)
+
+    assert table[0].to_step() == expected_step
+
+
+def test_cash_flow_steps_calculator_works_on_views():
+    expected_step = create_step()
+    table = CashFlowStepTable.from_steps([create_step()])
+
+    create_calculator(ConstructionMarginCalculatorWithoutLoop).calculate_step(expected_step, 0.3)
+    CashFlowStepsCalculator(table).calculate_step(
+        create_calculator(ConstructionMarginCalculatorWithoutLoop), 0.3)
+
+    assert table[0].to_step() == expected_step
+
+
+def test_blackboard_calculators_work_on_views():
+    table = CashFlowStepTable.from_steps([create_step()])
+    step = table[0]
+    sut = ConstructionMarginCalculatorBlackboardPattern(11, 13, date_of_financial_close, True, 0.1)
+
+    assert sut.calculate_step(step, 0.3) == False
+
+    TurbineCostCalculator().calculate_step(step, 0.3)
+    BalanceOfPlantCalculator().calculate_step(step, 0.3)
+
+    assert sut.calculate_step(step, 0.3) == True
+    assert step.construction_profit == -1 * (1 + 1) * 0.1
+
+
+def test_view_is_much_smaller_than_cash_flow_step():
+    step = CashFlowStep(date_of_financial_close, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0)
+    view = CashFlowStepTable.from_steps([step])[0]
+    table_bytes_per_step = 8 * len(CASH_FLOW_STEP_FIELDS)
+
+    step_bytes = \
+        sys.getsizeof(step) + \
+        sys.getsizeof(step.__dict__) + \
+        sum(sys.getsizeof(value) for value in step.__dict__.values())
+
+    assert not hasattr(view, '__dict__')
+    assert sys.getsizeof(view) + table_bytes_per_step < step_bytes / 2
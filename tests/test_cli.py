@@ -0,0 +1,130 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step_csv import write_cash_flow_steps
+from cash_flow_calculator.cash_flow_step_file import read_cash_flow_step_file, write_cash_flow_step_file
+from cash_flow_calculator import cli
+from cash_flow_calculator.cli import main, run, create_calculator
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+
+calculator_parameters = {
+    'balance_of_plant_costs_at_financial_close': 10,
+    'development_cost': 11,
+    'turbine_costs': 12,
+    'special_capital_costs': 13,
+    'date_of_financial_close': '2020-01-10T00:00:00',
+    'in_selling_mode': True,
+    'epc_margin': 0.1,
+    'inflation_rate': 0.05,
+    'inflation_mode': 2,
+}
+
+
+# One project with CSV steps, one with NumPy steps and one with binary steps
+def create_portfolio(directory):
+    with open(directory / 'north.csv', 'w', newline='') as file:
+        write_cash_flow_steps(file, CashFlowStepsBuilder().with_number_of_steps(30).build())
+    write_cash_flow_step_file(str(directory / 'south.cfs'), CashFlowStepsBuilder().with_number_of_steps(45).build_table())
+    np.savez(
+        directory / 'east.npz',
+        start_of_step=CashFlowStepsBuilder().with_number_of_steps(20).build_table().start_of_step.astype('datetime64[D]'))
+
+    portfolio = {
+        'projects': [
+            {'name': 'north', 'steps': 'north.csv', 'fraction_of_spend': 0.3, 'calculator': calculator_parameters},
+            {
+                'name': 'south',
+                'steps': 'south.cfs',
+                'fraction_of_spend': 0.2,
+                'calculator': {**calculator_parameters, 'in_selling_mode': False},
+            },
+            {'name': 'east', 'steps': 'east.npz', 'fraction_of_spend': 0.1, 'calculator': calculator_parameters},
+        ]
+    }
+    path = directory / 'portfolio.json'
+    path.write_text(json.dumps(portfolio))
+    return path
+
+
+def expected_steps(number_of_steps: int, fraction_of_spend: float, **parameters):
+    steps = CashFlowStepsBuilder().with_number_of_steps(number_of_steps).build()
+    create_calculator({**calculator_parameters, **parameters}).calculate_steps(steps, fraction_of_spend)
+    return steps
+
+
+def test_results_match_calculating_each_project(tmp_path):
+    portfolio = create_portfolio(tmp_path)
+
+    assert main([str(portfolio), '--output', str(tmp_path / 'results'), '--workers', '2', '--chunk-size', '16']) == 0
+
+    assert read_cash_flow_step_file(str(tmp_path / 'results' / 'north.cfs')).to_steps() == \
+        expected_steps(30, 0.3)
+    assert read_cash_flow_step_file(str(tmp_path / 'results' / 'south.cfs')).to_steps() == \
+        expected_steps(45, 0.2, in_selling_mode=False)
+    assert read_cash_flow_step_file(str(tmp_path / 'results' / 'east.cfs')).to_steps() == \
+        expected_steps(20, 0.1)
+
+
+def test_throughput_statistics_are_printed(tmp_path):
+    out = io.StringIO()
+
+    statistics = run(str(create_portfolio(tmp_path)), str(tmp_path / 'results'), max_workers=1, out=out)
+
+    assert statistics['projects'] == 3
+    assert statistics['steps'] == 95
+    assert '3 projects, 95 steps' in out.getvalue()
+    assert 'steps/s' in out.getvalue()
+
+
+# Each task waits until there is one for every worker, which only happens if
+# the projects are calculated at the same time
+class BarrierExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers=max_workers)
+        self.barrier = threading.Barrier(max_workers, timeout=5)
+        self.threads = set()
+
+    def submit(self, function, *arguments):
+        def wait_for_other_workers():
+            self.threads.add(threading.get_ident())
+            self.barrier.wait()
+            return function(*arguments)
+        return super().submit(wait_for_other_workers)
+
+
+def test_more_than_one_worker_is_used_without_a_chunk_size(tmp_path, monkeypatch):
+    executors = []
+    monkeypatch.setattr(
+        cli, 'ProcessPoolExecutor', lambda max_workers: executors.append(BarrierExecutor(max_workers)) or executors[-1])
+
+    run(str(create_portfolio(tmp_path)), str(tmp_path / 'results'), max_workers=3, out=io.StringIO())
+
+    assert len(executors[0].threads) == 3
+    assert read_cash_flow_step_file(str(tmp_path / 'results' / 'east.cfs')).to_steps() == \
+        expected_steps(20, 0.1)
+
+
+def test_project_names_must_be_different(tmp_path):
+    portfolio = create_portfolio(tmp_path)
+    definition = json.loads(portfolio.read_text())
+    definition['projects'][1]['name'] = 'north'
+    portfolio.write_text(json.dumps(definition))
+
+    with pytest.raises(ValueError):
+        run(str(portfolio), str(tmp_path / 'results'), out=io.StringIO())
+
+
+@pytest.mark.parametrize('name', ['../north', 'results/north', '..', ''])
+def test_project_names_cannot_be_paths(tmp_path, name):
+    portfolio = create_portfolio(tmp_path)
+    definition = json.loads(portfolio.read_text())
+    definition['projects'][0]['name'] = name
+    portfolio.write_text(json.dumps(definition))
+
+    with pytest.raises(ValueError):
+        run(str(portfolio), str(tmp_path / 'results'), out=io.StringIO())
+
+    assert not (tmp_path / 'north.cfs').exists()
@@ -0,0 +1,32 @@
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The column based calculation is an optimisation of calculate_steps, so rather
+# than repeating the calculations in the test, it is simplest to check that the
+# two give exactly the same results, for both selling and owning mode, and for
+# steps before, at and after the financial close.
+def create_calculator(in_selling_mode: bool):
+    return ConstructionMarginCalculatorBuilder().in_selling_mode(in_selling_mode).with_inflation_rate(1.1).build()
+
+
+def test_calculate_table_matches_calculate_steps_in_selling_mode():
+    fraction_of_spend = 0.3
+    expected_steps = CashFlowStepsBuilder().build()
+    table = CashFlowStepTable.from_steps(CashFlowStepsBuilder().build())
+
+    create_calculator(True).calculate_steps(expected_steps, fraction_of_spend)
+    create_calculator(True).calculate_table(table, fraction_of_spend)
+
+    assert table.to_steps() == expected_steps
+
+
+def test_calculate_table_matches_calculate_steps_in_owning_mode():
+    fraction_of_spend = 0.3
+    expected_steps = CashFlowStepsBuilder().build()
+    table = CashFlowStepTable.from_steps(CashFlowStepsBuilder().build())
+
+    create_calculator(False).calculate_steps(expected_steps, fraction_of_spend)
+    create_calculator(False).calculate_table(table, fraction_of_spend)
+
+    assert table.to_steps() == expected_steps
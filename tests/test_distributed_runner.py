@@ -0,0 +1,170 @@
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import pytest
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.distributed_runner import Coordinator, run_worker
+from cash_flow_calculator.portfolio_runner import Project
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The coordinator should give exactly the same results as calculating each
+# project with CashFlowStepsCalculator in this process, with the workers in
+# separate processes connecting over local TCP sockets, as they would from
+# other machines.
+authkey = b'test'
+
+
+# A calculator that fails (or kills its worker, or hangs until the release
+# event is set) the first time it is used in any worker, using a marker file to
+# know whether it has failed already
+class FailOnceCalculator:
+    def __init__(self, calculator, marker_path: str, crash: bool = False, release=None):
+        self.calculator = calculator
+        self.marker_path = marker_path
+        self.crash = crash
+        self.release = release
+
+    def calculate_step(self, step, fraction_of_spend: float):
+        self._fail_once()
+        self.calculator.calculate_step(step, fraction_of_spend)
+
+    def _fail_once(self):
+        try:
+            open(self.marker_path, 'x').close()
+        except FileExistsError:
+            return
+        if self.crash:
+            os._exit(1)
+        if self.release is not None:
+            self.release.wait(timeout=60)
+        raise ValueError('failed once')
+
+
+# A calculator that always fails
+class FailingCalculator:
+    def calculate_step(self, step, fraction_of_spend: float):
+        raise ValueError('always fails')
+
+
+def expected_steps(number_of_steps: int, in_selling_mode: bool = True):
+    steps = CashFlowStepsBuilder().with_number_of_steps(number_of_steps).build()
+    calculator = ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop) \
+        .in_selling_mode(in_selling_mode) \
+        .build()
+    CashFlowStepsCalculator(steps).calculate_step(calculator, 0.3)
+    return steps
+
+
+def run(coordinator: Coordinator, number_of_workers: int, join_timeout: float = 10):
+    address = coordinator.address if coordinator._listener is not None else coordinator.start()
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(address, authkey)) for _ in range(number_of_workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        return coordinator.wait()
+    finally:
+        for worker in workers:
+            worker.join(timeout=join_timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+
+def test_portfolio_matches_calculating_projects_serially():
+    projects = [
+        Project(calculator, CashFlowStepsBuilder().with_number_of_steps(25).build_table(), 0.3)
+        for calculator in (
+            ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).in_selling_mode().build(),
+            ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).in_selling_mode(False).build(),
+            ConstructionMarginCalculatorBuilder().in_selling_mode().build())
+    ]
+
+    statistics = run(Coordinator(projects, authkey, chunk_size=7), number_of_workers=3)
+
+    for project in projects:
+        assert project.steps.to_steps() == expected_steps(25, project.calculator.in_selling_mode)
+    assert statistics.partitions == 12
+    assert statistics.retries == 0
+    assert sum(statistics.partitions_by_worker.values()) == 12
+
+
+@pytest.mark.parametrize('crash', [False, True])
+def test_failed_partitions_are_retried(tmp_path, crash):
+    calculator = FailOnceCalculator(
+        ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).build(),
+        str(tmp_path / 'failed'),
+        crash)
+    projects = [Project(calculator, CashFlowStepsBuilder().with_number_of_steps(20).build_table(), 0.3)]
+
+    statistics = run(Coordinator(projects, authkey, chunk_size=5), number_of_workers=2)
+
+    assert projects[0].steps.to_steps() == expected_steps(20)
+    # unless the other worker had already stolen the partition
+    assert statistics.retries == 1 or statistics.stolen > 0
+
+
+def test_idle_workers_steal_partitions_from_slow_workers(tmp_path):
+    with multiprocessing.get_context('spawn').Manager() as manager:
+        release = manager.Event()
+        calculator = FailOnceCalculator(
+            ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).build(),
+            str(tmp_path / 'hung'),
+            release=release)
+        projects = [Project(calculator, CashFlowStepsBuilder().with_number_of_steps(20).build_table(), 0.3)]
+        coordinator = Coordinator(projects, authkey, chunk_size=5)
+
+        started = time.perf_counter()
+        try:
+            statistics = run(coordinator, number_of_workers=2)
+        finally:
+            # the hung worker carries on once the run has finished
+            release.set()
+
+        assert time.perf_counter() - started < 30
+        assert projects[0].steps.to_steps() == expected_steps(20)
+        assert statistics.stolen >= 1
+
+
+def test_partitions_that_keep_failing_fail_the_run():
+    projects = [Project(FailingCalculator(), CashFlowStepsBuilder().build_table(), 0.3)]
+
+    with pytest.raises(RuntimeError, match='failed 2 times'):
+        run(Coordinator(projects, authkey, max_attempts=2), number_of_workers=2)
+
+
+def test_failed_partitions_are_retried_while_another_worker_is_still_calculating_them():
+    sut = Coordinator([Project(FailingCalculator(), CashFlowStepsBuilder().build_table(), 0.3)], authkey)
+    sut._connected_workers = {0, 1}
+    partition = sut._next_partition(0)
+    assert sut._next_partition(1) == partition
+
+    sut._fail(partition, 0)
+
+    assert list(sut._pending) == [partition]
+    assert sut.statistics.retries == 1
+    # it isn't given back to the worker it failed on, while there is another
+    assert not sut._can_retry(partition, 0)
+    assert sut._can_retry(partition, 1)
+    sut._connected_workers = {0}
+    assert sut._can_retry(partition, 0)
+
+
+def test_workers_with_the_wrong_authkey_are_logged_and_ignored(caplog):
+    projects = [Project(ConstructionMarginCalculatorBuilder().build(), CashFlowStepsBuilder().with_number_of_steps(10).build_table(), 0.3)]
+    coordinator = Coordinator(projects, authkey)
+    address = coordinator.start()
+
+    with caplog.at_level(logging.WARNING, logger='cash_flow_calculator.distributed_runner'):
+        with pytest.raises(AuthenticationError):
+            Client(address, authkey=b'wrong')
+        statistics = run(coordinator, number_of_workers=1)
+
+    assert projects[0].steps.to_steps() == expected_steps(10)
+    assert sum(statistics.partitions_by_worker.values()) == 1
+    assert 'failed to authenticate' in caplog.text
@@ -0,0 +1,59 @@
+from datetime import datetime
+import pytest
+from cash_flow_calculator.execution_plan import build_execution_plan
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator,
+    CashFlowStepCalculator)
+from tests.cash_flow_step_builder import CashFlowStepBuilder
+
+any_double = 5.55555
+
+# The execution plan is generic, so it is tested with small mock calculators that
+# only declare their inputs and outputs, and then with the real blackboard
+# calculators via the CashFlowStepCalculator.
+class MockCalculator:
+    def __init__(self, inputs: tuple, outputs: tuple):
+        self.inputs = inputs
+        self.outputs = outputs
+
+
+def test_calculators_run_after_the_calculators_they_depend_on():
+    needs_a = MockCalculator(inputs=('a',), outputs=('b',))
+    produces_a = MockCalculator(inputs=(), outputs=('a',))
+
+    assert build_execution_plan([needs_a, produces_a]) == [produces_a, needs_a]
+
+
+def test_independent_calculators_keep_their_order():
+    first = MockCalculator(inputs=(), outputs=('a',))
+    second = MockCalculator(inputs=(), outputs=('b',))
+
+    assert build_execution_plan([first, second]) == [first, second]
+
+
+def test_cyclic_dependencies_are_detected_when_building_the_plan():
+    needs_b = MockCalculator(inputs=('b',), outputs=('a',))
+    needs_a = MockCalculator(inputs=('a',), outputs=('b',))
+
+    with pytest.raises(ValueError):
+        build_execution_plan([needs_b, needs_a])
+
+
+def test_cash_flow_step_calculator_runs_calculators_in_dependency_order():
+    epc_margin = 0.1
+    construction_margin_calculator = ConstructionMarginCalculatorBlackboardPattern(
+        any_double, any_double, datetime(2020, 1, 1), True, epc_margin)
+    cash_flow_step = CashFlowStepBuilder() \
+        .with_turbine_cost_including_margin(None) \
+        .with_balance_of_plant_cost_including_margin(None) \
+        .build()
+
+    sut = CashFlowStepCalculator([
+        construction_margin_calculator,
+        TurbineCostCalculator(),
+        BalanceOfPlantCalculator()])
+    sut.calculate_step(cash_flow_step, 0.3)
+
+    assert cash_flow_step.construction_profit == -1 * (1 + 1) * epc_margin
@@ -0,0 +1,67 @@
+from datetime import datetime
+from cash_flow_calculator.incremental_construction_margin_calculator import IncrementalConstructionMarginCalculator
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+from tests.mock_inflation import CountingMockInflation
+
+# After each update, the steps should be the same as calculating them from
+# scratch with the updated calculator, but only the values that depend on the
+# changed input should have been recalculated.
+fraction_of_spend = 0.3
+
+
+def calculator_builder():
+    return ConstructionMarginCalculatorMockableAbstractionBuilder() \
+        .with_date_of_financial_close(datetime(2020, 1, 3)) \
+        .in_selling_mode() \
+        .with_inflation(1.2)
+
+
+def calculate_from_scratch(calculator):
+    steps = CashFlowStepsBuilder().build()
+    for step in steps:
+        calculator.calculate_step(step, fraction_of_spend)
+    return steps
+
+
+def test_changing_epc_margin_only_recalculates_margin_values():
+    inflation = CountingMockInflation(1.2)
+    sut = IncrementalConstructionMarginCalculator(
+        calculator_builder().with_inflation_calculator(inflation).build(),
+        CashFlowStepsBuilder().build_table(),
+        fraction_of_spend)
+    inflation.calls = 0
+
+    recalculated = sut.update(epc_margin=0.2)
+
+    assert recalculated == {
+        'turbine_cost_including_margin',
+        'balance_of_plant_cost_including_margin',
+        'construction_profit'}
+    assert inflation.calls == 0
+    assert sut.steps.to_steps() == calculate_from_scratch(calculator_builder().with_epc_margin(0.2).build())
+
+
+def test_changing_date_of_financial_close_moves_milestones():
+    sut = IncrementalConstructionMarginCalculator(
+        calculator_builder().build(),
+        CashFlowStepsBuilder().build_table(),
+        fraction_of_spend)
+
+    recalculated = sut.update(date_of_financial_close=datetime(2020, 1, 4))
+
+    assert recalculated == {'milestones'}
+    assert sut.steps.to_steps() == \
+        calculate_from_scratch(calculator_builder().with_date_of_financial_close(datetime(2020, 1, 4)).build())
+
+
+def test_changing_selling_mode_and_costs_matches_calculating_from_scratch():
+    sut = IncrementalConstructionMarginCalculator(
+        calculator_builder().build(),
+        CashFlowStepsBuilder().build_table(),
+        fraction_of_spend)
+
+    sut.update(in_selling_mode=False, turbine_costs=15)
+
+    assert sut.steps.to_steps() == \
+        calculate_from_scratch(calculator_builder().in_selling_mode(False).with_turbine_costs(15).build())
@@ -0,0 +1,120 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from cash_flow_calculator.inflation_index import (
+    InflationIndex,
+    shared_inflation_index,
+    CURVE_DAYS,
+    NO_INFLATION,
+    ANNUAL_INFLATION,
+    DAILY_INFLATION,
+    MONTHLY_INFLATION)
+
+# Each inflation mode is tested in isolation, with the calculation included in
+# the test. The inflation is 1 at the date of financial close in every mode.
+inflation_rate = 0.1
+date_of_financial_close = datetime(2020, 1, 15)
+
+
+def test_inflation_is_one_at_financial_close():
+    for inflation_mode in (NO_INFLATION, ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION):
+        sut = InflationIndex(inflation_rate, inflation_mode, date_of_financial_close)
+
+        assert sut.inflation_to(date_of_financial_close) == 1
+
+
+def test_no_inflation_is_always_one():
+    sut = InflationIndex(inflation_rate, NO_INFLATION, date_of_financial_close)
+
+    assert sut.inflation_to(datetime(2030, 6, 1)) == 1
+
+
+def test_daily_inflation_compounds_on_each_day():
+    days = 100
+    sut = InflationIndex(inflation_rate, DAILY_INFLATION, date_of_financial_close)
+
+    assert sut.inflation_to(datetime(2020, 4, 24)) == \
+        pytest.approx((1 + inflation_rate) ** (days / 365.25))
+
+
+def test_monthly_inflation_compounds_on_complete_months():
+    complete_months = 2
+    sut = InflationIndex(inflation_rate, MONTHLY_INFLATION, date_of_financial_close)
+
+    assert sut.inflation_to(datetime(2020, 4, 14)) == \
+        pytest.approx((1 + inflation_rate) ** (complete_months / 12))
+
+
+def test_annual_inflation_compounds_on_complete_years():
+    complete_years = 1
+    sut = InflationIndex(inflation_rate, ANNUAL_INFLATION, date_of_financial_close)
+
+    assert sut.inflation_to(datetime(2022, 1, 14)) == \
+        pytest.approx((1 + inflation_rate) ** complete_years)
+
+
+def test_inflation_before_financial_close_deflates():
+    sut = InflationIndex(inflation_rate, ANNUAL_INFLATION, date_of_financial_close)
+
+    assert sut.inflation_to(datetime(2019, 6, 1)) == pytest.approx(1 / (1 + inflation_rate))
+
+
+def test_inflation_to_many_matches_inflation_to():
+    dates = [datetime(2019, 1, 1), datetime(2020, 1, 15), datetime(2024, 2, 29)]
+    sut = InflationIndex(inflation_rate, DAILY_INFLATION, date_of_financial_close)
+
+    inflation = sut.inflation_to_many(np.array(dates, dtype='datetime64[us]'))
+
+    assert inflation.tolist() == [sut.inflation_to(when) for when in dates]
+
+
+def test_index_can_be_read_from_several_threads_while_the_curve_is_extended():
+    dates = [date_of_financial_close + timedelta(days=day) for day in range(-5_000, 5_000, 7)]
+    expected = InflationIndex(inflation_rate, DAILY_INFLATION, date_of_financial_close).inflation_to_many(
+        np.array(dates, dtype='datetime64[us]')).tolist()
+    sut = InflationIndex(inflation_rate, DAILY_INFLATION, date_of_financial_close)
+
+    # each thread reads the dates in a different order, so they extend the
+    # curve in both directions while the others are reading it
+    def read(thread: int):
+        order = dates[thread::4] + dates[:thread:-1]
+        return {when: sut.inflation_to(when) for when in order}
+
+    # switch threads as often as possible, so they interleave inside the index
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(read, range(8)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    for result in results:
+        assert [result[when] for when in dates if when in result] == \
+            [value for when, value in zip(dates, expected) if when in result]
+
+
+def test_far_off_dates_are_calculated_without_extending_the_curve_to_them():
+    far_off_dates = [datetime(9999, 12, 31), datetime(1, 1, 1)]
+    # low enough not to overflow over 8000 years
+    low_inflation_rate = 0.01
+    sut = InflationIndex(low_inflation_rate, DAILY_INFLATION, date_of_financial_close)
+
+    inflation = [sut.inflation_to(when) for when in far_off_dates]
+
+    assert inflation == pytest.approx([
+        (1 + low_inflation_rate) ** ((when - date_of_financial_close).days / 365.25) for when in far_off_dates])
+    assert sut.inflation_to_many(far_off_dates + [date_of_financial_close]).tolist() == inflation + [1]
+    assert len(sut._curve[1]) <= CURVE_DAYS
+
+
+def test_calculators_with_the_same_parameters_share_an_index():
+    assert shared_inflation_index(inflation_rate, DAILY_INFLATION, date_of_financial_close) is \
+        shared_inflation_index(inflation_rate, DAILY_INFLATION, date_of_financial_close)
+
+
+def test_unknown_inflation_mode_is_rejected():
+    with pytest.raises(ValueError):
+        InflationIndex(inflation_rate, 4, date_of_financial_close)
@@ -0,0 +1,82 @@
+import weakref
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    TurbineCostCalculator,
+    CashFlowStepCalculator)
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+from cash_flow_calculator.instrumentation import CalculatorInstrumentation
+from tests.cash_flow_step_builder import CashFlowStepBuilder, CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The timings can't be tested exactly, so these tests check the counts, and that
+# the hooks are called.
+def create_step():
+    return CashFlowStepBuilder().starting_on(datetime(2020, 1, 1)).without_values().build()
+
+
+# A blackboard calculator that doesn't declare its inputs, so the execution
+# plan can't know to run it after the TurbineCostCalculator
+class UndeclaredTurbineCostDoubler:
+    def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
+        if step.turbine_cost_including_margin is None:
+            return False
+        step.special_capital_costs = step.turbine_cost_including_margin * 2
+        return True
+
+
+def test_blackboard_calls_and_retries_are_recorded():
+    doubler = UndeclaredTurbineCostDoubler()
+    instrumentation = CalculatorInstrumentation()
+    sut = CashFlowStepCalculator([doubler, TurbineCostCalculator()], instrumentation)
+
+    sut.calculate_step(create_step(), 0.3)
+
+    statistics = {statistics.calculator: statistics for statistics in instrumentation.report()}
+    assert statistics['UndeclaredTurbineCostDoubler'].calls == 2
+    assert statistics['UndeclaredTurbineCostDoubler'].retries == 1
+    assert statistics['TurbineCostCalculator'].calls == 1
+    assert statistics['TurbineCostCalculator'].retries == 0
+
+
+def test_steps_calculated_by_cash_flow_steps_calculator_are_recorded():
+    calls = []
+    instrumentation = CalculatorInstrumentation(hooks=[calls.append])
+    calculator = ConstructionMarginCalculatorBuilder().build()
+    table = CashFlowStepsBuilder().with_number_of_steps(3).build_table()
+
+    CashFlowStepsCalculator(table, instrumentation).calculate_step(calculator, 0.3)
+
+    [statistics] = instrumentation.report()
+    assert statistics.calculator == 'ConstructionMarginCalculator'
+    assert statistics.calls == 1
+    assert statistics.steps == 3
+    assert [call.steps for call in calls] == [3]
+
+
+def test_steps_from_a_generator_are_counted():
+    instrumentation = CalculatorInstrumentation()
+    steps = CashFlowStepsBuilder().with_number_of_steps(3).build()
+    expected_steps = CashFlowStepsBuilder().with_number_of_steps(3).build()
+    ConstructionMarginCalculatorBuilder().build().calculate_steps(expected_steps, 0.3)
+
+    CashFlowStepsCalculator((step for step in steps), instrumentation) \
+        .calculate_step(ConstructionMarginCalculatorBuilder().build(), 0.3)
+
+    [statistics] = instrumentation.report()
+    assert statistics.steps == 3
+    assert steps == expected_steps
+
+
+def test_instrumented_calculators_are_not_kept_alive():
+    instrumentation = CalculatorInstrumentation()
+    calculator = TurbineCostCalculator()
+    reference = weakref.ref(calculator)
+
+    CashFlowStepCalculator([calculator], instrumentation).calculate_step(create_step(), 0.3)
+    CashFlowStepsCalculator([create_step()], instrumentation).calculate_step(calculator, 0.3)
+    del calculator
+
+    assert reference() is None
+    [statistics] = instrumentation.report()
+    assert statistics.calls == 2
@@ -0,0 +1,132 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable, VALUE_FIELDS
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator,
+    CashFlowStepCalculator)
+from cash_flow_calculator.inflation_index import DAILY_INFLATION, NO_INFLATION
+from cash_flow_calculator.kernel_compiler import (
+    MAX_CACHED_KERNELS,
+    compile_kernel,
+    compile_chain,
+    kernel_source)
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The kernels are an optimisation of the calculators, so the tests check that
+# they give exactly the same results, for each of the configurations that
+# change the generated code.
+date_of_financial_close = datetime(2020, 1, 3)
+
+
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+@pytest.mark.parametrize('inflation_mode', [DAILY_INFLATION, NO_INFLATION])
+def test_kernel_matches_construction_margin_calculator(in_selling_mode, inflation_mode):
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .in_selling_mode(in_selling_mode) \
+        .with_inflation_mode(inflation_mode) \
+        .build()
+    expected_steps = CashFlowStepsBuilder().build()
+    calculator.calculate_steps(expected_steps, 0.3)
+    steps = CashFlowStepsBuilder().build()
+
+    compile_kernel(calculator)(steps, 0.3)
+
+    assert steps == expected_steps
+
+
+# NaN values can't be compared with ==, so the steps are compared as columns
+def assert_steps_equal(steps, expected_steps):
+    table = CashFlowStepTable.from_steps(steps)
+    expected_table = CashFlowStepTable.from_steps(expected_steps)
+    for name in VALUE_FIELDS:
+        np.testing.assert_array_equal(getattr(table, name), getattr(expected_table, name), err_msg=name)
+
+
+@pytest.mark.parametrize('inflation_mode', [DAILY_INFLATION, NO_INFLATION])
+def test_kernel_matches_construction_margin_calculator_for_steps_without_a_start(inflation_mode):
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .with_inflation_mode(inflation_mode) \
+        .build()
+    expected_steps = CashFlowStepsBuilder().build() + [CashFlowStep(None, None, None, None, None, None, None, None)]
+    calculator.calculate_steps(expected_steps, 0.3)
+    steps = CashFlowStepsBuilder().build() + [CashFlowStep(None, None, None, None, None, None, None, None)]
+
+    compile_kernel(calculator)(steps, 0.3)
+
+    assert_steps_equal(steps, expected_steps)
+    assert np.isnan(steps[-1].turbine_cost_including_margin)
+
+
+def test_kernel_matches_construction_margin_calculator_for_parameters_that_are_not_finite():
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_turbine_costs(float('nan')) \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .with_epc_margin(float('inf')) \
+        .build()
+    expected_steps = CashFlowStepsBuilder().build()
+    calculator.calculate_steps(expected_steps, 0.3)
+    steps = CashFlowStepsBuilder().build()
+
+    compile_kernel(calculator)(steps, 0.3)
+
+    assert_steps_equal(steps, expected_steps)
+
+
+def test_kernel_specialises_away_the_selling_mode_branch():
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .build()
+
+    assert 'in_selling_mode' not in kernel_source([calculator])
+
+
+def test_kernels_are_cached_by_configuration():
+    def create_calculator():
+        return ConstructionMarginCalculatorBuilder() \
+            .with_date_of_financial_close(date_of_financial_close) \
+            .build()
+
+    assert compile_kernel(create_calculator()) is compile_kernel(create_calculator())
+
+
+def test_least_recently_used_kernels_are_removed_from_the_cache():
+    def create_calculator(epc_margin: float):
+        return ConstructionMarginCalculatorBuilder() \
+            .with_date_of_financial_close(date_of_financial_close) \
+            .with_epc_margin(epc_margin) \
+            .build()
+    first = compile_kernel(create_calculator(0))
+
+    for epc_margin in range(1, MAX_CACHED_KERNELS + 1):
+        compile_kernel(create_calculator(epc_margin))
+
+    assert compile_kernel(create_calculator(0)) is not first
+
+
+def test_chain_kernel_matches_blackboard_calculators():
+    def create_calculators():
+        return [
+            ConstructionMarginCalculatorBlackboardPattern(11, 13, date_of_financial_close, True, 0.1),
+            TurbineCostCalculator(),
+            BalanceOfPlantCalculator()]
+    expected_steps = CashFlowStepsBuilder().build()
+    step_calculator = CashFlowStepCalculator(create_calculators())
+    for step in expected_steps:
+        step_calculator.calculate_step(step, 0.3)
+    steps = CashFlowStepsBuilder().build()
+
+    compile_chain(create_calculators())(steps, 0.3)
+
+    assert steps == expected_steps
+
+
+def test_chain_without_producers_is_rejected():
+    with pytest.raises(ValueError):
+        compile_chain([ConstructionMarginCalculatorBlackboardPattern(11, 13, date_of_financial_close, True, 0.1)])
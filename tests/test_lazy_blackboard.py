@@ -0,0 +1,72 @@
+from datetime import datetime
+import pytest
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.construction_margin_calculator_blackboard_pattern import (
+    ConstructionMarginCalculatorBlackboardPattern,
+    TurbineCostCalculator,
+    BalanceOfPlantCalculator)
+from cash_flow_calculator.lazy_blackboard import LazyCashFlowStepCalculator
+from tests.cash_flow_step_builder import CashFlowStepBuilder
+
+any_double = 5.55555
+
+# Producers should only be run when a consumer reads one of their outputs, and
+# then only once.
+class CountingProducer:
+    inputs = ()
+
+    def __init__(self, output: str):
+        self.outputs = (output,)
+        self.calls = 0
+
+    def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
+        self.calls += 1
+        setattr(step, self.outputs[0], fraction_of_spend)
+
+
+class TurbineCostReader:
+    def calculate_step(self, step: CashFlowStep, fraction_of_spend: float):
+        step.construction_profit = step.turbine_cost_including_margin + step.turbine_cost_including_margin
+
+
+def create_step():
+    return CashFlowStepBuilder() \
+        .with_turbine_cost_including_margin(None) \
+        .with_balance_of_plant_cost_including_margin(None) \
+        .build()
+
+
+def test_producers_run_when_their_outputs_are_read():
+    epc_margin = 0.1
+    step = create_step()
+    sut = LazyCashFlowStepCalculator(
+        producers=[TurbineCostCalculator(), BalanceOfPlantCalculator()],
+        consumers=[ConstructionMarginCalculatorBlackboardPattern(
+            any_double, any_double, datetime(2020, 1, 1), True, epc_margin)])
+
+    sut.calculate_step(step, 0.3)
+
+    assert step.construction_profit == -1 * (1 + 1) * epc_margin
+
+
+def test_producers_run_once_and_unread_outputs_are_not_calculated():
+    turbine_cost_producer = CountingProducer('turbine_cost_including_margin')
+    unread_producer = CountingProducer('balance_of_plant_cost_including_margin')
+    step = create_step()
+    sut = LazyCashFlowStepCalculator(
+        producers=[turbine_cost_producer, unread_producer],
+        consumers=[TurbineCostReader()])
+
+    sut.calculate_step(step, 0.3)
+
+    assert step.construction_profit == 0.3 + 0.3
+    assert turbine_cost_producer.calls == 1
+    assert unread_producer.calls == 0
+    assert step.balance_of_plant_cost_including_margin is None
+
+
+def test_properties_can_only_have_one_producer():
+    with pytest.raises(ValueError):
+        LazyCashFlowStepCalculator(
+            producers=[TurbineCostCalculator(), CountingProducer('turbine_cost_including_margin')],
+            consumers=[])
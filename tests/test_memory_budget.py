@@ -0,0 +1,153 @@
+import tracemalloc
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.memory_budget import MemoryBudgetedCashFlowStepsCalculator
+from cash_flow_calculator.memory_estimate import estimate_bytes_per_step, chunk_size_for_budget
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+number_of_steps = 20_000
+
+
+def create_calculator(calculator_class=ConstructionMarginCalculator):
+    calculator = ConstructionMarginCalculatorBuilder(calculator_class).build()
+    # calculate the shared inflation curve for the whole timeline up front, so
+    # that it growing isn't counted in the memory of the chunks
+    calculator.inflation_index().inflation_to(datetime(2020, 1, 1) + timedelta(days=number_of_steps))
+    return calculator
+
+
+@pytest.mark.parametrize('calculator_class', [ConstructionMarginCalculator, ConstructionMarginCalculatorWithoutLoop])
+def test_results_match_calculate_steps(calculator_class):
+    expected_steps = CashFlowStepsBuilder().with_number_of_steps(2_500).build()
+    ConstructionMarginCalculatorBuilder().build().calculate_steps(expected_steps, 0.3)
+
+    sut = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(2_500).generate(), memory_budget=100_000)
+
+    assert list(sut.calculate_step(create_calculator(calculator_class), 0.3)) == expected_steps
+    assert len(sut.report.chunk_sizes) > 1
+
+
+def test_chunks_stay_within_the_budget():
+    sut = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(number_of_steps).generate(), memory_budget=500_000)
+
+    steps = sum(len(table) for table in sut.calculate_chunks(create_calculator(), 0.3))
+
+    assert steps == number_of_steps
+    assert sum(sut.report.chunk_sizes) == number_of_steps
+    assert sut.report.chunks_over_budget == 0
+    assert 0 < sut.report.peak_bytes <= 500_000
+
+
+def test_chunks_grow_to_fill_a_larger_budget():
+    small = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(number_of_steps).generate(), memory_budget=500_000)
+    large = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(number_of_steps).generate(), memory_budget=5_000_000)
+
+    for sut in (small, large):
+        for _ in sut.calculate_step(create_calculator(), 0.3):
+            pass
+
+    assert max(large.report.chunk_sizes) > 5 * max(small.report.chunk_sizes)
+    # the chunks start small and double while there is room in the budget
+    assert large.report.chunk_sizes[:3] == [1_000, 2_000, 4_000]
+
+
+def test_only_a_sample_of_the_chunks_is_measured():
+    sut = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(number_of_steps).generate(), memory_budget=500_000, sample_interval=4)
+
+    for _ in sut.calculate_step(create_calculator(), 0.3):
+        pass
+
+    measured = [peak is not None for peak in sut.report.chunk_peak_bytes]
+    assert measured == [chunk % 4 == 0 for chunk in range(len(sut.report.chunk_sizes))]
+    assert sut.report.measured_chunks < len(sut.report.chunk_sizes)
+    assert sut.report.chunks_over_budget == 0
+
+
+def test_the_peak_of_a_tracemalloc_session_that_was_already_tracing_is_kept():
+    tracemalloc.start()
+    try:
+        allocation = np.ones(1_000_000)
+        del allocation
+        _, peak_before = tracemalloc.get_traced_memory()
+
+        sut = MemoryBudgetedCashFlowStepsCalculator(
+        CashFlowStepsBuilder().with_number_of_steps(2_500).generate(), memory_budget=100_000)
+        for _ in sut.calculate_step(create_calculator(), 0.3):
+            pass
+
+        _, peak_after = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak_after >= peak_before >= 8_000_000
+    # the chunks didn't raise the peak, so their memory isn't known
+    assert sut.report.measured_chunks == 0
+
+
+def test_estimate_includes_table_columns_for_table_calculators():
+    assert estimate_bytes_per_step(create_calculator(ConstructionMarginCalculator)) > \
+        estimate_bytes_per_step(create_calculator(ConstructionMarginCalculatorWithoutLoop))
+
+
+def test_estimate_leaves_out_steps_that_are_already_in_memory():
+    assert estimate_bytes_per_step(create_calculator(), steps_in_memory=True) < \
+        estimate_bytes_per_step(create_calculator())
+
+
+# A calculator that records the number of steps of each table it calculates
+class ChunkRecordingCalculator(ConstructionMarginCalculator):
+    def __init__(self, **parameters):
+        super().__init__(**parameters)
+        self.chunk_sizes = []
+
+    def calculate_table(self, table, fraction_of_spend, timeline_index=None):
+        self.chunk_sizes.append(len(table))
+        super().calculate_table(table, fraction_of_spend, timeline_index)
+
+
+def test_steps_calculator_calculates_tables_in_chunks_that_fit_the_budget():
+    calculator = ConstructionMarginCalculatorBuilder(ChunkRecordingCalculator).build()
+    expected = CashFlowStepsBuilder().with_number_of_steps(2_500).build_table()
+    ConstructionMarginCalculatorBuilder().build().calculate_table(expected, 0.3)
+    table = CashFlowStepsBuilder().with_number_of_steps(2_500).build_table()
+
+    CashFlowStepsCalculator(table, memory_budget=10_000).calculate_step(calculator, 0.3)
+
+    assert table.to_steps() == expected.to_steps()
+    assert len(calculator.chunk_sizes) > 1
+    assert max(calculator.chunk_sizes) == chunk_size_for_budget(calculator, 10_000, steps_in_memory=True)
+
+
+@pytest.mark.parametrize('calculator_class', [ConstructionMarginCalculator, ConstructionMarginCalculatorWithoutLoop])
+def test_steps_calculator_with_a_budget_matches_calculating_all_the_steps(calculator_class):
+    # the date of financial close is in the middle of a step, and there is no
+    # spend in the step containing it
+    calculator = ConstructionMarginCalculatorBuilder(calculator_class) \
+        .with_date_of_financial_close(datetime(2020, 3, 1, 12)) \
+        .build()
+    fractions = np.where(np.arange(2_500) % 7 == 0, 0.0, 0.3)
+    fractions[60] = 0.0
+    profile = SpendProfile.from_fractions(fractions)
+    expected = CashFlowStepsBuilder().with_number_of_steps(2_500).build()
+    CashFlowStepsCalculator(expected, timeline_index=TimelineIndex.from_steps(expected)) \
+        .calculate_step(calculator, profile)
+    steps = CashFlowStepsBuilder().with_number_of_steps(2_500).build()
+
+    CashFlowStepsCalculator(steps, timeline_index=TimelineIndex.from_steps(steps), memory_budget=10_000) \
+        .calculate_step(calculator, profile)
+
+    assert steps == expected
+    assert steps[60].development_cost == 11
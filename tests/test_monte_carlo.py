@@ -0,0 +1,114 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.inflation_index import DAILY_INFLATION
+from cash_flow_calculator.monte_carlo import MonteCarloSimulation, StreamingStatistics, Normal, Uniform, Triangular
+
+date_of_financial_close = datetime(2020, 3, 1)
+
+
+def create_table():
+    table = CashFlowStepTable.empty(12)
+    table.start_of_step[:] = np.arange('2020-01', '2021-01', dtype='datetime64[M]').astype('datetime64[us]')
+    return table
+
+
+def create_simulation(**parameters):
+    arguments = dict(
+        balance_of_plant_costs_at_financial_close=10,
+        development_cost=11,
+        turbine_costs=Triangular(10, 12, 16),
+        special_capital_costs=13,
+        date_of_financial_close=date_of_financial_close,
+        in_selling_mode=True,
+        epc_margin=Uniform(0.05, 0.15),
+        inflation_rate=Normal(0.03, 0.01),
+        inflation_mode=DAILY_INFLATION,
+        seed=42,
+        batch_size=100)
+    arguments.update(parameters)
+    return MonteCarloSimulation(**arguments)
+
+
+def test_streaming_statistics_match_statistics_of_all_values():
+    values = np.random.default_rng(1).normal(5, 2, size=(1000, 3))
+    sut = StreamingStatistics(np.random.default_rng(2), reservoir_size=2000)
+
+    for batch in np.array_split(values, [1, 10, 300, 301]):
+        sut.add(batch)
+
+    assert sut.count == 1000
+    np.testing.assert_allclose(sut.mean, values.mean(axis=0))
+    np.testing.assert_allclose(sut.variance, values.var(axis=0, ddof=1))
+    # every value fits in the reservoir, so the quantiles are exact
+    np.testing.assert_allclose(sut.quantile(0.9), np.quantile(values, 0.9, axis=0))
+
+
+def test_reservoir_does_not_grow_with_the_number_of_values():
+    sut = StreamingStatistics(np.random.default_rng(2), reservoir_size=100)
+    values = np.random.default_rng(3)
+
+    for _ in range(50):
+        sut.add(values.uniform(0, 1, 1000))
+
+    assert sut.count == 50_000
+    assert len(sut._sample) == 100
+    assert sut.quantile(0.5) == pytest.approx(0.5, abs=0.15)
+
+
+def test_same_seed_gives_same_results():
+    first = create_simulation().run(create_table(), 0.3, 1000)
+    second = create_simulation().run(create_table(), 0.3, 1000)
+
+    assert first.percentiles('construction_profit') == second.percentiles('construction_profit')
+    np.testing.assert_array_equal(first.steps['construction_profit'].mean, second.steps['construction_profit'].mean)
+
+
+def test_paths_do_not_depend_on_the_batch_size():
+    small_batches = create_simulation(batch_size=7).run(create_table(), 0.3, 1000)
+    large_batches = create_simulation(batch_size=1000).run(create_table(), 0.3, 1000)
+
+    np.testing.assert_allclose(
+        small_batches.totals['construction_profit'].mean,
+        large_batches.totals['construction_profit'].mean)
+    np.testing.assert_allclose(
+        small_batches.steps['construction_profit'].variance,
+        large_batches.steps['construction_profit'].variance)
+
+
+def test_without_distributions_every_path_matches_construction_margin_calculator():
+    table = create_table()
+    ConstructionMarginCalculator(10, 11, 12, 13, date_of_financial_close, True, 0.1, 0.03, DAILY_INFLATION) \
+        .calculate_table(table, 0.3)
+
+    result = create_simulation(turbine_costs=12, epc_margin=0.1, inflation_rate=0.03).run(create_table(), 0.3, 250)
+
+    np.testing.assert_allclose(result.steps['construction_profit'].mean, table.construction_profit)
+    np.testing.assert_allclose(result.steps['construction_profit'].variance, np.zeros(12), atol=1e-20)
+
+
+def test_steps_only_keep_a_sample_if_asked_to():
+    without_sample = create_simulation().run(create_table(), 0.3, 1000)
+    with_sample = create_simulation(step_reservoir_size=50).run(create_table(), 0.3, 1000)
+
+    assert without_sample.steps['construction_profit']._sample is None
+    with pytest.raises(ValueError):
+        without_sample.steps['construction_profit'].quantile(0.5)
+    assert with_sample.steps['construction_profit']._sample.shape == (50, 12)
+    assert with_sample.steps['construction_profit'].quantile(0.5).shape == (12,)
+
+
+def test_percentiles_of_total_construction_profit_are_in_order():
+    result = create_simulation(reservoir_size=500).run(create_table(), 0.3, 5000)
+    percentiles = result.percentiles('construction_profit')
+
+    assert result.number_of_paths == 5000
+    assert percentiles[10] < percentiles[50] < percentiles[90] < 0
+    assert result.totals['construction_profit'].mean == pytest.approx(percentiles[50], rel=0.1)
+
+
+def test_only_scenario_parameters_can_be_distributions():
+    with pytest.raises(ValueError):
+        create_simulation(development_cost=Normal(11, 1))
@@ -0,0 +1,65 @@
+import pytest
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.memory_estimate import chunk_size_for_budget
+from cash_flow_calculator.portfolio_runner import PortfolioRunner, Project
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The portfolio runner should give exactly the same results as calculating each
+# project with CashFlowStepsCalculator in this process, including when projects
+# are split in to chunks.
+
+
+# A calculator that always fails
+class FailingCalculator:
+    def calculate_step(self, step, fraction_of_spend: float):
+        raise ValueError('always fails')
+
+
+def test_portfolio_matches_calculating_projects_serially():
+    calculators = [
+        ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).in_selling_mode().build(),
+        ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).in_selling_mode(False).build(),
+        ConstructionMarginCalculatorBuilder().in_selling_mode().build(),
+    ]
+    projects = [
+        Project(calculator, CashFlowStepsBuilder().with_number_of_steps(25).build_table(), 0.3)
+        for calculator in calculators
+    ]
+
+    PortfolioRunner(max_workers=2, chunk_size=7).run(projects)
+
+    for project in projects:
+        expected_steps = CashFlowStepsBuilder().with_number_of_steps(25).build()
+        CashFlowStepsCalculator(expected_steps).calculate_step(
+            ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop)
+                .in_selling_mode(project.calculator.in_selling_mode)
+                .build(),
+            0.3)
+
+        assert project.steps.to_steps() == expected_steps
+
+
+def test_errors_in_workers_are_raised_by_run():
+    projects = [Project(FailingCalculator(), CashFlowStepsBuilder().build_table(), 0.3)]
+
+    with pytest.raises(ValueError, match='always fails'):
+        PortfolioRunner(max_workers=1).run(projects)
+
+
+def test_memory_budget_splits_projects_in_to_chunks_that_fit_it():
+    calculator = ConstructionMarginCalculatorBuilder().in_selling_mode().build()
+    projects = [Project(calculator, CashFlowStepsBuilder().with_number_of_steps(250).build_table(), 0.3)]
+    sut = PortfolioRunner(max_workers=2, memory_budget=2_000)
+
+    sut.run(projects)
+
+    expected_steps = CashFlowStepsBuilder().with_number_of_steps(250).build()
+    ConstructionMarginCalculatorBuilder().in_selling_mode().build().calculate_steps(expected_steps, 0.3)
+    assert projects[0].steps.to_steps() == expected_steps
+    chunk_size = chunk_size_for_budget(calculator, 2_000, steps_in_memory=True)
+    chunk_sizes = [stop - start for start, stop in sut._chunks(250, calculator)]
+    assert len(chunk_sizes) > 1
+    assert max(chunk_sizes) == chunk_size
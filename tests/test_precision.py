@@ -0,0 +1,121 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from cash_flow_calculator.precision import (
+    FixedPointTable,
+    calculate_with_precision,
+    accuracy_report,
+    to_minor_units,
+    FLOAT64,
+    FLOAT32,
+    FIXED_POINT,
+    MISSING)
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+
+
+# Money values of a realistic size, so that rounding to minor units matters
+def create_calculator(in_selling_mode: bool = True):
+    return ConstructionMarginCalculatorBuilder() \
+        .with_balance_of_plant_costs_at_financial_close(10_000_000) \
+        .with_development_cost(1_100_000) \
+        .with_turbine_costs(12_000_000) \
+        .with_special_capital_costs(1_300_000) \
+        .with_date_of_financial_close(datetime(2020, 3, 1)) \
+        .in_selling_mode(in_selling_mode) \
+        .with_inflation_rate(0.03) \
+        .build()
+
+
+def create_table():
+    return CashFlowStepsBuilder().with_number_of_steps(1000).build_table()
+
+
+def test_halves_are_rounded_to_even():
+    assert to_minor_units([0.125, 0.135, -0.125, np.nan], 100).tolist() == [12, 14, -12, MISSING]
+
+
+def test_float64_matches_calculator():
+    expected = create_table()
+    create_calculator().calculate_table(expected, 0.001)
+
+    result = calculate_with_precision(create_calculator(), create_table(), 0.001, FLOAT64)
+
+    assert result.to_steps() == expected.to_steps()
+
+
+def test_float32_uses_half_the_memory():
+    result = calculate_with_precision(create_calculator(), create_table(), 0.001, FLOAT32)
+
+    assert result.construction_profit.dtype == np.float32
+
+
+def test_float32_is_calculated_in_float32():
+    calculator = create_calculator()
+    inflation = calculator.calculate_inflations(create_table().start_of_step).astype(np.float32)
+    turbine_cost = np.float32(12_000_000) * inflation * np.float32(0.001)
+    balance_of_plant_cost = np.float32(10_000_000) * inflation * np.float32(0.001)
+    construction_profit = -1 * (turbine_cost + balance_of_plant_cost) * np.float32(0.1)
+
+    result = calculate_with_precision(calculator, create_table(), 0.001, FLOAT32)
+
+    np.testing.assert_array_equal(result.construction_profit, construction_profit)
+    np.testing.assert_array_equal(result.turbine_cost_including_margin, turbine_cost * (1 + np.float32(0.1)))
+
+
+def test_fixed_point_values_are_within_half_a_minor_unit():
+    expected = create_table()
+    create_calculator(in_selling_mode=False).calculate_table(expected, 0.001)
+
+    result = calculate_with_precision(create_calculator(in_selling_mode=False), create_table(), 0.001, FIXED_POINT)
+
+    assert isinstance(result, FixedPointTable)
+    assert result.turbine_cost_including_margin.dtype == np.int64
+    np.testing.assert_allclose(
+        result.to_table().turbine_cost_including_margin,
+        expected.turbine_cost_including_margin,
+        rtol=0, atol=0.005)
+    # nothing is set before or after financial close, or in owning mode
+    assert (result.construction_profit == MISSING).all()
+    assert result.total('development_cost_if_owning') == 110_000_000
+
+
+def test_fixed_point_is_calculated_in_whole_minor_units():
+    result = calculate_with_precision(create_calculator(), create_table(), 0.001, FIXED_POINT)
+
+    # the construction profit is calculated from the costs in whole cents,
+    # before the margin is added to them
+    inflation = create_calculator().calculate_inflations(create_table().start_of_step)
+    turbine_cost = np.rint(to_minor_units(12_000_000) * inflation * 0.001)
+    balance_of_plant_cost = np.rint(to_minor_units(10_000_000) * inflation * 0.001)
+    assert result.construction_profit.tolist() == np.rint(-1 * (turbine_cost + balance_of_plant_cost) * 0.1).astype(np.int64).tolist()
+    assert result.turbine_cost_including_margin.tolist() == np.rint(turbine_cost * 1.1).astype(np.int64).tolist()
+
+
+def test_fixed_point_needs_a_calculator_with_whole_column_inflation():
+    calculator = ConstructionMarginCalculatorMockableAbstractionBuilder() \
+        .with_inflation_calculator(create_calculator().inflation_index()) \
+        .build()
+
+    with pytest.raises(ValueError):
+        calculate_with_precision(calculator, create_table(), 0.001, FIXED_POINT)
+
+
+def test_accuracy_report_compares_each_precision_to_float64():
+    report = accuracy_report(create_calculator(), create_table(), 0.001)
+
+    for name, errors in report[FLOAT64].items():
+        assert errors['max_absolute_error'] == 0, name
+        assert errors['bytes_per_value'] == 8
+    assert 0 < report[FLOAT32]['construction_profit']['max_relative_error'] < 1e-6
+    assert report[FLOAT32]['construction_profit']['bytes_per_value'] == 4
+    # the cost is rounded to half a cent, and then again after the margin is added
+    max_error = 0.005 * 1.1 + 0.005
+    assert 0 < report[FIXED_POINT]['turbine_cost_including_margin']['max_absolute_error'] <= max_error
+    assert report[FIXED_POINT]['turbine_cost_including_margin']['total_error'] <= max_error * 1000
+
+
+def test_unknown_precision_is_rejected():
+    with pytest.raises(ValueError):
+        calculate_with_precision(create_calculator(), create_table(), 0.001, 'float16')
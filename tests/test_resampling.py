@@ -0,0 +1,99 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from cash_flow_calculator.inflation_index import ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION
+from cash_flow_calculator.resampling import ResampledTimeline, screen, SPEND_FIELDS, MONTHLY, QUARTERLY, ANNUAL
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+date_of_financial_close = datetime(2021, 3, 17)
+
+
+def create_calculator(in_selling_mode: bool = True, inflation_mode: int = DAILY_INFLATION):
+    return ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .in_selling_mode(in_selling_mode) \
+        .with_inflation_mode(inflation_mode) \
+        .build()
+
+
+# Two years of daily steps, with the financial close part way through
+def create_table(number_of_days: int = 730):
+    return CashFlowStepsBuilder() \
+        .with_number_of_steps(number_of_days) \
+        .starting_on(datetime(2020, 6, 1)) \
+        .build_table()
+
+
+def test_buckets_are_calendar_periods():
+    timeline = ResampledTimeline(create_table().start_of_step, QUARTERLY)
+
+    assert timeline.coarse_table().start_of_step[:3].tolist() == \
+        [datetime(2020, 6, 1), datetime(2020, 7, 1), datetime(2020, 10, 1)]
+    assert timeline.counts[:3].tolist() == [30, 92, 92]
+    assert timeline.counts.sum() == 730
+
+
+def test_financial_close_step_is_a_bucket_on_its_own():
+    timeline = ResampledTimeline(create_table().start_of_step, MONTHLY, date_of_financial_close)
+    start_of_steps = timeline.coarse_table().start_of_step.tolist()
+    bucket = start_of_steps.index(date_of_financial_close)
+
+    assert start_of_steps[bucket - 1:bucket + 2] == \
+        [datetime(2021, 3, 1), date_of_financial_close, datetime(2021, 3, 18)]
+    assert timeline.counts[bucket] == 1
+
+
+def test_steps_must_be_in_date_order():
+    start_of_steps = create_table().start_of_step[::-1]
+
+    with pytest.raises(ValueError):
+        ResampledTimeline(start_of_steps, MONTHLY)
+
+
+@pytest.mark.parametrize('frequency', [MONTHLY, QUARTERLY, ANNUAL])
+@pytest.mark.parametrize('inflation_mode', [DAILY_INFLATION, MONTHLY_INFLATION, ANNUAL_INFLATION])
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_full_timeline_is_within_error_bounds(frequency, inflation_mode, in_selling_mode):
+    calculator = create_calculator(in_selling_mode, inflation_mode)
+    full_table = create_table()
+    calculator.calculate_table(full_table, 0.3)
+
+    result = screen(calculator, create_table(), 0.3, frequency)
+    errors = result.errors_against(full_table)
+    bounds = result.error_bounds()
+
+    for name in SPEND_FIELDS:
+        if in_selling_mode or name != 'construction_profit':
+            assert (errors[name] <= bounds[name]).all()
+            estimate, lower, upper = result.totals()[name]
+            assert lower <= np.nansum(getattr(full_table, name)) <= upper
+
+
+def test_milestones_are_exact():
+    calculator = create_calculator(in_selling_mode=False)
+    full_table = create_table()
+    calculator.calculate_table(full_table, 0.3)
+
+    result = screen(calculator, create_table(), 0.3, ANNUAL)
+    aggregated = result.timeline.aggregate(full_table)
+
+    for name in ('special_capital_costs', 'development_cost', 'development_cost_if_owning'):
+        np.testing.assert_array_equal(getattr(result.table, name), getattr(aggregated, name))
+
+
+def test_coarse_timeline_has_far_fewer_steps():
+    result = screen(create_calculator(), create_table(), 0.3, MONTHLY)
+
+    # 24 calendar months, with March 2021 split in to three around the
+    # financial close step
+    assert len(result.table) == 26
+
+
+def test_values_already_in_the_steps_are_kept():
+    table = create_table()
+    table.balance_of_plant_costs_at_financial_close[:] = np.arange(len(table))
+
+    result = screen(create_calculator(), table, 0.3, QUARTERLY)
+
+    assert result.table.balance_of_plant_costs_at_financial_close.tolist() == result.timeline.first.tolist()
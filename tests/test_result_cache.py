@@ -0,0 +1,146 @@
+import os
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator import result_cache
+from cash_flow_calculator.result_cache import ConstructionMarginResultCache, result_key
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# A cache hit should give the same results as calculating the steps, without
+# calling the calculator.
+class CountingConstructionMarginCalculator(ConstructionMarginCalculator):
+    calls = 0
+
+    def calculate_table(self, table: CashFlowStepTable, fraction_of_spend: float):
+        CountingConstructionMarginCalculator.calls += 1
+        super().calculate_table(table, fraction_of_spend)
+
+
+def create_calculator(epc_margin: float = 0.1):
+    CountingConstructionMarginCalculator.calls = 0
+    return ConstructionMarginCalculatorBuilder(CountingConstructionMarginCalculator).with_epc_margin(epc_margin).build()
+
+
+def create_table(number_of_steps: int = 5):
+    return CashFlowStepsBuilder().with_number_of_steps(number_of_steps).build_table()
+
+
+def test_second_calculation_is_a_hit_and_does_not_use_the_calculator():
+    expected = create_table()
+    create_calculator().calculate_table(expected, 0.3)
+    sut = ConstructionMarginResultCache()
+    sut.calculate_table(create_calculator(), create_table(), 0.3)
+
+    table = create_table()
+    sut.calculate_table(create_calculator(), table, 0.3)
+
+    assert CountingConstructionMarginCalculator.calls == 0
+    assert sut.hits == 1
+    assert table.to_steps() == expected.to_steps()
+
+
+def test_different_parameters_or_steps_are_misses():
+    sut = ConstructionMarginResultCache()
+
+    sut.calculate_table(create_calculator(), create_table(), 0.3)
+    sut.calculate_table(create_calculator(epc_margin=0.2), create_table(), 0.3)
+    sut.calculate_table(create_calculator(), create_table(), 0.4)
+    sut.calculate_table(create_calculator(), create_table(number_of_steps=6), 0.3)
+
+    assert sut.misses == 4
+    assert sut.hits == 0
+
+
+def test_least_recently_used_results_are_removed_when_cache_is_full():
+    result_bytes = 7 * 8 * 5
+    sut = ConstructionMarginResultCache(max_bytes=2 * result_bytes)
+
+    for epc_margin in (0.1, 0.2, 0.3):
+        sut.calculate_table(create_calculator(epc_margin), create_table(), 0.3)
+
+    assert len(sut) == 2
+    assert sut.size_in_bytes == 2 * result_bytes
+    sut.calculate_table(create_calculator(0.1), create_table(), 0.3)
+    assert sut.hits == 0
+
+
+def test_results_saved_to_disk_are_used_by_other_caches(tmp_path):
+    ConstructionMarginResultCache(directory=str(tmp_path)) \
+        .calculate_table(create_calculator(), create_table(), 0.3)
+    sut = ConstructionMarginResultCache(directory=str(tmp_path))
+
+    sut.calculate_table(create_calculator(), create_table(), 0.3)
+
+    assert sut.disk_hits == 1
+    assert CountingConstructionMarginCalculator.calls == 0
+
+
+def test_results_from_another_version_of_the_calculation_are_not_used(tmp_path, monkeypatch):
+    ConstructionMarginResultCache(directory=str(tmp_path)) \
+        .calculate_table(create_calculator(), create_table(), 0.3)
+    monkeypatch.setattr(result_cache, 'CALCULATION_VERSION', result_cache.CALCULATION_VERSION + 1)
+    sut = ConstructionMarginResultCache(directory=str(tmp_path))
+
+    sut.calculate_table(create_calculator(), create_table(), 0.3)
+
+    assert sut.disk_hits == 0
+    assert sut.misses == 1
+
+
+def test_keys_depend_on_the_source_of_the_calculator_class():
+    class ChangedConstructionMarginCalculator(ConstructionMarginCalculator):
+        def calculate_table(self, table: CashFlowStepTable, fraction_of_spend: float):
+            super().calculate_table(table, fraction_of_spend)
+            table.construction_profit[:] = 0
+    ChangedConstructionMarginCalculator.__qualname__ = ConstructionMarginCalculator.__qualname__
+    calculator = ConstructionMarginCalculatorBuilder().build()
+    changed_calculator = ConstructionMarginCalculatorBuilder(ChangedConstructionMarginCalculator).build()
+
+    assert result_key(calculator, create_table(), 0.3) != result_key(changed_calculator, create_table(), 0.3)
+
+
+def test_least_recently_used_files_are_removed_when_directory_is_full(tmp_path):
+    sut = ConstructionMarginResultCache(directory=str(tmp_path))
+    sut.calculate_table(create_calculator(0.1), create_table(), 0.3)
+    file_bytes = next(tmp_path.iterdir()).stat().st_size
+    sut = ConstructionMarginResultCache(directory=str(tmp_path), max_disk_bytes=2 * file_bytes)
+    for epc_margin in (0.2, 0.3):
+        # the files are saved quicker than the resolution of their times
+        for path in tmp_path.iterdir():
+            modified = path.stat().st_mtime_ns - 1_000_000_000
+            os.utime(path, ns=(modified, modified))
+        sut.calculate_table(create_calculator(epc_margin), create_table(), 0.3)
+
+    assert len(list(tmp_path.iterdir())) == 2
+    sut = ConstructionMarginResultCache(directory=str(tmp_path))
+    sut.calculate_table(create_calculator(0.1), create_table(), 0.3)
+    sut.calculate_table(create_calculator(0.3), create_table(), 0.3)
+    assert sut.disk_hits == 1
+
+
+def test_each_save_writes_to_its_own_temporary_file(tmp_path, monkeypatch):
+    temporary_paths = []
+    savez = np.savez
+    monkeypatch.setattr(np, 'savez', lambda file, **columns: (temporary_paths.append(file.name), savez(file, **columns)))
+
+    # as if two processes calculated the same result at the same time
+    for _ in range(2):
+        for path in tmp_path.iterdir():
+            path.unlink()
+        ConstructionMarginResultCache(directory=str(tmp_path)).calculate_table(create_calculator(), create_table(), 0.3)
+
+    assert len(set(temporary_paths)) == 2
+    assert [path.suffix for path in tmp_path.iterdir()] == ['.npz']
+
+
+def test_failed_saves_leave_no_files(tmp_path, monkeypatch):
+    def fail(file, **columns):
+        raise OSError('disk full')
+    monkeypatch.setattr(np, 'savez', fail)
+
+    with pytest.raises(OSError):
+        ConstructionMarginResultCache(directory=str(tmp_path)).calculate_table(create_calculator(), create_table(), 0.3)
+
+    assert list(tmp_path.iterdir()) == []
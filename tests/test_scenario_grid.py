@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from cash_flow_calculator.inflation_index import DAILY_INFLATION
+from cash_flow_calculator.scenario_grid import ScenarioGrid, scenario_product
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The scenario grid is an optimisation of running ConstructionMarginCalculator
+# once per scenario, so the test checks that every scenario gives exactly the
+# same results as the ConstructionMarginCalculator.
+development_cost = 11
+special_capital_costs = 13
+date_of_financial_close = datetime(2020, 1, 3)
+fraction_of_spend = 0.3
+
+
+def test_every_scenario_matches_construction_margin_calculator():
+    parameters = scenario_product(
+        epc_margin=[0.1, 0.2],
+        in_selling_mode=[True, False],
+        inflation_rate=[0.02, 0.05],
+        turbine_costs=[12, 15],
+        balance_of_plant_costs_at_financial_close=[10])
+
+    sut = ScenarioGrid(
+        development_cost=development_cost,
+        special_capital_costs=special_capital_costs,
+        date_of_financial_close=date_of_financial_close,
+        inflation_mode=DAILY_INFLATION,
+        **parameters)
+    table = CashFlowStepsBuilder().with_step_length(timedelta(days=40)).build_table()
+    result = sut.calculate_table(table, fraction_of_spend)
+
+    assert len(result) == 16
+    for scenario in range(len(result)):
+        expected_steps = CashFlowStepsBuilder().with_step_length(timedelta(days=40)).build()
+        ConstructionMarginCalculatorBuilder() \
+            .with_balance_of_plant_costs_at_financial_close(
+                parameters['balance_of_plant_costs_at_financial_close'][scenario]) \
+            .with_development_cost(development_cost) \
+            .with_turbine_costs(parameters['turbine_costs'][scenario]) \
+            .with_special_capital_costs(special_capital_costs) \
+            .with_date_of_financial_close(date_of_financial_close) \
+            .in_selling_mode(parameters['in_selling_mode'][scenario]) \
+            .with_epc_margin(parameters['epc_margin'][scenario]) \
+            .with_inflation_rate(parameters['inflation_rate'][scenario]) \
+            .build() \
+            .calculate_steps(expected_steps, fraction_of_spend)
+
+        assert result.scenario(scenario).to_steps() == expected_steps
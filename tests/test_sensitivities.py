@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator import ConstructionMarginCalculator
+from cash_flow_calculator.inflation_index import ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION
+from cash_flow_calculator.spend_profile import SpendProfile
+from cash_flow_calculator.timeline_index import TimelineIndex
+from tests.cash_flow_step_builder import CashFlowStepBuilder, CashFlowStepsBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+from tests.mock_inflation import CountingMockInflation
+
+# The analytical sensitivities should match the sensitivities found by bumping
+# each input up and down, and calculating again (central differences).
+parameters = {
+    'balance_of_plant_costs_at_financial_close': 10.0,
+    'development_cost': 11.0,
+    'turbine_costs': 12.0,
+    'special_capital_costs': 13.0,
+    'date_of_financial_close': datetime(2020, 3, 1),
+    'epc_margin': 0.1,
+    'inflation_rate': 0.05,
+}
+bump = 1e-6
+fraction_of_spend = 0.3
+
+
+# Steps 45 days apart, and a last step that starts on the date of financial close
+def create_table():
+    steps = CashFlowStepsBuilder() \
+        .with_number_of_steps(30) \
+        .starting_on(datetime(2019, 1, 1)) \
+        .with_step_length(timedelta(days=45)) \
+        .build()
+    steps.append(CashFlowStepBuilder().starting_on(datetime(2020, 3, 1)).without_values().build())
+    return CashFlowStepTable.from_steps(steps)
+
+
+def calculate(
+        in_selling_mode: bool,
+        inflation_mode: int,
+        fraction: float = fraction_of_spend,
+        timeline_index: TimelineIndex = None,
+        **changes):
+    table = create_table()
+    ConstructionMarginCalculator(
+        **{**parameters, **changes},
+        in_selling_mode=in_selling_mode,
+        inflation_mode=inflation_mode).calculate_table(table, fraction, timeline_index)
+    return table
+
+
+def bumped_derivative(
+        in_selling_mode: bool,
+        inflation_mode: int,
+        output: str,
+        input: str,
+        fraction=fraction_of_spend,
+        timeline_index: TimelineIndex = None,
+        **changes):
+    if input == 'fraction_of_spend':
+        up = calculate(in_selling_mode, inflation_mode, fraction_of_spend + bump)
+        down = calculate(in_selling_mode, inflation_mode, fraction_of_spend - bump)
+    else:
+        up = calculate(
+            in_selling_mode, inflation_mode, fraction, timeline_index, **{**changes, input: parameters[input] + bump})
+        down = calculate(
+            in_selling_mode, inflation_mode, fraction, timeline_index, **{**changes, input: parameters[input] - bump})
+    return np.nan_to_num(getattr(up, output) - getattr(down, output)) / (2 * bump)
+
+
+@pytest.mark.parametrize('inflation_mode', [ANNUAL_INFLATION, DAILY_INFLATION, MONTHLY_INFLATION])
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_sensitivities_match_bumping_each_input(in_selling_mode, inflation_mode):
+    table = create_table()
+    calculator = ConstructionMarginCalculator(
+        **parameters, in_selling_mode=in_selling_mode, inflation_mode=inflation_mode)
+
+    sensitivities = calculator.calculate_table_with_sensitivities(table, fraction_of_spend)
+
+    assert table.to_steps() == calculate(in_selling_mode, inflation_mode).to_steps()
+    for output, derivatives in sensitivities.items():
+        for input, derivative in derivatives.items():
+            if input != 'inflation':
+                np.testing.assert_allclose(
+                    derivative,
+                    bumped_derivative(in_selling_mode, inflation_mode, output, input),
+                    rtol=1e-5, atol=1e-6,
+                    err_msg=f'{output} with respect to {input}')
+
+
+def test_owning_mode_has_no_construction_profit_sensitivities():
+    sensitivities = ConstructionMarginCalculator(
+        **parameters, in_selling_mode=False, inflation_mode=DAILY_INFLATION) \
+        .calculate_table_with_sensitivities(create_table(), fraction_of_spend)
+
+    assert 'construction_profit' not in sensitivities
+    assert sensitivities['development_cost_if_owning']['development_cost'].sum() == 1
+
+
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_sensitivities_with_spend_profile_and_timeline_index_match_bumping_each_input(in_selling_mode):
+    # the date of financial close is in the middle of a step, so the milestones
+    # are only set with the timeline index
+    date_of_financial_close = datetime(2019, 3, 10)
+    profile = SpendProfile.from_fractions([0.3 if step % 3 else 0.0 for step in range(len(create_table()))])
+    timeline_index = TimelineIndex.from_steps(create_table())
+    table = create_table()
+    calculator = ConstructionMarginCalculator(
+        **{**parameters, 'date_of_financial_close': date_of_financial_close},
+        in_selling_mode=in_selling_mode,
+        inflation_mode=DAILY_INFLATION)
+
+    sensitivities = calculator.calculate_table_with_sensitivities(table, profile, timeline_index)
+
+    assert table.to_steps() == calculate(
+        in_selling_mode, DAILY_INFLATION, profile, timeline_index,
+        date_of_financial_close=date_of_financial_close).to_steps()
+    assert sensitivities['special_capital_costs']['special_capital_costs'].sum() == 1
+    for output, derivatives in sensitivities.items():
+        for input, derivative in derivatives.items():
+            assert len(derivative) == len(table)
+            if input in ('inflation', 'fraction_of_spend'):
+                continue
+            np.testing.assert_allclose(
+                derivative,
+                bumped_derivative(
+                    in_selling_mode, DAILY_INFLATION, output, input, profile, timeline_index,
+                    date_of_financial_close=date_of_financial_close),
+                rtol=1e-5, atol=1e-6,
+                err_msg=f'{output} with respect to {input}')
+    assert (sensitivities['turbine_cost_including_margin']['fraction_of_spend'][profile.dense() == 0] == 0).all()
+
+
+def test_inflation_is_looked_up_once_for_values_and_sensitivities():
+    calculator = ConstructionMarginCalculator(**parameters, in_selling_mode=True, inflation_mode=DAILY_INFLATION)
+    calculate_inflations = calculator.calculate_inflations
+    calls = []
+    calculator.calculate_inflations = lambda dates: calls.append(dates) or calculate_inflations(dates)
+
+    calculator.calculate_table_with_sensitivities(create_table(), fraction_of_spend)
+
+    assert len(calls) == 1
+
+
+def test_mockable_abstraction_asks_for_inflation_once():
+    inflation = CountingMockInflation(1.2)
+    sut = ConstructionMarginCalculatorMockableAbstractionBuilder() \
+        .with_inflation_calculator(inflation) \
+        .in_selling_mode() \
+        .build()
+
+    sut.calculate_step_with_sensitivities(
+        CashFlowStepBuilder().starting_on(datetime(2020, 1, 1)).without_values().build(), fraction_of_spend)
+
+    assert inflation.calls == 1
+
+
+def test_mockable_abstraction_sensitivities_match_bumping_inflation():
+    def calculate_step(inflation: float):
+        step = CashFlowStepBuilder().starting_on(datetime(2020, 1, 1)).without_values().build()
+        sut = ConstructionMarginCalculatorMockableAbstractionBuilder() \
+            .with_inflation(inflation) \
+            .in_selling_mode() \
+            .build()
+        return step, sut.calculate_step_with_sensitivities(step, fraction_of_spend)
+
+    step, sensitivities = calculate_step(1.2)
+    up, _ = calculate_step(1.2 + bump)
+    down, _ = calculate_step(1.2 - bump)
+
+    for output in ('turbine_cost_including_margin', 'balance_of_plant_cost_including_margin', 'construction_profit'):
+        assert sensitivities[output]['inflation'] == \
+            pytest.approx((getattr(up, output) - getattr(down, output)) / (2 * bump), rel=1e-6)
+    assert sensitivities['special_capital_costs']['special_capital_costs'] == 0
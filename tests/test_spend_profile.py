@@ -0,0 +1,146 @@
+from datetime import datetime
+import pytest
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator_without_loop import (
+    ConstructionMarginCalculatorWithoutLoop,
+    CashFlowStepsCalculator)
+from cash_flow_calculator.spend_profile import SpendProfile
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+
+date_of_financial_close = datetime(2020, 1, 3)
+
+# There is no spend on the step at financial close, so the milestones have to
+# be set on a step that is otherwise skipped
+fractions = [0.0, 0.1, 0.0, 0.3, 0.0, 0.6, 0.0]
+
+
+def create_steps():
+    return CashFlowStepsBuilder().with_number_of_steps(len(fractions)).build()
+
+
+def create_calculators(in_selling_mode: bool):
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .in_selling_mode(in_selling_mode) \
+        .build()
+    return [
+        calculator,
+        ConstructionMarginCalculatorMockableAbstractionBuilder().matching(calculator).build(),
+        ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop) \
+            .with_date_of_financial_close(date_of_financial_close) \
+            .in_selling_mode(in_selling_mode) \
+            .build(),
+    ]
+
+
+# Calculating each step with spend on its own, with its fraction, gives the
+# expected results, and the steps without spend only have the milestones
+def expected_steps(in_selling_mode: bool):
+    steps = create_steps()
+    calculator = create_calculators(in_selling_mode)[0]
+    for step, fraction in zip(steps, fractions):
+        if fraction != 0:
+            calculator.calculate_steps([step], fraction)
+        elif step.start_of_step == date_of_financial_close:
+            calculator.calculate_milestones(step)
+    return steps
+
+
+def test_from_fractions_leaves_out_steps_without_spend():
+    sut = SpendProfile.from_fractions(fractions)
+
+    assert list(sut) == [(1, 0.1), (3, 0.3), (5, 0.6)]
+    assert sut.dense().tolist() == fractions
+
+
+def test_s_curve_spends_the_total_between_first_and_last_steps():
+    sut = SpendProfile.s_curve(100, first=10, last=59, total_fraction=0.8)
+
+    assert sut.positions.min() == 10 and sut.positions.max() == 59
+    assert sut.fractions.sum() == pytest.approx(0.8)
+    # slowest at the start and end, fastest in the middle
+    assert sut.fractions[0] < sut.fractions[25] > sut.fractions[-1]
+
+
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_calculators_only_calculate_steps_with_spend(in_selling_mode):
+    for calculator in create_calculators(in_selling_mode):
+        steps = create_steps()
+
+        CashFlowStepsCalculator(steps).calculate_step(calculator, SpendProfile.from_fractions(fractions))
+
+        assert steps == expected_steps(in_selling_mode), type(calculator).__name__
+
+
+def test_calculators_without_milestones_are_only_given_steps_with_spend():
+    class SpendOnlyCalculator:
+        def __init__(self):
+            self.steps = []
+
+        def calculate_step(self, step, fraction_of_spend):
+            self.steps.append((step.start_of_step, fraction_of_spend))
+
+    calculator = SpendOnlyCalculator()
+    steps = create_steps()
+
+    CashFlowStepsCalculator(steps).calculate_step(calculator, SpendProfile.from_fractions(fractions))
+
+    assert calculator.steps == [(steps[1].start_of_step, 0.1), (steps[3].start_of_step, 0.3), (steps[5].start_of_step, 0.6)]
+
+
+def test_milestones_are_found_among_steps_without_a_start():
+    steps = create_steps()
+    steps[0].start_of_step = None
+    expected = create_steps()
+    expected[0].start_of_step = None
+    for step, fraction in zip(expected, fractions):
+        if fraction != 0:
+            create_calculators(True)[0].calculate_steps([step], fraction)
+        elif step.start_of_step == date_of_financial_close:
+            create_calculators(True)[0].calculate_milestones(step)
+
+    create_calculators(True)[0].calculate_steps(steps, SpendProfile.from_fractions(fractions))
+
+    assert steps == expected
+
+
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_milestones_are_found_in_steps_that_are_not_in_date_order(in_selling_mode):
+    def create_unsorted_steps():
+        steps = create_steps()
+        return [steps[position] for position in (4, 2, 0, 1, 3)]
+    # the step at financial close (the second one) has no spend
+    unsorted_fractions = [0.1, 0.0, 0.3, 0.0, 0.6]
+    expected = create_unsorted_steps()
+    for step, fraction in zip(expected, unsorted_fractions):
+        if fraction != 0:
+            create_calculators(in_selling_mode)[0].calculate_steps([step], fraction)
+        elif step.start_of_step == date_of_financial_close:
+            create_calculators(in_selling_mode)[0].calculate_milestones(step)
+    assert expected[1].special_capital_costs is not None
+
+    for calculator in create_calculators(in_selling_mode):
+        steps = create_unsorted_steps()
+        table = CashFlowStepTable.from_steps(create_unsorted_steps())
+
+        CashFlowStepsCalculator(steps).calculate_step(calculator, SpendProfile.from_fractions(unsorted_fractions))
+        CashFlowStepsCalculator(table).calculate_step(calculator, SpendProfile.from_fractions(unsorted_fractions))
+
+        assert steps == expected, type(calculator).__name__
+        assert table.to_steps() == expected, type(calculator).__name__
+
+
+@pytest.mark.parametrize('in_selling_mode', [True, False])
+def test_calculate_table_only_calculates_steps_with_spend(in_selling_mode):
+    table = CashFlowStepTable.from_steps(create_steps())
+
+    create_calculators(in_selling_mode)[0].calculate_table(table, SpendProfile.from_fractions(fractions))
+
+    assert table.to_steps() == expected_steps(in_selling_mode)
+
+
+def test_profile_must_have_a_fraction_for_every_step():
+    with pytest.raises(ValueError):
+        create_calculators(True)[0].calculate_steps(create_steps()[1:], SpendProfile.from_fractions(fractions))
@@ -0,0 +1,39 @@
+from cash_flow_calculator.construction_margin_calculator_without_loop import ConstructionMarginCalculatorWithoutLoop
+from cash_flow_calculator.streaming_cash_flow_steps_calculator import StreamingCashFlowStepsCalculator
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# Streaming should give the same results as calculating a list of steps, and
+# should only read as many steps from the source as it needs for each chunk.
+def test_streamed_steps_match_calculate_steps():
+    expected_steps = CashFlowStepsBuilder().with_number_of_steps(25).build()
+    ConstructionMarginCalculatorBuilder().build().calculate_steps(expected_steps, 0.3)
+
+    sut = StreamingCashFlowStepsCalculator(CashFlowStepsBuilder().with_number_of_steps(25).generate(), chunk_size=10)
+
+    assert list(sut.calculate_step(ConstructionMarginCalculatorBuilder().build(), 0.3)) == expected_steps
+
+
+def test_streamed_steps_match_for_step_by_step_calculators():
+    expected_steps = CashFlowStepsBuilder().with_number_of_steps(25).build()
+    ConstructionMarginCalculatorBuilder().build().calculate_steps(expected_steps, 0.3)
+
+    sut = StreamingCashFlowStepsCalculator(CashFlowStepsBuilder().with_number_of_steps(25).generate(), chunk_size=10)
+
+    calculator = ConstructionMarginCalculatorBuilder(ConstructionMarginCalculatorWithoutLoop).build()
+    assert list(sut.calculate_step(calculator, 0.3)) == expected_steps
+
+
+def test_steps_are_read_one_chunk_at_a_time():
+    steps_read = []
+    def recording_steps():
+        for step in CashFlowStepsBuilder().with_number_of_steps(25).generate():
+            steps_read.append(step)
+            yield step
+
+    sut = StreamingCashFlowStepsCalculator(recording_steps(), chunk_size=10)
+    chunks = sut.calculate_chunks(ConstructionMarginCalculatorBuilder().build(), 0.3)
+
+    assert len(next(chunks)) == 10
+    assert len(steps_read) == 10
+    assert [len(chunk) for chunk in chunks] == [10, 5]
@@ -0,0 +1,103 @@
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step_table import CashFlowStepTable
+from cash_flow_calculator.construction_margin_calculator_without_loop import CashFlowStepsCalculator
+from cash_flow_calculator.timeline_index import TimelineIndex
+from tests.cash_flow_step_builder import CashFlowStepBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+from tests.construction_margin_calculator_mockable_abstraction_builder import ConstructionMarginCalculatorMockableAbstractionBuilder
+
+# Monthly steps, so that most dates are part way through a step
+start_of_steps = [datetime(2020, month, 1) for month in range(1, 7)]
+
+
+def create_steps():
+    return [
+        CashFlowStepBuilder().starting_on(start_of_step).without_values().build()
+        for start_of_step in start_of_steps
+    ]
+
+
+def test_date_at_start_of_step_is_in_that_step():
+    assert TimelineIndex(start_of_steps).position_of(datetime(2020, 3, 1)) == 2
+
+
+def test_date_part_way_through_step_is_in_that_step():
+    assert TimelineIndex(start_of_steps).position_of(datetime(2020, 3, 17)) == 2
+
+
+def test_dates_outside_timeline_have_no_position():
+    sut = TimelineIndex(start_of_steps)
+
+    assert sut.position_of(datetime(2019, 12, 31)) is None
+    assert sut.position_of(datetime(2020, 7, 15)) is None
+
+
+def test_steps_without_a_start_are_not_part_of_the_timeline():
+    sut = TimelineIndex(start_of_steps + [None])
+
+    assert sut.position_of(datetime(2020, 6, 10)) == 5
+    assert sut.position_of(datetime(2030, 1, 1)) is None
+
+
+def test_positions_are_in_the_original_order_of_the_steps():
+    sut = TimelineIndex(list(reversed(start_of_steps)))
+
+    assert sut.positions_of({
+        'financial_close': datetime(2020, 1, 10),
+        'commercial_operation': datetime(2020, 6, 10),
+    }) == {'financial_close': 5, 'commercial_operation': 0}
+
+
+def test_calculator_sets_milestones_on_step_containing_financial_close():
+    date_of_financial_close = datetime(2020, 3, 17)
+    development_cost = 11
+    special_capital_costs = 13
+    steps = create_steps()
+    sut = ConstructionMarginCalculatorBuilder() \
+        .with_development_cost(development_cost) \
+        .with_special_capital_costs(special_capital_costs) \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .in_selling_mode(False) \
+        .build()
+
+    sut.calculate_steps(steps, 0.3, TimelineIndex.from_steps(steps))
+
+    assert [step.special_capital_costs for step in steps] == [None, None, special_capital_costs, None, None, None]
+    assert steps[2].development_cost == development_cost
+    assert steps[2].development_cost_if_owning == development_cost
+
+
+def test_calculate_table_with_index_matches_calculate_steps_with_index():
+    expected_steps = create_steps()
+    table = CashFlowStepTable.from_steps(create_steps())
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(datetime(2020, 3, 17)) \
+        .in_selling_mode(False) \
+        .build()
+
+    calculator.calculate_steps(expected_steps, 0.3, TimelineIndex.from_steps(expected_steps))
+    calculator.calculate_table(table, 0.3, TimelineIndex.from_steps(table))
+
+    assert table.to_steps() == expected_steps
+
+
+def test_index_is_shared_by_the_calculators_of_cash_flow_steps_calculator():
+    date_of_financial_close = datetime(2020, 3, 17)
+    calculator = ConstructionMarginCalculatorBuilder() \
+        .with_date_of_financial_close(date_of_financial_close) \
+        .in_selling_mode(False) \
+        .build()
+    expected_steps = create_steps()
+    calculator.calculate_steps(expected_steps, 0.3, TimelineIndex.from_steps(expected_steps))
+    calculators = [
+        calculator,
+        ConstructionMarginCalculatorMockableAbstractionBuilder().matching(calculator).build(),
+    ]
+
+    for steps in (create_steps(), CashFlowStepTable.from_steps(create_steps())):
+        timeline_index = TimelineIndex.from_steps(steps)
+        for calculator in calculators:
+            CashFlowStepsCalculator(steps, timeline_index=timeline_index).calculate_step(calculator, 0.3)
+
+            calculated = steps.to_steps() if isinstance(steps, CashFlowStepTable) else steps
+            assert calculated == expected_steps, type(calculator).__name__
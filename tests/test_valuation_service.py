@@ -0,0 +1,159 @@
+import asyncio
+import json
+from datetime import datetime
+from cash_flow_calculator.cash_flow_step import CashFlowStep
+from cash_flow_calculator.inflation_index import DAILY_INFLATION
+from cash_flow_calculator.valuation_service import ValuationService, calculate_batch
+from tests.cash_flow_step_builder import CashFlowStepsBuilder
+from tests.construction_margin_calculator_builder import ConstructionMarginCalculatorBuilder
+
+# The service is tested over HTTP on localhost. Requests sent at the same time
+# for the same steps should be calculated in one batch, and give the same
+# results as the ConstructionMarginCalculator.
+start_of_steps = [step.start_of_step for step in CashFlowStepsBuilder().build()]
+fraction_of_spend = 0.3
+
+
+def create_request(epc_margin: float) -> dict:
+    return {
+        'calculator': {
+            'balance_of_plant_costs_at_financial_close': 10,
+            'development_cost': 11,
+            'turbine_costs': 12,
+            'special_capital_costs': 13,
+            'date_of_financial_close': '2020-01-03T00:00:00',
+            'in_selling_mode': True,
+            'epc_margin': epc_margin,
+            'inflation_rate': 0.05,
+            'inflation_mode': DAILY_INFLATION,
+        },
+        'fraction_of_spend': fraction_of_spend,
+        'steps': [{'start_of_step': start_of_step.isoformat()} for start_of_step in start_of_steps],
+    }
+
+
+def expected_steps(epc_margin: float):
+    steps = CashFlowStepsBuilder().build()
+    ConstructionMarginCalculatorBuilder().with_epc_margin(epc_margin).build().calculate_steps(steps, fraction_of_spend)
+    return steps
+
+
+async def send(port: int, method: str, path: str, body: dict = None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    content = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(content)}\r\n\r\n'.encode() + content)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, response_body = response.partition(b'\r\n\r\n')
+    return int(status_line.split()[1]), json.loads(response_body)
+
+
+def step_from_json(step: dict) -> CashFlowStep:
+    return CashFlowStep(datetime.fromisoformat(step['start_of_step']), *list(step.values())[1:])
+
+
+def test_concurrent_requests_are_calculated_in_one_batch():
+    epc_margins = [0.1, 0.2, 0.3]
+
+    async def run():
+        sut = ValuationService(batch_window=0.05)
+        await sut.start()
+        try:
+            responses = await asyncio.gather(*(
+                send(sut.port, 'POST', '/valuations', create_request(epc_margin))
+                for epc_margin in epc_margins))
+            metrics = await send(sut.port, 'GET', '/metrics')
+        finally:
+            await sut.stop()
+        return responses, metrics
+
+    responses, (metrics_status, metrics) = asyncio.run(run())
+
+    for epc_margin, (status, response) in zip(epc_margins, responses):
+        assert status == 200
+        assert [step_from_json(step) for step in response['steps']] == expected_steps(epc_margin)
+    assert metrics_status == 200
+    assert metrics['requests'] == 3
+    assert metrics['batches'] == 1
+    assert metrics['queue_depth'] == 0
+
+
+def test_invalid_requests_are_rejected():
+    async def run():
+        sut = ValuationService()
+        await sut.start()
+        try:
+            return await send(sut.port, 'POST', '/valuations', {'calculator': {}, 'steps': []})
+        finally:
+            await sut.stop()
+
+    status, response = asyncio.run(run())
+
+    assert status == 400
+    assert 'Missing calculator parameters' in response['error']
+
+
+def test_an_invalid_request_sent_with_valid_ones_only_rejects_itself():
+    epc_margins = [0.1, 'abc', 0.3]
+
+    async def run():
+        sut = ValuationService(batch_window=0.05)
+        await sut.start()
+        try:
+            responses = await asyncio.gather(*(
+                send(sut.port, 'POST', '/valuations', create_request(epc_margin))
+                for epc_margin in epc_margins))
+            metrics = await send(sut.port, 'GET', '/metrics')
+        finally:
+            await sut.stop()
+        return responses, metrics
+
+    responses, (_, metrics) = asyncio.run(run())
+
+    assert [status for status, _ in responses] == [200, 400, 200]
+    assert 'epc_margin must be a finite number' in responses[1][1]['error']
+    for epc_margin, (_, response) in zip(epc_margins[::2], responses[::2]):
+        assert [step_from_json(step) for step in response['steps']] == expected_steps(epc_margin)
+    assert metrics['batches'] == 1
+
+
+def test_parameters_of_the_wrong_type_are_rejected():
+    async def run():
+        sut = ValuationService()
+        await sut.start()
+        try:
+            request = create_request(0.1)
+            request['calculator']['turbine_costs'] = True
+            request['calculator']['inflation_rate'] = float('nan')
+            return await send(sut.port, 'POST', '/valuations', request)
+        finally:
+            await sut.stop()
+
+    status, response = asyncio.run(run())
+
+    assert status == 400
+    assert 'must be a finite number' in response['error']
+
+
+def test_a_request_that_fails_in_a_batch_only_fails_itself():
+    responses = calculate_batch([create_request(0.1), create_request('abc'), create_request(0.3)])
+
+    assert 'error' in responses[1]
+    assert [step_from_json(step) for step in responses[0]['steps']] == expected_steps(0.1)
+    assert [step_from_json(step) for step in responses[2]['steps']] == expected_steps(0.3)
+
+
+def test_requests_waiting_when_the_service_stops_are_rejected():
+    async def run():
+        sut = ValuationService(batch_window=10)
+        await sut.start()
+        requests = [asyncio.create_task(sut.value(create_request(0.1))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        await sut.stop()
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert [str(result) for result in results] == ['The valuation service was stopped'] * 2